@@ -4,3 +4,12 @@ sys.dont_write_bytecode = True
 
 from . py_dds import PyDDS
 from . pixel_swizzle import PixelSwizzle
+from . block_encoder import BlockEncoder
+from . texture_cache import TextureCache
+from . disk_cache import DiskCache
+from . import tonemap
+from . import parallel
+from . import uncompressed
+from . import channels
+from . import batch
+from . import texture_cache
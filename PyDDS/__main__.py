@@ -0,0 +1,7 @@
+"""Batch conversion from the command line: python -m PyDDS (see batch.py)."""
+import sys
+sys.dont_write_bytecode = True
+
+from PyDDS import batch
+
+sys.exit(batch.main())
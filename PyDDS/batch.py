@@ -0,0 +1,259 @@
+#!/usr/bin/python
+"""batch.py
+    - Convert whole directory trees of .dds files (to .png, and/or dump
+      their headers to .txt), on a pool of processes.
+    - Run as: python -m PyDDS [options] path [path ...]
+"""
+
+import sys
+import os
+import time
+import logging
+import argparse
+import traceback
+import multiprocessing
+from . import py_dds
+from . import tonemap
+
+# Extensions of the files written for each kind of output
+PNG_EXTENSION = '.png'
+HEADERS_EXTENSION = '.txt'
+
+
+def find_files(paths, extension='.dds'):
+    """Find the files to convert.
+
+    Args:
+        paths (list of strings): Files and/or directories. Directories are searched recursively.
+        extension (string): Extension (case-insensitive) of the files to look for in directories.
+
+    Returns:
+        files (list of tuples): (file name, name relative to the path it was found under), in a stable order.
+    """
+
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, fnames in os.walk(path):
+                dirnames.sort()
+                for fname in sorted(fnames):
+                    if fname.lower().endswith(extension):
+                        full_name = os.path.join(dirpath, fname)
+                        files.append((full_name, os.path.relpath(full_name, path)))
+        else:
+            files.append((path, os.path.basename(path)))
+
+    return files
+
+
+def get_output_name(fname, relative_name, output_dir, extension):
+    """Name of an output file: next to its input, or at the same relative location under output_dir."""
+
+    if output_dir is None:
+        return os.path.splitext(fname)[0] + extension
+    return os.path.join(output_dir, os.path.splitext(relative_name)[0] + extension)
+
+
+def is_up_to_date(fname, output_fname):
+    """Check whether an output file exists, and is newer than its input."""
+    return os.path.isfile(output_fname) and os.path.getmtime(output_fname) >= os.path.getmtime(fname)
+
+
+def find_conflicts(jobs):
+    """Find the jobs that would write an output an earlier job writes too (e.g. a/x.dds and b/x.dds,
+    both given as files, converted to the same output directory).
+
+    Args:
+        jobs (list of tuples): Files to convert (see convert_file()).
+
+    Returns:
+        jobs (list of tuples): The jobs that don't conflict with an earlier one.
+        conflicts (list of tuples): Failed result (see convert_file()) of each of the others.
+    """
+
+    owners = {}
+    kept_jobs = []
+    conflicts = []
+    for job in jobs:
+        outputs = [os.path.normcase(os.path.abspath(output_fname)) for output_fname in job[1:3]
+                   if output_fname is not None]
+        clashes = [output_fname for output_fname in outputs if output_fname in owners]
+        if clashes:
+            conflicts.append((job[0], 0, 'Output %s is already written for %s.\n' %
+                              (clashes[0], owners[clashes[0]])))
+            continue
+
+        for output_fname in outputs:
+            owners[output_fname] = job[0]
+        kept_jobs.append(job)
+
+    return kept_jobs, conflicts
+
+
+def convert_file(job):
+    """Convert a single file. Any error is caught and reported, rather than raised,
+    so that one bad file doesn't stop the others.
+
+    Args:
+        job (tuple): (input file name, .png file name or None, headers file name or None,
+            tonemap operator, exposure, bit depth, whether to normalize) (see PyDDS.write_to_png()).
+
+    Returns:
+        result (tuple): (input file name, size of the input in bytes, error message or None).
+    """
+
+    fname, png_fname, headers_fname, tonemap_operator, exposure, bit_depth, normalize = job
+
+    try:
+        size = os.path.getsize(fname)
+        with py_dds.PyDDS(fname, lazy=True) as dds:
+            for output_fname in (png_fname, headers_fname):
+                if output_fname is not None and os.path.dirname(output_fname):
+                    try:
+                        os.makedirs(os.path.dirname(output_fname))
+                    except OSError:
+                        # Already exists (possibly created by another worker)
+                        if not os.path.isdir(os.path.dirname(output_fname)):
+                            raise
+
+            if headers_fname is not None:
+                stdout = sys.stdout
+                with open(headers_fname, 'w') as fhandle:
+                    sys.stdout = fhandle
+                    try:
+                        dds.print_fields()
+                    finally:
+                        sys.stdout = stdout
+
+            if png_fname is not None:
+                dds.write_to_png(png_fname, tonemap_operator, exposure, bit_depth, normalize)
+    except Exception:  # pylint: disable=broad-except
+        return fname, 0, traceback.format_exc()
+
+    return fname, size, None
+
+
+def convert_files(jobs, workers=None, report=None):
+    """Convert some files, on a pool of processes.
+
+    Args:
+        jobs (list of tuples): Files to convert (see convert_file()).
+        workers (int): Number of processes. Defaults to the number of CPUs. If 1,
+            files are converted in this process.
+        report (function): If set, called with the result of each file (see convert_file()),
+            and the number of files done so far, as each one finishes.
+
+    Returns:
+        results (list of tuples): Result of each file, in the order they finished.
+    """
+
+    workers = workers or multiprocessing.cpu_count()
+    results = []
+
+    if workers == 1 or len(jobs) <= 1:
+        pool = None
+        result_iter = (convert_file(job) for job in jobs)
+    else:
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        result_iter = pool.imap_unordered(convert_file, jobs)
+
+    try:
+        for result in result_iter:
+            results.append(result)
+            if report is not None:
+                report(result, len(results))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return results
+
+
+def parse_args(argv=None):
+    """Parse the command line."""
+
+    parser = argparse.ArgumentParser(prog='python -m PyDDS',
+                                     description='Convert .dds files (and directories of them) to .png, '
+                                                 'and/or dump their headers.')
+    parser.add_argument('paths', nargs='+', help='.dds files, or directories to search (recursively) for them.')
+    parser.add_argument('-o', '--output-dir', help='Write outputs here, mirroring the layout of the inputs, '
+                                                   'rather than next to each input.')
+    parser.add_argument('--headers', action='store_true', help='Dump the headers of each file to a %s file.'
+                        % HEADERS_EXTENSION)
+    parser.add_argument('--no-png', dest='png', action='store_false', help="Don't convert to .png.")
+    parser.add_argument('-j', '--workers', type=int, default=0,
+                        help='Number of processes to convert with (default: one per CPU).')
+    parser.add_argument('-u', '--skip-up-to-date', action='store_true',
+                        help='Skip outputs that are newer than their inputs.')
+    parser.add_argument('--tonemap', default='reinhard', choices=sorted(tonemap.OPERATORS),
+                        help='Operator used to tone-map HDR data (default: reinhard).')
+    parser.add_argument('--exposure', type=float, default=0.0, help='Exposure adjustment (in stops) of HDR data.')
+    parser.add_argument('--bit-depth', type=int, default=8, choices=(8, 16),
+                        help='Bits per component of the .png files (default: 8).')
+    parser.add_argument('--normalize', action='store_true',
+                        help='Map the range of values of each texture to the whole range of its .png, '
+                             'rather than tone-mapping it (e.g. for data textures).')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only report errors and the summary.')
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run the batch conversion from the command line.
+
+    Args:
+        argv (list of strings): Arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        status (int): 0 if every file was converted, 1 otherwise.
+    """
+
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    jobs = []
+    for fname, relative_name in find_files(args.paths):
+        png_fname = get_output_name(fname, relative_name, args.output_dir, PNG_EXTENSION) if args.png else None
+        headers_fname = get_output_name(fname, relative_name, args.output_dir, HEADERS_EXTENSION) \
+            if args.headers else None
+        jobs.append((fname, png_fname, headers_fname, args.tonemap, args.exposure, args.bit_depth, args.normalize))
+
+    # Files sharing an output would overwrite each other's (concurrently): only the first one is converted
+    candidates, conflicts = find_conflicts(jobs)
+    for fname, _, error in conflicts:
+        print >> sys.stderr, 'FAILED %s\n%s' % (fname, error)
+
+    jobs = []
+    skipped = 0
+    for job in candidates:
+        fname, png_fname, headers_fname = job[0:3]
+        if args.skip_up_to_date:
+            if png_fname is not None and is_up_to_date(fname, png_fname):
+                png_fname = None
+            if headers_fname is not None and is_up_to_date(fname, headers_fname):
+                headers_fname = None
+            if png_fname is None and headers_fname is None:
+                skipped += 1
+                continue
+
+        jobs.append((fname, png_fname, headers_fname) + job[3:])
+
+    def report(result, done):
+        """Report the progress after each file."""
+        fname, size, error = result
+        if error is not None:
+            print >> sys.stderr, '[%d/%d] FAILED %s\n%s' % (done, len(jobs), fname, error)
+        elif not args.quiet:
+            print '[%d/%d] %s (%.1f KB)' % (done, len(jobs), fname, size / 1024.0)
+
+    start_time = time.time()
+    results = conflicts + convert_files(jobs, args.workers, report)
+    elapsed = max(time.time() - start_time, 1e-6)
+
+    failed = len([result for result in results if result[2] is not None])
+    total_size = sum(result[1] for result in results)
+    print 'Converted %d files (%d failed, %d skipped) in %.2fs: %.1f files/s, %.2f MB/s' % \
+        (len(results) - failed, failed, skipped, elapsed, len(results) / elapsed, total_size / elapsed / 2**20)
+
+    return 1 if failed else 0
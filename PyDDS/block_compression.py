@@ -5,7 +5,89 @@
 """
 
 from __future__ import division
+import functools
 import logging
+from . import bptc
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional. Without it, the (much slower) pure-Python decoders are used.
+    np = None
+
+# Version of the decoders' output. Bump it whenever that output changes, so that
+# any decoded data cached along with it (see disk_cache.py) is decoded again.
+DECODER_VERSION = 1
+
+
+# Ways of expanding 5 and 6-bit color components to 8 bits:
+# - truncate: shift left, filling the low bits with 0s (and truncate interpolated colors).
+# - replicate: fill the low bits with the high bits, as the D3D reference decoder does
+#   (and round interpolated colors to nearest).
+COLOR_EXPANSIONS = ('truncate', 'replicate')
+
+# Color tables of each expansion (see get_color_tables()), built on first use
+color_tables = {}
+
+
+def require_numpy(what):
+    """Raise an ImportError if numpy isn't available, as 'what' can't be done without it."""
+    if np is None:
+        raise ImportError, 'numpy is required to %s.' % what
+
+
+def expand_component(value, bit_width, expansion='truncate'):
+    """Expand a bit_width-bit color component to 8 bits (see COLOR_EXPANSIONS)."""
+
+    if expansion == 'replicate':
+        return (value << (8 - bit_width)) | (value >> (2 * bit_width - 8))
+    return value << (8 - bit_width)
+
+
+def get_color_tables(expansion='truncate'):
+    """Get the tables decoding BC1 colors, building them the first time.
+
+    Args:
+        expansion (string): How to expand color components (see COLOR_EXPANSIONS).
+
+    Returns:
+        tables (tuple): (rgb565, third, half):
+            - rgb565: uint8 array of shape (65536, 3), the RGB888 value of every 5_6_5 word.
+            - third: uint8 array of shape (256, 256). third[a, b] is 2/3 * a + 1/3 * b.
+            - half: uint8 array of shape (256, 256). half[a, b] is 1/2 * a + 1/2 * b.
+
+    Raises:
+        ValueError: If the expansion isn't one of COLOR_EXPANSIONS.
+    """
+
+    tables = color_tables.get(expansion)
+    if tables is not None:
+        return tables
+
+    if expansion not in COLOR_EXPANSIONS:
+        raise ValueError, "Unknown color expansion '%s' (expected one of: %s)" % \
+            (expansion, ', '.join(COLOR_EXPANSIONS))
+
+    require_numpy('build color tables')
+    words = np.arange(65536, dtype=np.uint16)
+    rgb565 = np.empty((65536, 3), dtype=np.uint8)
+    rgb565[:, 0] = expand_component((words >> 11) & 0x1f, 5, expansion)
+    rgb565[:, 1] = expand_component((words >> 5) & 0x3f, 6, expansion)
+    rgb565[:, 2] = expand_component(words & 0x1f, 5, expansion)
+
+    first = np.arange(256, dtype=np.float64)[:, np.newaxis]
+    second = np.arange(256, dtype=np.float64)[np.newaxis, :]
+    if expansion == 'replicate':
+        third = np.floor((2 * first + second) / 3 + 0.5)
+        half = np.floor((first + second) / 2 + 0.5)
+    else:
+        # Exactly the (double precision, truncated) arithmetic of get_bc1_colors_from_block()
+        third = np.trunc((2/3)*first + (1/3)*second)
+        half = np.trunc((1/2)*first + (1/2)*second)
+
+    tables = (rgb565, third.astype(np.uint8), half.astype(np.uint8))
+    color_tables[expansion] = tables
+    return tables
 
 
 class BlockCompression(object):
@@ -19,6 +101,45 @@ class BlockCompression(object):
         self.blue = 2
         self.components = [self.alpha, self.red, self.green, self.blue]
 
+        # If set, BC5 data is treated as a tangent-space normal map, and the blue
+        # channel is derived from the red (X) and green (Y) channels.
+        self.reconstruct_z = False
+
+        # How the 5_6_5 colors of BC1, BC2 and BC3 blocks are expanded to 8 bits (see COLOR_EXPANSIONS)
+        self.color_expansion = 'truncate'
+
+        # If set, the palette of BC1, BC2 and BC3 blocks is only derived once for each distinct
+        # pair of endpoints, and shared by every block using it. This pays off on textures with
+        # many repeated blocks (e.g. flat areas), but costs a sort on noisy ones.
+        self.share_palettes = False
+
+        # Map each supported surface format to the method that decompresses it.
+        # BC2 and BC3 are laid out the same as DXT2 and DXT4 (respectively);
+        # the only difference is the latter have premultiplied alpha.
+        self.decompressors = {'DXGI_FORMAT_BC1_TYPELESS' : self.decompress_bc1,
+                              'DXGI_FORMAT_BC1_UNORM' : self.decompress_bc1,
+                              'DXGI_FORMAT_BC1_UNORM_SRGB' : self.decompress_bc1,
+                              'DXGI_FORMAT_BC2_TYPELESS' : self.decompress_bc2,
+                              'DXGI_FORMAT_BC2_UNORM' : self.decompress_bc2,
+                              'DXGI_FORMAT_BC2_UNORM_SRGB' : self.decompress_bc2,
+                              'D3DFMT_DXT2' : self.decompress_bc2,
+                              'DXGI_FORMAT_BC3_TYPELESS' : self.decompress_bc3,
+                              'DXGI_FORMAT_BC3_UNORM' : self.decompress_bc3,
+                              'DXGI_FORMAT_BC3_UNORM_SRGB' : self.decompress_bc3,
+                              'D3DFMT_DXT4' : self.decompress_bc3,
+                              'DXGI_FORMAT_BC4_TYPELESS' : self.decompress_bc4,
+                              'DXGI_FORMAT_BC4_UNORM' : self.decompress_bc4,
+                              'DXGI_FORMAT_BC4_SNORM' : functools.partial(self.decompress_bc4, signed=True),
+                              'DXGI_FORMAT_BC5_TYPELESS' : self.decompress_bc5,
+                              'DXGI_FORMAT_BC5_UNORM' : self.decompress_bc5,
+                              'DXGI_FORMAT_BC5_SNORM' : functools.partial(self.decompress_bc5, signed=True),
+                              'DXGI_FORMAT_BC6H_TYPELESS' : self.decompress_bc6h,
+                              'DXGI_FORMAT_BC6H_UF16' : self.decompress_bc6h,
+                              'DXGI_FORMAT_BC6H_SF16' : functools.partial(self.decompress_bc6h, signed=True),
+                              'DXGI_FORMAT_BC7_TYPELESS' : self.decompress_bc7,
+                              'DXGI_FORMAT_BC7_UNORM' : self.decompress_bc7,
+                              'DXGI_FORMAT_BC7_UNORM_SRGB' : self.decompress_bc7}
+
     @staticmethod
     def normalize(value, start_bit_width, end_bit_width):
         """Take some value that's represented by some bit-width
@@ -54,9 +175,9 @@ class BlockCompression(object):
             for component in bit_width.iterkeys():
                 # Extract the components
                 try:
-                    color[component] = self.normalize(
+                    color[component] = expand_component(
                         int(raw_color[component_start[component] : component_end[component]], 2),
-                        bit_width[component], 8)
+                        bit_width[component], self.color_expansion)
                 except KeyError:
                     self.logger.warning("raw_color:")
                     self.logger.warning(raw_color)
@@ -71,24 +192,32 @@ class BlockCompression(object):
         # 1. color_2 and color_3 are linear interpolations between color_0 and color_1
         # 2. color_2 is a linear interpolation between color_0 and color_1, and color_3 is 0
         # Derive the other colors values
+        if self.color_expansion == 'replicate':
+            # Round to nearest
+            third = lambda first, second: (2 * first + second + 1) // 3
+            half = lambda first, second: (first + second + 1) // 2
+        else:
+            third = lambda first, second: int((2/3)*first + (1/3)*second)
+            half = lambda first, second: int((1/2)*first + (1/2)*second)
+
         color = [None] * 4
         if color_val[0] <= color_val[1]:
             color[self.alpha] = 255
             for component in bit_width.iterkeys():
-                color[component] = int((1/2)*colors[0][component] + (1/2)*colors[1][component])
+                color[component] = half(colors[0][component], colors[1][component])
             colors.append(color)
             colors.append([0, 0, 0, 0])
         else:
             color = [None] * 4
             color[self.alpha] = 255
             for component in bit_width.iterkeys():
-                color[component] = int((2/3)*colors[0][component] + (1/3)*colors[1][component])
+                color[component] = third(colors[0][component], colors[1][component])
             colors.append(color)
 
             color = [None] * 4
             color[self.alpha] = 255
             for component in bit_width.iterkeys():
-                color[component] = int((1/3)*colors[0][component] + (2/3)*colors[1][component])
+                color[component] = third(colors[1][component], colors[0][component])
             colors.append(color)
 
         for color in colors:
@@ -96,8 +225,11 @@ class BlockCompression(object):
 
         return colors
 
-    def decompress_bc1(self, comp_data):
-        """Decompress BC1 data.
+    def decompress_bc1_python(self, comp_data):
+        """Decompress BC1 data one block at a time, without numpy.
+
+        This is the reference implementation used when numpy is unavailable.
+        See decompress_bc1() for details.
 
         Args:
             comp_data (list of bytes): Data to be compressed.
@@ -175,10 +307,463 @@ class BlockCompression(object):
             # is a pixel with 3 components
             # Re-organize this into a simple list of bytes
             # Each component is 1 byte, so just unroll all components of all pixels
-            formatted_decomp_block = []
             for pixel in decomp_block:
-                formatted_decomp_block = formatted_decomp_block + pixel
-
-            decomp_data = decomp_data + formatted_decomp_block
+                decomp_data.extend(pixel)
 
         return decomp_data
+
+    @staticmethod
+    def to_block_array(comp_data, block_size):
+        """View some compressed data as a 2D array of blocks.
+
+        Args:
+            comp_data (list of ints, str, bytearray, memoryview or numpy array):
+                Compressed data. Anything exposing the buffer interface is
+                viewed without a copy.
+            block_size (int): Size of each compressed block, in bytes.
+
+        Returns:
+            blocks (numpy array): uint8 array of shape (number of blocks, block_size).
+                Any trailing bytes that don't make up a whole block are dropped.
+        """
+
+        if isinstance(comp_data, np.ndarray):
+            data = comp_data.astype(np.uint8, copy=False).reshape(-1)
+        elif isinstance(comp_data, (list, tuple)):
+            data = np.array(comp_data, dtype=np.uint8)
+        else:
+            data = np.frombuffer(comp_data, dtype=np.uint8)
+
+        num_blocks = data.size // block_size
+        return data[:num_blocks * block_size].reshape(num_blocks, block_size)
+
+    def get_bc1_colors_from_blocks(self, blocks, four_color_only=False):
+        """Derive the reference colors of every block of compressed BC1 data at once.
+
+        This is the array equivalent of get_bc1_colors_from_block(), and generates
+        bit-identical results.
+
+        Args:
+            blocks (numpy array): uint8 array of shape (number of blocks, 8).
+            four_color_only (bool): If set, always interpolate color_2 and color_3,
+                regardless of how color_0 and color_1 relate to each other.
+                This is how the color blocks of BC2 and BC3 are decoded.
+
+        Returns:
+            colors (numpy array): uint8 array of shape (number of blocks, 4, 4).
+                For every block, the 4 reference colors, each with RGBA components.
+        """
+
+        # Each color is a little-endian 5_6_5 word
+        color_val = blocks[:, 0:4].astype(np.uint16)
+        color_val = color_val[:, 0::2] | (color_val[:, 1::2] << 8)
+
+        if not self.share_palettes:
+            return self.get_bc1_colors_from_endpoints(color_val, four_color_only)
+
+        # Derive the palette of every distinct pair of endpoints once
+        endpoint_pairs = color_val[:, 0].astype(np.uint32) | (color_val[:, 1].astype(np.uint32) << 16)
+        unique_pairs, pair_indices = np.unique(endpoint_pairs, return_inverse=True)
+        unique_color_val = np.empty((len(unique_pairs), 2), dtype=np.uint16)
+        unique_color_val[:, 0] = unique_pairs & 0xffff
+        unique_color_val[:, 1] = unique_pairs >> 16
+
+        palettes = self.get_bc1_colors_from_endpoints(unique_color_val, four_color_only)
+        return palettes.view(np.uint32).reshape(-1, 4)[pair_indices].view(np.uint8).reshape(-1, 4, 4)
+
+    def get_bc1_colors_from_endpoints(self, color_val, four_color_only=False):
+        """Derive the reference colors of BC1 blocks from their endpoints (see get_bc1_colors_from_blocks()).
+
+        Args:
+            color_val (numpy array): uint16 array of shape (number of blocks, 2): the
+                5_6_5 words of color_0 and color_1 of every block.
+            four_color_only (bool): See get_bc1_colors_from_blocks().
+
+        Returns: See get_bc1_colors_from_blocks().
+        """
+
+        colors = np.empty((color_val.shape[0], 4, 4), dtype=np.uint8)
+        colors[:, :, self.alpha] = 255
+
+        # Expand each endpoint to RGB888, and interpolate the other colors, all by table
+        # look-ups (see get_color_tables()). The tables hold exactly what
+        # get_bc1_colors_from_block() computes, so both implementations agree bit-for-bit.
+        rgb565, third, half = get_color_tables(self.color_expansion)
+        endpoints = rgb565[color_val]
+        colors[:, 0:2, 0:3] = endpoints
+
+        # Index the flattened 256x256 tables with (first << 8) | second
+        color_0 = endpoints[:, 0].astype(np.intp) << 8
+        color_1 = endpoints[:, 1].astype(np.intp)
+        third = third.reshape(-1)
+        if four_color_only:
+            colors[:, 2, 0:3] = third[color_0 | color_1]
+            colors[:, 3, 0:3] = third[(color_1 << 8) | (color_0 >> 8)]
+            return colors
+
+        four_color_mode = (color_val[:, 0] > color_val[:, 1])[:, np.newaxis]
+        colors[:, 2, 0:3] = np.where(four_color_mode, third[color_0 | color_1], half.reshape(-1)[color_0 | color_1])
+        colors[:, 3, 0:3] = np.where(four_color_mode, third[(color_1 << 8) | (color_0 >> 8)], 0)
+
+        # In 3-color mode, color_3 is transparent black
+        colors[:, 3, self.alpha] = np.where(four_color_mode[:, 0], 255, 0)
+
+        return colors
+
+    @staticmethod
+    def get_bc1_indices_from_blocks(blocks):
+        """Extract the 2-bit color indices of every block of compressed BC1 data.
+
+        Args:
+            blocks (numpy array): uint8 array of shape (number of blocks, 8).
+
+        Returns:
+            indices (numpy array): uint8 array of shape (number of blocks, 16).
+                Indices are ordered by pixel, row by row.
+        """
+
+        # Each byte holds a row of 4 indices, with the first pixel in the lowest bits.
+        shifts = np.array([0, 2, 4, 6], dtype=np.uint8)
+        indices = (blocks[:, 4:8, np.newaxis] >> shifts) & 0x3
+        return indices.reshape(blocks.shape[0], 16)
+
+    def decompress_bc1_blocks(self, blocks, four_color_only=False):
+        """Decompress every block of some BC1 data at once.
+
+        Args:
+            blocks (numpy array): uint8 array of shape (number of blocks, 8).
+            four_color_only (bool): See get_bc1_colors_from_blocks().
+
+        Returns:
+            decomp_blocks (numpy array): uint8 array of shape (number of blocks, 16, 4).
+                For every block, each pixel (row by row) with its RGBA components.
+        """
+
+        colors = self.get_bc1_colors_from_blocks(blocks, four_color_only)
+        indices = self.get_bc1_indices_from_blocks(blocks)
+
+        # Offset every index so it points into the flattened palette of its own block.
+        # Each RGBA color is gathered as a single 32-bit word.
+        indices = indices + (np.arange(blocks.shape[0], dtype=np.intp) * 4)[:, np.newaxis]
+        return colors.view(np.uint32).reshape(-1)[indices].view(np.uint8).reshape(blocks.shape[0], 16, 4)
+
+    def decompress_bc1(self, comp_data):
+        """Decompress BC1 data.
+
+        All blocks are decoded at once using numpy. If numpy isn't available,
+        fall back to decompress_bc1_python(), which generates identical results.
+
+        Args:
+            comp_data (list of bytes): Data to be decompressed.
+                See to_block_array() for the accepted types.
+
+        Returns:
+            decomp_data (numpy array or list of bytes): Decompressed data.
+                A contiguous uint8 array of RGBA pixels, organized block by block
+                (16 pixels per block), or a list if numpy isn't available.
+
+        Raises:
+            None.
+        """
+
+        if np is None:
+            return self.decompress_bc1_python(comp_data)
+
+        blocks = self.to_block_array(comp_data, 8)
+        return self.decompress_bc1_blocks(blocks).reshape(-1)
+
+    @staticmethod
+    def get_bc2_alpha_from_blocks(blocks):
+        """Extract the explicit alpha values of every block of compressed BC2 data.
+
+        Args:
+            blocks (numpy array): uint8 array of shape (number of blocks, 8).
+                The alpha half of each BC2 block.
+
+        Returns:
+            alpha (numpy array): uint8 array of shape (number of blocks, 16).
+        """
+
+        # Each byte holds the 4-bit alpha of two pixels, with the first pixel in the
+        # lowest bits. Expand each value by replicating its bits, so that fully
+        # opaque (0xf) maps to 0xff, just like the alpha of BC1.
+        alpha = np.empty((blocks.shape[0], 16), dtype=np.uint8)
+        alpha[:, 0::2] = blocks & 0xf
+        alpha[:, 1::2] = blocks >> 4
+        return alpha * 17
+
+    @staticmethod
+    def get_bc3_alpha_from_blocks(blocks, signed=False):
+        """Derive the interpolated alpha values of every block of compressed BC3 data.
+
+        This is also how each channel of BC4 and BC5 data is decoded.
+
+        Args:
+            blocks (numpy array): uint8 array of shape (number of blocks, 8).
+                The alpha half of each BC3 block.
+            signed (bool): If set, the block holds SNORM values (BC4_SNORM, BC5_SNORM).
+
+        Returns:
+            alpha (numpy array): uint8 array of shape (number of blocks, 16),
+                or an int8 array with values in [-127, 127] if signed is set.
+        """
+
+        # Each block contains, in order:
+        # 1. alpha_0 (1 byte)
+        # 2. alpha_1 (1 byte)
+        # 3. 16 3-bit indices (6 bytes), each representing an index
+        #    to alpha_[0-7]. The whole thing is one little-endian 48-bit word.
+        #
+        # Like BC1, how alpha_0 and alpha_1 relate to each other determines the mode:
+        # 1. alpha_0 > alpha_1: alpha_[2-7] are linear interpolations between
+        #    alpha_0 and alpha_1.
+        # 2. Otherwise, alpha_[2-5] are interpolations, and alpha_6 and alpha_7
+        #    are the minimum and maximum values (0 and 255, or -127 and 127 if signed).
+        if signed:
+            endpoints = blocks[:, 0:2].view(np.int8).astype(np.int32)
+            # Both -128 and -127 represent -1.0
+            limits = (-127, 127)
+            dtype = np.int8
+        else:
+            endpoints = blocks[:, 0:2].astype(np.int32)
+            limits = (0, 255)
+            dtype = np.uint8
+
+        alpha_0 = endpoints[:, 0:1]
+        alpha_1 = endpoints[:, 1:2]
+        clamped = np.maximum(endpoints, limits[0])
+
+        weights = np.arange(1, 7, dtype=np.int32)
+        eight_alpha = (7 - weights) * clamped[:, 0:1] + weights * clamped[:, 1:2]
+        six_alpha = np.zeros_like(eight_alpha)
+        six_alpha[:, 0:4] = (5 - weights[0:4]) * clamped[:, 0:1] + weights[0:4] * clamped[:, 1:2]
+
+        # Truncate the interpolated values (towards zero, if signed)
+        eight_alpha = np.sign(eight_alpha) * (np.abs(eight_alpha) // 7)
+        six_alpha = np.sign(six_alpha) * (np.abs(six_alpha) // 5)
+        six_alpha[:, 4:6] = limits
+
+        alphas = np.empty((blocks.shape[0], 8), dtype=dtype)
+        alphas[:, 0:2] = clamped
+        alphas[:, 2:] = np.where(alpha_0 > alpha_1, eight_alpha, six_alpha)
+
+        bits = np.zeros(blocks.shape[0], dtype=np.uint64)
+        for byte in xrange(6):
+            bits |= blocks[:, 2 + byte].astype(np.uint64) << np.uint64(8 * byte)
+
+        shifts = np.arange(0, 48, 3, dtype=np.uint64)
+        indices = ((bits[:, np.newaxis] >> shifts) & np.uint64(0x7)).astype(np.intp)
+
+        # Offset every index so it points into the flattened palette of its own block
+        indices += (np.arange(blocks.shape[0], dtype=np.intp) * 8)[:, np.newaxis]
+        return alphas.reshape(-1)[indices]
+
+    def decompress_bc2(self, comp_data):
+        """Decompress BC2 data.
+
+        Each 16 byte block is made of 8 bytes of explicit 4-bit alpha values,
+        followed by a BC1 color block (always decoded in 4-color mode).
+
+        Args:
+            comp_data (list of bytes): Data to be decompressed.
+                See to_block_array() for the accepted types.
+
+        Returns:
+            decomp_data (numpy array): Decompressed data.
+                A contiguous uint8 array of RGBA pixels, organized block by block.
+        """
+
+        require_numpy('decompress BC2 data')
+        blocks = self.to_block_array(comp_data, 16)
+
+        decomp_blocks = self.decompress_bc1_blocks(blocks[:, 8:16], four_color_only=True)
+        decomp_blocks[:, :, self.alpha] = self.get_bc2_alpha_from_blocks(blocks[:, 0:8])
+        return decomp_blocks.reshape(-1)
+
+    def decompress_bc3(self, comp_data):
+        """Decompress BC3 data.
+
+        Each 16 byte block is made of an 8 byte interpolated alpha block,
+        followed by a BC1 color block (always decoded in 4-color mode).
+
+        Args:
+            comp_data (list of bytes): Data to be decompressed.
+                See to_block_array() for the accepted types.
+
+        Returns:
+            decomp_data (numpy array): Decompressed data.
+                A contiguous uint8 array of RGBA pixels, organized block by block.
+        """
+
+        require_numpy('decompress BC3 data')
+        blocks = self.to_block_array(comp_data, 16)
+
+        decomp_blocks = self.decompress_bc1_blocks(blocks[:, 8:16], four_color_only=True)
+        decomp_blocks[:, :, self.alpha] = self.get_bc3_alpha_from_blocks(blocks[:, 0:8])
+        return decomp_blocks.reshape(-1)
+
+    @staticmethod
+    def snorm_to_unorm(values):
+        """Remap SNORM values in [-127, 127] to UNORM values in [0, 255], for display."""
+        return ((values.astype(np.int32) + 127) * 255 + 127) // 254
+
+    @staticmethod
+    def reconstruct_normal_z(x_values, y_values):
+        """Derive the Z component of unit-length normals from their X and Y components.
+
+        Args:
+            x_values, y_values (numpy array): X and Y components, in [-1.0, 1.0].
+
+        Returns:
+            z_values (numpy array): Z components, in [0.0, 1.0].
+        """
+        return np.sqrt(np.clip(1.0 - x_values * x_values - y_values * y_values, 0.0, 1.0))
+
+    def decompress_bc4_blocks(self, blocks, signed=False):
+        """Decompress every block of some BC4 data at once.
+
+        Args:
+            blocks (numpy array): uint8 array of shape (number of blocks, 8).
+            signed (bool): If set, the data is BC4_SNORM.
+
+        Returns:
+            decomp_blocks (numpy array): Array of shape (number of blocks, 16),
+                holding the (only) red channel of every pixel.
+                uint8 if unsigned, int8 in [-127, 127] if signed.
+        """
+        return self.get_bc3_alpha_from_blocks(blocks, signed)
+
+    def decompress_bc5_blocks(self, blocks, signed=False):
+        """Decompress every block of some BC5 data at once.
+
+        Args:
+            blocks (numpy array): uint8 array of shape (number of blocks, 16).
+            signed (bool): If set, the data is BC5_SNORM.
+
+        Returns:
+            decomp_blocks (numpy array): Array of shape (number of blocks, 16, 2),
+                holding the red and green channels of every pixel.
+                uint8 if unsigned, int8 in [-127, 127] if signed.
+        """
+
+        # A BC5 block is just two BC4 blocks: red, then green.
+        channels = [self.get_bc3_alpha_from_blocks(blocks[:, 0:8], signed),
+                    self.get_bc3_alpha_from_blocks(blocks[:, 8:16], signed)]
+        return np.stack(channels, axis=-1)
+
+    def decompress_bc4(self, comp_data, signed=False):
+        """Decompress BC4 data.
+
+        Each 8 byte block holds a single (red) channel, encoded the same way
+        as the alpha of BC3. For display, it is replicated into a greyscale
+        image, with SNORM values remapped to [0, 255].
+
+        Args:
+            comp_data (list of bytes): Data to be decompressed.
+                See to_block_array() for the accepted types.
+            signed (bool): If set, the data is BC4_SNORM.
+
+        Returns:
+            decomp_data (numpy array): Decompressed data.
+                A contiguous uint8 array of RGBA pixels, organized block by block.
+        """
+
+        require_numpy('decompress BC4 data')
+        channel = self.decompress_bc4_blocks(self.to_block_array(comp_data, 8), signed)
+
+        if signed:
+            channel = self.snorm_to_unorm(channel)
+
+        decomp_blocks = np.empty(channel.shape + (4,), dtype=np.uint8)
+        decomp_blocks[:, :, 0:3] = channel[:, :, np.newaxis]
+        decomp_blocks[:, :, self.alpha] = 255
+        return decomp_blocks.reshape(-1)
+
+    def decompress_bc5(self, comp_data, signed=False, reconstruct_z=None):
+        """Decompress BC5 data.
+
+        Each 16 byte block holds a red and a green channel, each encoded the
+        same way as the alpha of BC3. SNORM values are remapped to [0, 255].
+
+        Args:
+            comp_data (list of bytes): Data to be decompressed.
+                See to_block_array() for the accepted types.
+            signed (bool): If set, the data is BC5_SNORM.
+            reconstruct_z (bool): If set, treat the data as a normal map and
+                derive the blue channel as Z = sqrt(1 - X^2 - Y^2). Otherwise,
+                blue is 0. Defaults to the reconstruct_z attribute.
+
+        Returns:
+            decomp_data (numpy array): Decompressed data.
+                A contiguous uint8 array of RGBA pixels, organized block by block.
+        """
+
+        require_numpy('decompress BC5 data')
+        channels = self.decompress_bc5_blocks(self.to_block_array(comp_data, 16), signed)
+
+        if reconstruct_z is None:
+            reconstruct_z = self.reconstruct_z
+
+        decomp_blocks = np.zeros(channels.shape[0:2] + (4,), dtype=np.uint8)
+        decomp_blocks[:, :, self.alpha] = 255
+
+        if signed:
+            decomp_blocks[:, :, self.red:self.green + 1] = self.snorm_to_unorm(channels)
+        else:
+            decomp_blocks[:, :, self.red:self.green + 1] = channels
+
+        if reconstruct_z:
+            if signed:
+                normals = channels / 127.0
+            else:
+                normals = channels / 127.5 - 1.0
+
+            z_values = self.reconstruct_normal_z(normals[:, :, 0], normals[:, :, 1])
+            decomp_blocks[:, :, self.blue] = np.around((z_values + 1.0) * 127.5)
+
+        return decomp_blocks.reshape(-1)
+
+    def decompress_bc6h(self, comp_data, signed=False):
+        """Decompress BC6H data.
+
+        Each 16 byte block uses one of 14 modes, which determines how its
+        (scattered) endpoint bits are laid out. Blocks are grouped by mode,
+        and each group is decoded as a batch. See bptc.py for the details.
+
+        Args:
+            comp_data (list of bytes): Data to be decompressed.
+                See to_block_array() for the accepted types.
+            signed (bool): If set, the data is BC6H_SF16. Otherwise, BC6H_UF16.
+
+        Returns:
+            decomp_data (numpy array): Decompressed data.
+                A contiguous float16 array of RGBA pixels, organized block by block.
+                BC6H has no alpha, so it's always 1.0.
+        """
+
+        require_numpy('decompress BC6H data')
+        blocks = self.to_block_array(comp_data, 16)
+
+        decomp_blocks = np.ones((blocks.shape[0], 16, 4), dtype=np.float16)
+        decomp_blocks[:, :, 0:3] = bptc.decompress_bc6h_blocks(blocks, signed)
+        return decomp_blocks.reshape(-1)
+
+    def decompress_bc7(self, comp_data):
+        """Decompress BC7 data.
+
+        Each 16 byte block uses one of 8 modes, which determines how its bits
+        are laid out. Blocks are grouped by mode, and each group is decoded
+        as a batch. See bptc.py for the details.
+
+        Args:
+            comp_data (list of bytes): Data to be decompressed.
+                See to_block_array() for the accepted types.
+
+        Returns:
+            decomp_data (numpy array): Decompressed data.
+                A contiguous uint8 array of RGBA pixels, organized block by block.
+        """
+
+        require_numpy('decompress BC7 data')
+        blocks = self.to_block_array(comp_data, 16)
+        return bptc.decompress_bc7_blocks(blocks).reshape(-1)
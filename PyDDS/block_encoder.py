@@ -0,0 +1,443 @@
+#!/usr/bin/python
+"""block_encoder.py
+     - Define a class responsible for compressing
+       RGBA pixel data into block-compressed (BC) texture data.
+"""
+
+from __future__ import division
+import itertools
+import logging
+from .block_compression import require_numpy
+from . import block_compression
+from . import pixel_swizzle
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class BlockEncoder(object):
+    """Responsible for compressing pixel data into BC1 and BC3 blocks.
+
+    Every block is encoded at once (in chunks, for the cluster fit), so there is
+    no per-block Python overhead. Three quality levels are available:
+
+        'fast': Range fit along the bounding box diagonal of each block.
+        'normal': Range fit along the principal axis (PCA) of each block.
+        'high': Cluster fit. Every ordered split of the pixels (sorted along the
+            principal axis) into the 4 palette entries is tried, and the least
+            squares endpoints of the split with the lowest error are kept.
+
+    Endpoints are quantized for hardware decoders, which expand 5_6_5 colors by
+    replicating their high bits.
+    """
+
+    QUALITIES = ('fast', 'normal', 'high')
+
+    # Number of blocks the cluster fit works on at once, which bounds its memory use
+    # (each block tries 969 splits).
+    CLUSTER_FIT_CHUNK = 1024
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.alpha_threshold = 128
+        self._cluster_splits = None
+
+    @staticmethod
+    def quantize_565(colors):
+        """Quantize some 8-bit RGB colors to packed 5_6_5 words.
+
+        Args:
+            colors (numpy array): Float array of shape (..., 3), in [0, 255].
+
+        Returns:
+            color_val (numpy array): uint16 array of shape (...).
+        """
+
+        colors = np.clip(colors, 0, 255)
+        red = np.around(colors[..., 0] * (31 / 255)).astype(np.uint16)
+        green = np.around(colors[..., 1] * (63 / 255)).astype(np.uint16)
+        blue = np.around(colors[..., 2] * (31 / 255)).astype(np.uint16)
+        return (red << 11) | (green << 5) | blue
+
+    @staticmethod
+    def expand_565(color_val):
+        """Expand some packed 5_6_5 words to 8-bit RGB colors, replicating the high bits.
+
+        Args:
+            color_val (numpy array): uint16 array of shape (...).
+
+        Returns:
+            colors (numpy array): float32 array of shape (..., 3).
+        """
+
+        rgb565 = block_compression.get_color_tables('replicate')[0]
+        return rgb565[color_val].astype(np.float32)
+
+    @staticmethod
+    def get_principal_axes(pixels, weights):
+        """Find the weighted mean and principal axis of the colors of every block.
+
+        Args:
+            pixels (numpy array): float32 array of shape (number of blocks, 16, 3).
+            weights (numpy array): float32 array of shape (number of blocks, 16).
+
+        Returns:
+            mean (numpy array): float32 array of shape (number of blocks, 3).
+            axis (numpy array): float32 array of shape (number of blocks, 3), of unit length
+                (or zero, if the block is a single color).
+        """
+
+        total = np.maximum(weights.sum(axis=1), 1)[:, np.newaxis]
+        mean = np.einsum('ni,nic->nc', weights, pixels) / total
+        centered = (pixels - mean[:, np.newaxis]) * weights[..., np.newaxis]
+        covariance = np.einsum('nic,nid->ncd', centered, centered)
+
+        # Power iteration, starting from the largest column of the covariance matrix.
+        # A handful of iterations is plenty for a 3x3 matrix.
+        largest = np.argmax(np.einsum('ncc->nc', covariance), axis=1)
+        axis = covariance[np.arange(pixels.shape[0]), :, largest]
+        for _ in xrange(8):
+            axis = np.einsum('ncd,nd->nc', covariance, axis)
+            axis /= np.maximum(np.abs(axis).max(axis=1), 1e-12)[:, np.newaxis]
+
+        axis /= np.maximum(np.sqrt((axis * axis).sum(axis=1)), 1e-12)[:, np.newaxis]
+        return mean, axis
+
+    def fit_bounding_box(self, pixels, weights):
+        """Pick endpoints at the corners of the bounding box of every block.
+
+        The diagonal is flipped along green and blue to follow the sign of their
+        covariance with red.
+
+        Args:
+            pixels (numpy array): float32 array of shape (number of blocks, 16, 3).
+            weights (numpy array): float32 array of shape (number of blocks, 16).
+
+        Returns:
+            start (numpy array): float32 array of shape (number of blocks, 3).
+            end (numpy array): float32 array of shape (number of blocks, 3).
+        """
+
+        used = weights[..., np.newaxis] > 0
+        low = np.where(used, pixels, np.inf).min(axis=1)
+        high = np.where(used, pixels, -np.inf).max(axis=1)
+        low = np.where(np.isfinite(low), low, 0)
+        high = np.where(np.isfinite(high), high, 0)
+
+        mean, _ = self.get_principal_axes(pixels, weights)
+        centered = (pixels - mean[:, np.newaxis]) * weights[..., np.newaxis]
+        flip = np.einsum('ni,nic->nc', centered[..., 0], centered) < 0
+
+        start = low.copy()
+        end = high.copy()
+        start[:, 1:3] = np.where(flip[:, 1:3], high[:, 1:3], low[:, 1:3])
+        end[:, 1:3] = np.where(flip[:, 1:3], low[:, 1:3], high[:, 1:3])
+        return start, end
+
+    def fit_principal_axis(self, pixels, weights):
+        """Pick endpoints at the extremes of the colors of every block, projected on its principal axis.
+
+        Args:
+            pixels (numpy array): float32 array of shape (number of blocks, 16, 3).
+            weights (numpy array): float32 array of shape (number of blocks, 16).
+
+        Returns:
+            start (numpy array): float32 array of shape (number of blocks, 3).
+            end (numpy array): float32 array of shape (number of blocks, 3).
+        """
+
+        mean, axis = self.get_principal_axes(pixels, weights)
+        projection = np.einsum('nic,nc->ni', pixels - mean[:, np.newaxis], axis)
+        used = weights > 0
+        low = np.where(used, projection, np.inf).min(axis=1)
+        high = np.where(used, projection, -np.inf).max(axis=1)
+        low = np.where(np.isfinite(low), low, 0)[:, np.newaxis]
+        high = np.where(np.isfinite(high), high, 0)[:, np.newaxis]
+        return mean + low * axis, mean + high * axis
+
+    def get_cluster_splits(self):
+        """Enumerate every way of splitting 16 ordered pixels into 4 consecutive (possibly empty) clusters.
+
+        Returns:
+            splits (numpy array): int array of shape (969, 3). Each row holds the
+                end of the first, second and third cluster.
+        """
+
+        if self._cluster_splits is None:
+            self._cluster_splits = np.array(list(itertools.combinations_with_replacement(xrange(17), 3)))
+        return self._cluster_splits
+
+    def fit_cluster(self, pixels):
+        """Pick the least squares endpoints of the best ordered split of every block's colors.
+
+        Pixels are ordered along the principal axis of their block, and every split into
+        (color_0, color_2, color_3, color_1) clusters is scored with its quantized endpoints.
+
+        Args:
+            pixels (numpy array): float32 array of shape (number of blocks, 16, 3).
+
+        Returns:
+            start (numpy array): float32 array of shape (number of blocks, 3).
+            end (numpy array): float32 array of shape (number of blocks, 3).
+        """
+
+        splits = self.get_cluster_splits()
+        counts = np.diff(np.column_stack([np.zeros(len(splits), int), splits, np.full(len(splits), 16)]))
+        counts = counts.astype(np.float32)
+
+        # Each cluster's weight for color_0; the weight for color_1 is (1 - alpha)
+        alpha2_sum = counts.dot([1, 4/9, 1/9, 0]).astype(np.float32)
+        beta2_sum = counts.dot([0, 1/9, 4/9, 1]).astype(np.float32)
+        alphabeta_sum = counts.dot([0, 2/9, 2/9, 0]).astype(np.float32)
+        determinant = alpha2_sum * beta2_sum - alphabeta_sum * alphabeta_sum
+        solvable = determinant != 0
+        factor = np.where(solvable, 1 / np.where(solvable, determinant, 1), 0).astype(np.float32)
+
+        _, axis = self.get_principal_axes(pixels, np.ones(pixels.shape[0:2], dtype=np.float32))
+        order = np.argsort(np.einsum('nic,nc->ni', pixels, axis), axis=1)
+        ordered = pixels[np.arange(pixels.shape[0])[:, np.newaxis], order]
+        sums = np.zeros((pixels.shape[0], 17, 3), dtype=np.float32)
+        np.cumsum(ordered, axis=1, out=sums[:, 1:])
+
+        bounds = [sums[:, np.zeros(len(splits), int)], sums[:, splits[:, 0]], sums[:, splits[:, 1]],
+                  sums[:, splits[:, 2]], sums[:, np.full(len(splits), 16)]]
+        clusters = [bounds[index + 1] - bounds[index] for index in xrange(4)]
+        alphax_sum = clusters[0] + (2/3) * clusters[1] + (1/3) * clusters[2]
+        betax_sum = (1/3) * clusters[1] + (2/3) * clusters[2] + clusters[3]
+
+        start = (alphax_sum * beta2_sum[:, np.newaxis] - betax_sum * alphabeta_sum[:, np.newaxis]) * \
+            factor[:, np.newaxis]
+        end = (betax_sum * alpha2_sum[:, np.newaxis] - alphax_sum * alphabeta_sum[:, np.newaxis]) * \
+            factor[:, np.newaxis]
+        start = self.expand_565(self.quantize_565(start))
+        end = self.expand_565(self.quantize_565(end))
+
+        # Squared error of the split, less the (constant) sum of squared pixels
+        error = (alpha2_sum * (start * start).sum(axis=2) + beta2_sum * (end * end).sum(axis=2) +
+                 2 * alphabeta_sum * (start * end).sum(axis=2) -
+                 2 * ((start * alphax_sum).sum(axis=2) + (end * betax_sum).sum(axis=2)))
+        error[:, ~solvable] = np.inf
+
+        best = np.argmin(error, axis=1)
+        block_index = np.arange(pixels.shape[0])
+        return start[block_index, best], end[block_index, best]
+
+    def get_bc1_indices(self, pixels, color_val, three_color, transparent):
+        """Pick the closest palette entry for every pixel.
+
+        Args:
+            pixels (numpy array): float32 array of shape (number of blocks, 16, 3).
+            color_val (numpy array): uint16 array of shape (number of blocks, 2).
+                The (already ordered) color_0 and color_1 of every block.
+            three_color (numpy array): bool array of shape (number of blocks,).
+                Blocks encoded in 3-color mode.
+            transparent (numpy array): bool array of shape (number of blocks, 16).
+                Pixels encoded as transparent black (which needs 3-color mode).
+
+        Returns:
+            indices (numpy array): uint8 array of shape (number of blocks, 16).
+            error (numpy array): float32 array of shape (number of blocks,).
+                Squared error of the opaque pixels.
+        """
+
+        endpoints = self.expand_565(color_val)
+        color_0 = endpoints[:, 0]
+        color_1 = endpoints[:, 1]
+        mode = three_color[:, np.newaxis]
+        palette = np.stack([color_0,
+                            color_1,
+                            np.where(mode, (color_0 + color_1) / 2, (2 * color_0 + color_1) / 3),
+                            np.where(mode, np.inf, (color_0 + 2 * color_1) / 3)], axis=1)
+
+        difference = pixels[:, :, np.newaxis] - palette[:, np.newaxis]
+        distance = np.nan_to_num((difference * difference).sum(axis=3))
+        distance[np.broadcast_to(mode[..., np.newaxis], distance.shape) & (np.arange(4) == 3)] = np.inf
+        indices = np.argmin(distance, axis=2).astype(np.uint8)
+        error = np.where(transparent, 0, distance.min(axis=2)).sum(axis=1)
+
+        indices[transparent] = 3
+        return indices, error
+
+    @staticmethod
+    def pack_bc1_blocks(color_val, indices):
+        """Pack endpoints and 2-bit indices into BC1 blocks.
+
+        Args:
+            color_val (numpy array): uint16 array of shape (number of blocks, 2).
+            indices (numpy array): uint8 array of shape (number of blocks, 16).
+
+        Returns:
+            blocks (numpy array): uint8 array of shape (number of blocks, 8).
+        """
+
+        blocks = np.empty((color_val.shape[0], 8), dtype=np.uint8)
+        blocks[:, 0:4] = color_val.astype('<u2').view(np.uint8)
+        rows = indices.reshape(-1, 4, 4) << np.array([0, 2, 4, 6], dtype=np.uint8)
+        blocks[:, 4:8] = np.bitwise_or.reduce(rows, axis=2)
+        return blocks
+
+    def compress_bc1_blocks(self, blocks, quality='normal', four_color_only=False):
+        """Compress blocks of pixels to BC1.
+
+        Args:
+            blocks (numpy array): uint8 array of shape (number of blocks, 16, 4).
+            quality (string): One of QUALITIES.
+            four_color_only (bool): If set, every block is encoded in 4-color mode,
+                and alpha is ignored. This is how the color blocks of BC2 and BC3 are decoded.
+                Otherwise, pixels with an alpha below alpha_threshold are encoded as
+                transparent black, in 3-color mode.
+
+        Returns:
+            comp_blocks (numpy array): uint8 array of shape (number of blocks, 8).
+
+        Raises:
+            ValueError: If quality isn't one of QUALITIES.
+        """
+
+        if quality not in self.QUALITIES:
+            raise ValueError, "Unknown quality '%s' (expected one of: %s)" % (quality, ', '.join(self.QUALITIES))
+
+        pixels = blocks[..., 0:3].astype(np.float32)
+        if four_color_only:
+            transparent = np.zeros(blocks.shape[0:2], dtype=np.bool_)
+        else:
+            transparent = blocks[..., 3] < self.alpha_threshold
+        three_color = transparent.any(axis=1)
+        weights = (~transparent).astype(np.float32)
+
+        if quality == 'fast':
+            start, end = self.fit_bounding_box(pixels, weights)
+        else:
+            start, end = self.fit_principal_axis(pixels, weights)
+        color_val = np.stack([self.quantize_565(start), self.quantize_565(end)], axis=1)
+
+        if quality == 'high':
+            # The cluster fit only applies to 4-color blocks. Keep whichever of it
+            # and the range fit gives the lowest error.
+            opaque = np.flatnonzero(~three_color)
+            for chunk in xrange(0, len(opaque), self.CLUSTER_FIT_CHUNK):
+                chunk_blocks = opaque[chunk:chunk + self.CLUSTER_FIT_CHUNK]
+                start, end = self.fit_cluster(pixels[chunk_blocks])
+                cluster_val = np.stack([self.quantize_565(start), self.quantize_565(end)], axis=1)
+                candidates = np.stack([color_val[chunk_blocks], cluster_val])
+                errors = [self.get_bc1_indices(pixels[chunk_blocks], self.order_bc1_endpoints(candidate, False),
+                                               np.zeros(len(chunk_blocks), np.bool_),
+                                               transparent[chunk_blocks])[1] for candidate in candidates]
+                better = errors[1] < errors[0]
+                color_val[chunk_blocks[better]] = cluster_val[better]
+
+        color_val = self.order_bc1_endpoints(color_val, three_color)
+        if not four_color_only:
+            # color_0 == color_1 is decoded in 3-color mode, which is fine as long as
+            # only color_0 (or transparent black) is used.
+            three_color = three_color | (color_val[:, 0] == color_val[:, 1])
+
+        indices, _ = self.get_bc1_indices(pixels, color_val, three_color, transparent)
+        return self.pack_bc1_blocks(color_val, indices)
+
+    @staticmethod
+    def order_bc1_endpoints(color_val, three_color):
+        """Order the endpoints of every block for its mode.
+
+        In 4-color mode, color_0 > color_1. In 3-color mode, color_0 <= color_1.
+
+        Args:
+            color_val (numpy array): uint16 array of shape (number of blocks, 2).
+            three_color (numpy array or bool): Blocks encoded in 3-color mode.
+
+        Returns:
+            color_val (numpy array): uint16 array of shape (number of blocks, 2).
+        """
+
+        swap = (color_val[:, 0] < color_val[:, 1]) != np.asarray(three_color)
+        swap &= color_val[:, 0] != color_val[:, 1]
+        return np.where(swap[:, np.newaxis], color_val[:, ::-1], color_val)
+
+    @staticmethod
+    def compress_bc3_alpha_blocks(alpha):
+        """Compress the alpha of blocks of pixels to BC3 (interpolated) alpha blocks.
+
+        Both the 8-alpha mode (spanning the block's alpha range) and the 6-alpha mode
+        (spanning the range of its alpha values other than 0 and 255, which are encoded
+        exactly) are tried, and the one with the lowest error is kept.
+
+        Args:
+            alpha (numpy array): uint8 array of shape (number of blocks, 16).
+
+        Returns:
+            comp_blocks (numpy array): uint8 array of shape (number of blocks, 8).
+        """
+
+        values = alpha.astype(np.float32)
+        interior = (alpha > 0) & (alpha < 255)
+        interior_low = np.where(interior, values, 255).min(axis=1)
+        interior_high = np.where(interior, values, 0).max(axis=1)
+        interior_low, interior_high = (np.where(interior_low <= interior_high, interior_low, 0),
+                                       np.where(interior_low <= interior_high, interior_high, 0))
+
+        # 8-alpha mode: alpha_0 > alpha_1
+        endpoints_8 = np.stack([values.max(axis=1), values.min(axis=1)], axis=1)
+        weights_8 = np.array([[0, 7], [7, 0], [6, 1], [5, 2], [4, 3], [3, 4], [2, 5], [1, 6]]) / 7
+        palette_8 = endpoints_8.dot(weights_8.T)
+
+        # 6-alpha mode: alpha_0 <= alpha_1
+        endpoints_6 = np.stack([interior_low, interior_high], axis=1)
+        weights_6 = np.array([[5, 0], [0, 5], [4, 1], [3, 2], [2, 3], [1, 4]]) / 5
+        palette_6 = np.column_stack([endpoints_6.dot(weights_6.T), np.zeros(len(alpha)), np.full(len(alpha), 255)])
+
+        results = []
+        for endpoints, palette in ((endpoints_8, palette_8), (endpoints_6, palette_6)):
+            distance = np.abs(values[:, :, np.newaxis] - palette[:, np.newaxis])
+            results.append((endpoints, np.argmin(distance, axis=2), distance.min(axis=2).sum(axis=1)))
+
+        use_6 = (results[1][2] < results[0][2])[:, np.newaxis]
+        endpoints = np.where(use_6, results[1][0], results[0][0])
+        indices = np.where(use_6, results[1][1], results[0][1]).astype(np.uint64)
+
+        # A block with a single alpha value is decoded in 6-alpha mode, where index 0 is still alpha_0
+        comp_blocks = np.empty((len(alpha), 8), dtype=np.uint8)
+        comp_blocks[:, 0:2] = endpoints
+        index_bits = np.bitwise_or.reduce(indices << (np.arange(16, dtype=np.uint64) * 3), axis=1)
+        comp_blocks[:, 2:8] = index_bits.astype('<u8')[:, np.newaxis].view(np.uint8)[:, 0:6]
+        return comp_blocks
+
+    def compress_bc1(self, image, quality='normal'):
+        """Compress an RGBA image to BC1 data.
+
+        Args:
+            image (numpy array): uint8 array of shape (height, width, 4).
+            quality (string): One of QUALITIES.
+
+        Returns:
+            comp_data (numpy array): Flat uint8 array of compressed data, ordered block by block.
+
+        Raises:
+            ValueError: If quality isn't one of QUALITIES.
+        """
+
+        require_numpy('compress BC1 data')
+        blocks = pixel_swizzle.PixelSwizzle.tile(np.asarray(image, dtype=np.uint8))
+        return self.compress_bc1_blocks(blocks, quality).reshape(-1)
+
+    def compress_bc3(self, image, quality='normal'):
+        """Compress an RGBA image to BC3 data.
+
+        Args:
+            image (numpy array): uint8 array of shape (height, width, 4).
+            quality (string): One of QUALITIES. Only affects the color blocks.
+
+        Returns:
+            comp_data (numpy array): Flat uint8 array of compressed data, ordered block by block.
+
+        Raises:
+            ValueError: If quality isn't one of QUALITIES.
+        """
+
+        require_numpy('compress BC3 data')
+        blocks = pixel_swizzle.PixelSwizzle.tile(np.asarray(image, dtype=np.uint8))
+        comp_blocks = np.empty((blocks.shape[0], 16), dtype=np.uint8)
+        comp_blocks[:, 0:8] = self.compress_bc3_alpha_blocks(blocks[..., 3])
+        comp_blocks[:, 8:16] = self.compress_bc1_blocks(blocks, quality, four_color_only=True)
+        return comp_blocks.reshape(-1)
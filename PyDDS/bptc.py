@@ -0,0 +1,602 @@
+#!/usr/bin/python
+"""bptc.py
+    - Define the tables shared by the BPTC formats (BC6H and BC7),
+      and decode BC6H and BC7 data.
+"""
+
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Describe how each BC7 mode lays out its 128 bits (after the mode bits).
+#
+# subsets: Number of subsets (read: sets of endpoints) in the block.
+# partition_bits: Size of the partition number, which selects the subset of each pixel.
+# rotation_bits: Size of the rotation, which swaps alpha with one of the color channels.
+# index_selection_bits: Size of the index selector (which index set applies to color).
+# color_bits, alpha_bits: Size of each color/alpha endpoint component.
+# endpoint_pbits: If set, each endpoint has its own P-bit (shared LSB of all its components).
+# shared_pbits: If set, both endpoints of a subset share a single P-bit.
+# index_bits, index2_bits: Size of each primary/secondary index.
+BC7Mode = namedtuple('BC7Mode', 'subsets partition_bits rotation_bits index_selection_bits '
+                                'color_bits alpha_bits endpoint_pbits shared_pbits '
+                                'index_bits index2_bits')
+
+BC7_MODES = [BC7Mode(3, 4, 0, 0, 4, 0, 1, 0, 3, 0),
+             BC7Mode(2, 6, 0, 0, 6, 0, 0, 1, 3, 0),
+             BC7Mode(3, 6, 0, 0, 5, 0, 0, 0, 2, 0),
+             BC7Mode(2, 6, 0, 0, 7, 0, 1, 0, 2, 0),
+             BC7Mode(1, 0, 2, 1, 5, 6, 0, 0, 2, 3),
+             BC7Mode(1, 0, 2, 0, 7, 8, 0, 0, 2, 2),
+             BC7Mode(1, 0, 0, 0, 7, 7, 1, 0, 4, 0),
+             BC7Mode(2, 6, 0, 0, 5, 5, 1, 0, 2, 0)]
+
+# Describe each BC6H mode.
+#
+# value: Value of the mode bits (2 bits for the first two modes, 5 bits otherwise).
+# transformed: If set, all endpoints but the first are stored as deltas from it.
+# endpoint_bits: Precision of the endpoints.
+# delta_bits: Size of the red, green and blue components of each delta
+#     (or endpoint, if not transformed).
+# layout: Where every bit of the endpoints and partition lives, in the order
+#     they're stored, using the notation of the BC6H format spec. w and x are the
+#     endpoints of the first subset, y and z those of the second; d is the partition.
+#     [a:b] lists bits b through a, so reversed ranges (e.g. [10:15]) are stored MSB first.
+BC6HMode = namedtuple('BC6HMode', 'value transformed endpoint_bits delta_bits layout')
+
+BC6H_MODES = [BC6HMode(0x00, True, 10, (5, 5, 5),
+                       'gy[4] by[4] bz[4] rw[9:0] gw[9:0] bw[9:0] rx[4:0] gz[4] gy[3:0] gx[4:0] bz[0] '
+                       'gz[3:0] bx[4:0] bz[1] by[3:0] ry[4:0] bz[2] rz[4:0] bz[3] d[4:0]'),
+              BC6HMode(0x01, True, 7, (6, 6, 6),
+                       'gy[5] gz[4] gz[5] rw[6:0] bz[0] bz[1] by[4] gw[6:0] by[5] bz[2] gy[4] bw[6:0] '
+                       'bz[3] bz[5] bz[4] rx[5:0] gy[3:0] gx[5:0] gz[3:0] bx[5:0] by[3:0] ry[5:0] '
+                       'rz[5:0] d[4:0]'),
+              BC6HMode(0x02, True, 11, (5, 4, 4),
+                       'rw[9:0] gw[9:0] bw[9:0] rx[4:0] rw[10] gy[3:0] gx[3:0] gw[10] bz[0] gz[3:0] '
+                       'bx[3:0] bw[10] bz[1] by[3:0] ry[4:0] bz[2] rz[4:0] bz[3] d[4:0]'),
+              BC6HMode(0x06, True, 11, (4, 5, 4),
+                       'rw[9:0] gw[9:0] bw[9:0] rx[3:0] rw[10] gz[4] gy[3:0] gx[4:0] gw[10] gz[3:0] '
+                       'bx[3:0] bw[10] bz[1] by[3:0] ry[3:0] bz[0] bz[2] rz[3:0] gy[4] bz[3] d[4:0]'),
+              BC6HMode(0x0a, True, 11, (4, 4, 5),
+                       'rw[9:0] gw[9:0] bw[9:0] rx[3:0] rw[10] by[4] gy[3:0] gx[3:0] gw[10] bz[0] '
+                       'gz[3:0] bx[4:0] bw[10] by[3:0] ry[3:0] bz[1] bz[2] rz[3:0] bz[4] bz[3] d[4:0]'),
+              BC6HMode(0x0e, True, 9, (5, 5, 5),
+                       'rw[8:0] by[4] gw[8:0] gy[4] bw[8:0] bz[4] rx[4:0] gz[4] gy[3:0] gx[4:0] bz[0] '
+                       'gz[3:0] bx[4:0] bz[1] by[3:0] ry[4:0] bz[2] rz[4:0] bz[3] d[4:0]'),
+              BC6HMode(0x12, True, 8, (6, 5, 5),
+                       'rw[7:0] gz[4] by[4] gw[7:0] bz[2] gy[4] bw[7:0] bz[3] bz[4] rx[5:0] gy[3:0] '
+                       'gx[4:0] bz[0] gz[3:0] bx[4:0] bz[1] by[3:0] ry[5:0] rz[5:0] d[4:0]'),
+              BC6HMode(0x16, True, 8, (5, 6, 5),
+                       'rw[7:0] bz[0] by[4] gw[7:0] gy[5] gy[4] bw[7:0] gz[5] bz[4] rx[4:0] gz[4] '
+                       'gy[3:0] gx[5:0] gz[3:0] bx[4:0] bz[1] by[3:0] ry[4:0] bz[2] rz[4:0] bz[3] d[4:0]'),
+              BC6HMode(0x1a, True, 8, (5, 5, 6),
+                       'rw[7:0] bz[1] by[4] gw[7:0] by[5] gy[4] bw[7:0] bz[5] bz[4] rx[4:0] gz[4] '
+                       'gy[3:0] gx[4:0] bz[0] gz[3:0] bx[5:0] by[3:0] ry[4:0] bz[2] rz[4:0] bz[3] d[4:0]'),
+              BC6HMode(0x1e, False, 6, (6, 6, 6),
+                       'rw[5:0] gz[4] bz[0] bz[1] by[4] gw[5:0] gy[5] by[5] bz[2] gy[4] bw[5:0] gz[5] '
+                       'bz[3] bz[5] bz[4] rx[5:0] gy[3:0] gx[5:0] gz[3:0] bx[5:0] by[3:0] ry[5:0] '
+                       'rz[5:0] d[4:0]'),
+              BC6HMode(0x03, False, 10, (10, 10, 10),
+                       'rw[9:0] gw[9:0] bw[9:0] rx[9:0] gx[9:0] bx[9:0]'),
+              BC6HMode(0x07, True, 11, (9, 9, 9),
+                       'rw[9:0] gw[9:0] bw[9:0] rx[8:0] rw[10] gx[8:0] gw[10] bx[8:0] bw[10]'),
+              BC6HMode(0x0b, True, 12, (8, 8, 8),
+                       'rw[9:0] gw[9:0] bw[9:0] rx[7:0] rw[10:11] gx[7:0] gw[10:11] bx[7:0] bw[10:11]'),
+              BC6HMode(0x0f, True, 16, (4, 4, 4),
+                       'rw[9:0] gw[9:0] bw[9:0] rx[3:0] rw[10:15] gx[3:0] gw[10:15] bx[3:0] bw[10:15]')]
+
+# Endpoint (w, x, y, z) and channel (r, g, b) of each BC6H endpoint field
+BC6H_FIELDS = {channel + endpoint : (endpoint_index, channel_index)
+               for endpoint_index, endpoint in enumerate('wxyz')
+               for channel_index, channel in enumerate('rgb')}
+
+# Interpolation weights (out of 64), by index size
+WEIGHTS = {2 : [0, 21, 43, 64],
+           3 : [0, 9, 18, 27, 37, 46, 55, 64],
+           4 : [0, 4, 9, 13, 17, 21, 26, 30, 34, 38, 43, 47, 51, 55, 60, 64]}
+
+# Subset of each pixel, for each of the 64 two-subset partitions.
+# Bit N of each mask is the subset of pixel N.
+PARTITION_MASKS_2 = [0xcccc, 0x8888, 0xeeee, 0xecc8, 0xc880, 0xfeec, 0xfec8, 0xec80,
+                     0xc800, 0xffec, 0xfe80, 0xe800, 0xffe8, 0xff00, 0xfff0, 0xf000,
+                     0xf710, 0x008e, 0x7100, 0x08ce, 0x008c, 0x7310, 0x3100, 0x8cce,
+                     0x088c, 0x3110, 0x6666, 0x366c, 0x17e8, 0x0ff0, 0x718e, 0x399c,
+                     0xaaaa, 0xf0f0, 0x5a5a, 0x33cc, 0x3c3c, 0x55aa, 0x9696, 0xa55a,
+                     0x73ce, 0x13c8, 0x324c, 0x3bdc, 0x6996, 0xc33c, 0x9966, 0x0660,
+                     0x0272, 0x04e4, 0x4e40, 0x2720, 0xc936, 0x936c, 0x39c6, 0x639c,
+                     0x9336, 0x9cc6, 0x817e, 0xe718, 0xccf0, 0x0fcc, 0x7744, 0xee22]
+
+# Subset of each pixel (row by row), for each of the 64 three-subset partitions
+PARTITIONS_3 = ['0011001102212222', '0001001122112221', '0000200122112211', '0222002200110111',
+                '0000000011221122', '0011001100220022', '0022002211111111', '0011001122112211',
+                '0000000011112222', '0000111111112222', '0000111122222222', '0012001200120012',
+                '0112011201120112', '0122012201220122', '0011011211221222', '0011200122002220',
+                '0001001101121122', '0111001120012200', '0000112211221122', '0022002200221111',
+                '0111011102220222', '0001000122212221', '0000001101220122', '0000110022102210',
+                '0122012200110000', '0012001211222222', '0110122112210110', '0000011012211221',
+                '0022110211020022', '0110011020022222', '0011012201220011', '0000200022112221',
+                '0000000211221222', '0222002200120011', '0011001200220222', '0120012001200120',
+                '0000111122220000', '0120120120120120', '0120201212010120', '0011220011220011',
+                '0011112222000011', '0101010122222222', '0000000021212121', '0022112200221122',
+                '0022001100220011', '0220122102201221', '0101222222220101', '0000212121212121',
+                '0101010101012222', '0222011102220111', '0002111200021112', '0000211221122112',
+                '0222011101110222', '0002111211120002', '0110011001102222', '0000000021122112',
+                '0110011022222222', '0022001100110022', '0022112211220022', '0000000000002112',
+                '0002000100020001', '0222122202221222', '0101222222222222', '0111201122012220']
+
+# Index of the pixel holding the anchor index (whose MSB is implicitly 0)
+# of the second subset of each two-subset partition...
+ANCHORS_2 = [15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15,
+             15, 2, 8, 2, 2, 8, 8, 15, 2, 8, 2, 2, 8, 8, 2, 2,
+             15, 15, 6, 8, 2, 8, 15, 15, 2, 8, 2, 2, 2, 15, 15, 6,
+             6, 2, 6, 8, 15, 15, 2, 2, 15, 15, 15, 15, 15, 2, 2, 15]
+
+# ... and the second and third subsets of each three-subset partition.
+# The anchor of the first subset is always pixel 0.
+ANCHORS_3_SECOND = [3, 3, 15, 15, 8, 3, 15, 15, 8, 8, 6, 6, 6, 5, 3, 3,
+                    3, 3, 8, 15, 3, 3, 6, 10, 5, 8, 8, 6, 8, 5, 15, 15,
+                    8, 15, 3, 5, 6, 10, 8, 15, 15, 3, 15, 5, 15, 15, 15, 15,
+                    3, 15, 5, 5, 5, 8, 5, 10, 5, 10, 8, 13, 15, 12, 3, 3]
+
+ANCHORS_3_THIRD = [15, 8, 8, 3, 15, 15, 3, 8, 15, 15, 15, 15, 15, 15, 15, 8,
+                   15, 8, 15, 3, 15, 8, 15, 8, 3, 15, 6, 10, 15, 15, 10, 8,
+                   15, 3, 15, 10, 10, 8, 9, 10, 6, 15, 8, 15, 3, 6, 6, 8,
+                   15, 3, 15, 15, 15, 15, 15, 15, 15, 15, 15, 15, 3, 15, 15, 8]
+
+
+def get_partitions(subsets):
+    """Get the subset of every pixel of every partition, for some number of subsets.
+
+    Returns:
+        partitions (list of lists): 64 partitions (or a single one, if subsets is 1),
+            each listing the subset of all 16 pixels, row by row.
+    """
+
+    if subsets == 1:
+        return [[0] * 16]
+    elif subsets == 2:
+        return [[(mask >> pixel) & 1 for pixel in xrange(16)] for mask in PARTITION_MASKS_2]
+
+    return [[int(subset) for subset in partition] for partition in PARTITIONS_3]
+
+
+def get_anchors(subsets):
+    """Get the anchor pixel of every subset of every partition, for some number of subsets.
+
+    Returns:
+        anchors (list of lists): 64 partitions (or a single one, if subsets is 1),
+            each listing the anchor pixel of every subset.
+    """
+
+    if subsets == 1:
+        return [[0]]
+    elif subsets == 2:
+        return [[0, second] for second in ANCHORS_2]
+
+    return [[0, second, third] for second, third in zip(ANCHORS_3_SECOND, ANCHORS_3_THIRD)]
+
+
+def get_index_layout(subsets, index_bits):
+    """Work out where the index of every pixel lives, for every partition.
+
+    Anchor indices are stored with one less bit, which shifts every index
+    after them. Since the anchors depend on the partition, so does the layout.
+
+    Args:
+        subsets (int): Number of subsets.
+        index_bits (int): Size of each (non-anchor) index.
+
+    Returns:
+        offsets (numpy array): Array of shape (number of partitions, 16), with the bit
+            offset of every index, relative to the start of the indices.
+        masks (numpy array): Array of the same shape, with the mask of every index.
+    """
+
+    offsets = []
+    masks = []
+    for anchors in get_anchors(subsets):
+        offset = 0
+        partition_offsets = []
+        partition_masks = []
+        for pixel in xrange(16):
+            size = index_bits - 1 if pixel in anchors else index_bits
+            partition_offsets.append(offset)
+            partition_masks.append((1 << size) - 1)
+            offset += size
+        offsets.append(partition_offsets)
+        masks.append(partition_masks)
+
+    return np.array(offsets, dtype=np.uint64), np.array(masks, dtype=np.uint64)
+
+
+class BitReader(object):
+    """Read bit fields at the same position out of many 128-bit blocks at once."""
+
+    def __init__(self, blocks):
+        """
+        Args:
+            blocks (numpy array): uint8 array of shape (number of blocks, 16).
+        """
+        words = np.ascontiguousarray(blocks).view('<u8').astype(np.uint64)
+        self.low = words[:, 0]
+        self.high = words[:, 1]
+        self.offset = 0
+
+    def peek(self, offset, count):
+        """Get 'count' (at most 64) bits of every block, starting at bit 'offset'."""
+
+        if offset >= 64:
+            value = self.high >> np.uint64(offset - 64)
+        elif offset + count <= 64:
+            value = self.low >> np.uint64(offset)
+        else:
+            value = (self.low >> np.uint64(offset)) | (self.high << np.uint64(64 - offset))
+
+        if count < 64:
+            value = value & np.uint64((1 << count) - 1)
+
+        return value
+
+    def read(self, count):
+        """Get the next 'count' bits of every block, and move past them."""
+
+        value = self.peek(self.offset, count)
+        self.offset += count
+        return value
+
+
+def get_bc7_modes(blocks):
+    """Get the mode of every block of BC7 data.
+
+    The mode is the position of the lowest set bit of the block.
+    Blocks without any of the lowest 8 bits set are invalid, reported as mode 8.
+    """
+
+    lowest_bit = np.full(256, 8, dtype=np.uint8)
+    for mode in reversed(xrange(8)):
+        lowest_bit[np.arange(256) & (1 << mode) != 0] = mode
+
+    return lowest_bit[blocks[:, 0]]
+
+
+def unquantize(values, bits):
+    """Expand some endpoint components of 'bits' bits to 8 bits, by replicating their MSBs."""
+    return (values << (8 - bits)) | (values >> (2 * bits - 8))
+
+
+def get_palettes(endpoints, index_bits):
+    """Interpolate every value that each pair of endpoints can represent.
+
+    Args:
+        endpoints (numpy array): Array of shape (number of blocks, number of endpoints,
+            number of channels). Each subset's pair of endpoints are adjacent.
+        index_bits (int): Size of the indices selecting between the interpolated values.
+
+    Returns:
+        palettes (numpy array): Array of shape (number of blocks, number of subsets,
+            2**index_bits, number of channels).
+    """
+
+    weights = np.array(WEIGHTS[index_bits], dtype=np.int16)[:, np.newaxis]
+    endpoint_0 = endpoints[:, 0::2, np.newaxis, :]
+    endpoint_1 = endpoints[:, 1::2, np.newaxis, :]
+    return ((64 - weights) * endpoint_0 + weights * endpoint_1 + 32) >> 6
+
+
+def lookup(palettes, subsets, indices):
+    """Look up the palette entry of every pixel of every block.
+
+    Args:
+        palettes (numpy array): See get_palettes().
+        subsets, indices (numpy array): intp arrays of shape (number of blocks, 16),
+            with the subset and index of every pixel.
+
+    Returns:
+        pixels (numpy array): Array of shape (number of blocks, 16, number of channels).
+    """
+
+    num_blocks, num_subsets, num_entries, num_channels = palettes.shape
+    entries = subsets * num_entries + indices
+    entries += (np.arange(num_blocks, dtype=np.intp) * (num_subsets * num_entries))[:, np.newaxis]
+    return palettes.reshape(-1, num_channels)[entries]
+
+
+def get_indices(reader, offset, subsets, index_bits, partitions):
+    """Read the indices of every pixel of every block, given the partition of every block."""
+
+    offsets, masks = LAYOUTS[(subsets, index_bits)]
+    total_bits = 16 * index_bits - subsets
+    bits = reader.peek(offset, total_bits)[:, np.newaxis]
+
+    return ((bits >> offsets[partitions]) & masks[partitions]).astype(np.intp)
+
+
+def decompress_bc7_mode(blocks, mode):
+    """Decompress blocks of BC7 data that all use the same mode.
+
+    Args:
+        blocks (numpy array): uint8 array of shape (number of blocks, 16).
+        mode (int): Mode of every block.
+
+    Returns:
+        decomp_blocks (numpy array): uint8 array of shape (number of blocks, 16, 4).
+            For every block, each pixel (row by row) with its RGBA components.
+    """
+
+    # Each block contains, in order:
+    # 1. The mode (mode + 1 bits, unary encoded)
+    # 2. The partition, rotation and index selector (if applicable to the mode)
+    # 3. All the endpoints' red, then green, then blue, then alpha components
+    # 4. The P-bits (if applicable to the mode)
+    # 5. The primary indices, then the secondary indices (if applicable)
+    layout = BC7_MODES[mode]
+    num_blocks = blocks.shape[0]
+    num_endpoints = layout.subsets * 2
+    reader = BitReader(blocks)
+    reader.offset = mode + 1
+
+    partitions = reader.read(layout.partition_bits).astype(np.intp)
+    rotations = reader.read(layout.rotation_bits)
+    index_selectors = reader.read(layout.index_selection_bits)
+
+    endpoints = np.empty((num_blocks, num_endpoints, 4), dtype=np.int16)
+    for channel in xrange(4):
+        bits = layout.color_bits if channel < 3 else layout.alpha_bits
+        for endpoint in xrange(num_endpoints):
+            endpoints[:, endpoint, channel] = reader.read(bits)
+
+    color_bits = layout.color_bits
+    alpha_bits = layout.alpha_bits
+    if layout.endpoint_pbits or layout.shared_pbits:
+        if layout.endpoint_pbits:
+            pbits = np.stack([reader.read(1) for _ in xrange(num_endpoints)], axis=1)
+        else:
+            pbits = np.repeat(np.stack([reader.read(1) for _ in xrange(layout.subsets)], axis=1), 2, axis=1)
+
+        endpoints = (endpoints << 1) | pbits.astype(np.int16)[:, :, np.newaxis]
+        color_bits += 1
+        alpha_bits += 1 if alpha_bits else 0
+
+    endpoints[:, :, 0:3] = unquantize(endpoints[:, :, 0:3], color_bits)
+    if alpha_bits:
+        endpoints[:, :, 3] = unquantize(endpoints[:, :, 3], alpha_bits)
+    else:
+        endpoints[:, :, 3] = 255
+
+    indices = get_indices(reader, reader.offset, layout.subsets, layout.index_bits, partitions)
+
+    if not layout.index2_bits:
+        subsets = PARTITION_TABLES[layout.subsets][partitions]
+        decomp_blocks = lookup(get_palettes(endpoints, layout.index_bits), subsets, indices)
+    else:
+        # Color and alpha use separate sets of indices.
+        # The index selector (mode 4 only) swaps which set applies to which.
+        offset = reader.offset + 16 * layout.index_bits - 1
+        indices2 = get_indices(reader, offset, 1, layout.index2_bits, partitions)
+        subsets = np.zeros_like(indices)
+        index_sets = [(indices, layout.index_bits), (indices2, layout.index2_bits)]
+
+        decomp_blocks = np.empty((num_blocks, 16, 4), dtype=np.int16)
+        for selector in xrange(2):
+            selected = np.flatnonzero(index_selectors == selector)
+            if not selected.size:
+                continue
+
+            color_indices, color_index_bits = index_sets[selector]
+            alpha_indices, alpha_index_bits = index_sets[1 - selector]
+            selected_subsets = subsets[selected]
+
+            palettes = get_palettes(endpoints[selected, :, 0:3], color_index_bits)
+            decomp_blocks[selected, :, 0:3] = lookup(palettes, selected_subsets, color_indices[selected])
+
+            palettes = get_palettes(endpoints[selected, :, 3:4], alpha_index_bits)
+            decomp_blocks[selected, :, 3:4] = lookup(palettes, selected_subsets, alpha_indices[selected])
+
+    if layout.rotation_bits:
+        # Swap alpha with red, green or blue
+        for rotation in xrange(1, 4):
+            rotated = (rotations == rotation)
+            channels = [0, 1, 2, 3]
+            channels[rotation - 1], channels[3] = 3, rotation - 1
+            decomp_blocks[rotated] = decomp_blocks[rotated][:, :, channels]
+
+    return decomp_blocks.astype(np.uint8)
+
+
+def decompress_bc7_blocks(blocks):
+    """Decompress every block of some BC7 data.
+
+    Blocks are grouped by mode, and each group is decoded as a batch.
+
+    Args:
+        blocks (numpy array): uint8 array of shape (number of blocks, 16).
+
+    Returns:
+        decomp_blocks (numpy array): uint8 array of shape (number of blocks, 16, 4).
+            For every block, each pixel (row by row) with its RGBA components.
+            Invalid blocks decode to transparent black.
+    """
+
+    modes = get_bc7_modes(blocks)
+    decomp_blocks = np.zeros((blocks.shape[0], 16, 4), dtype=np.uint8)
+
+    for mode in xrange(8):
+        selected = np.flatnonzero(modes == mode)
+        if selected.size:
+            decomp_blocks[selected] = decompress_bc7_mode(blocks[selected], mode)
+
+    return decomp_blocks
+
+
+def parse_bc6h_layout(layout):
+    """Parse the layout of a BC6H mode (see BC6H_MODES).
+
+    Returns:
+        runs (list of tuples): (field name, first bit, last bit) of each run of bits,
+            in the order they're stored. The first bit is stored first.
+    """
+
+    runs = []
+    for token in layout.split():
+        name, bits = token.rstrip(']').split('[')
+        bits = [int(bit) for bit in bits.split(':')]
+        runs.append((name, bits[-1], bits[0]))
+
+    return runs
+
+
+def sign_extend(values, bits):
+    """Sign extend some values of 'bits' bits (either an int or an array, per channel)."""
+
+    sign = np.left_shift(1, np.subtract(bits, 1))
+    return ((values & ((sign << 1) - 1)) ^ sign) - sign
+
+
+def get_bc6h_modes(blocks):
+    """Get the mode (index into BC6H_MODES) of every block of BC6H data.
+
+    Blocks using one of the reserved mode values are reported as mode 14.
+    """
+
+    mode_lookup = np.full(32, len(BC6H_MODES), dtype=np.uint8)
+    for mode, layout in enumerate(BC6H_MODES):
+        mode_lookup[layout.value] = mode
+
+    # The first two modes only use 2 mode bits
+    values = blocks[:, 0] & 0x1f
+    values = np.where((values & 0x3) < 2, values & 0x3, values)
+    return mode_lookup[values]
+
+
+def unquantize_bc6h(endpoints, bits, signed):
+    """Expand some BC6H endpoints of 'bits' bits to 16 bits (or 15 bits plus a sign)."""
+
+    if signed:
+        if bits >= 16:
+            return endpoints
+
+        magnitude = np.abs(endpoints)
+        values = ((magnitude << 15) + 0x4000) >> (bits - 1)
+        values = np.where(magnitude >= (1 << (bits - 1)) - 1, 0x7fff, values)
+        values = np.where(magnitude == 0, 0, values)
+        return np.where(endpoints < 0, -values, values)
+
+    if bits >= 15:
+        return endpoints
+
+    values = ((endpoints << 16) + 0x8000) >> bits
+    values = np.where(endpoints == (1 << bits) - 1, 0xffff, values)
+    return np.where(endpoints == 0, 0, values)
+
+
+def finish_unquantize_bc6h(values, signed):
+    """Scale some interpolated BC6H values to the bits of half floats."""
+
+    if signed:
+        magnitude = (np.abs(values) * 31) >> 5
+        return np.where(values < 0, magnitude | 0x8000, magnitude).astype(np.uint16)
+
+    return ((values * 31) >> 6).astype(np.uint16)
+
+
+def decompress_bc6h_mode(blocks, mode, signed):
+    """Decompress blocks of BC6H data that all use the same mode.
+
+    Args:
+        blocks (numpy array): uint8 array of shape (number of blocks, 16).
+        mode (int): Mode of every block (index into BC6H_MODES).
+        signed (bool): If set, the data is BC6H_SF16.
+
+    Returns:
+        decomp_blocks (numpy array): float16 array of shape (number of blocks, 16, 3).
+            For every block, each pixel (row by row) with its RGB components.
+    """
+
+    # Each block contains, in order:
+    # 1. The mode (2 or 5 bits)
+    # 2. The endpoints and partition, with their bits scattered (see BC6H_MODES)
+    # 3. The indices: 3 bits each with two subsets, or 4 bits each with one.
+    layout = BC6H_MODES[mode]
+    runs, subsets = BC6H_LAYOUTS[mode]
+    num_blocks = blocks.shape[0]
+    reader = BitReader(blocks)
+    reader.offset = 2 if layout.value < 2 else 5
+
+    endpoints = np.zeros((num_blocks, 4, 3), dtype=np.int32)
+    partitions = np.zeros(num_blocks, dtype=np.int32)
+    for name, first_bit, last_bit in runs:
+        value = reader.read(abs(last_bit - first_bit) + 1).astype(np.int32)
+        if last_bit < first_bit:
+            # Stored MSB first: reverse the bits
+            value = sum(((value >> bit) & 1) << (first_bit - bit) for bit in xrange(first_bit - last_bit + 1))
+        else:
+            value = value << first_bit
+
+        if name == 'd':
+            partitions |= value
+        else:
+            endpoint, channel = BC6H_FIELDS[name]
+            endpoints[:, endpoint, channel] |= value
+
+    endpoints = endpoints[:, 0:subsets * 2]
+    bits = layout.endpoint_bits
+
+    if signed:
+        endpoints[:, 0] = sign_extend(endpoints[:, 0], bits)
+
+    if layout.transformed:
+        deltas = sign_extend(endpoints[:, 1:], layout.delta_bits)
+        endpoints[:, 1:] = (endpoints[:, 0:1] + deltas) & ((1 << bits) - 1)
+        if signed:
+            endpoints[:, 1:] = sign_extend(endpoints[:, 1:], bits)
+    elif signed:
+        endpoints[:, 1:] = sign_extend(endpoints[:, 1:], bits)
+
+    endpoints = unquantize_bc6h(endpoints, bits, signed)
+
+    index_bits = 3 if subsets == 2 else 4
+    partitions = partitions.astype(np.intp)
+    indices = get_indices(reader, reader.offset, subsets, index_bits, partitions)
+    palettes = get_palettes(endpoints, index_bits)
+    values = lookup(palettes, PARTITION_TABLES[subsets][partitions], indices)
+
+    return finish_unquantize_bc6h(values, signed).view(np.float16)
+
+
+def decompress_bc6h_blocks(blocks, signed=False):
+    """Decompress every block of some BC6H data.
+
+    Blocks are grouped by mode, and each group is decoded as a batch.
+
+    Args:
+        blocks (numpy array): uint8 array of shape (number of blocks, 16).
+        signed (bool): If set, the data is BC6H_SF16. Otherwise, BC6H_UF16.
+
+    Returns:
+        decomp_blocks (numpy array): float16 array of shape (number of blocks, 16, 3).
+            For every block, each pixel (row by row) with its RGB components.
+            Blocks using a reserved mode decode to black.
+    """
+
+    modes = get_bc6h_modes(blocks)
+    decomp_blocks = np.zeros((blocks.shape[0], 16, 3), dtype=np.float16)
+
+    for mode in xrange(len(BC6H_MODES)):
+        selected = np.flatnonzero(modes == mode)
+        if selected.size:
+            decomp_blocks[selected] = decompress_bc6h_mode(blocks[selected], mode, signed)
+
+    return decomp_blocks
+
+
+if np is not None:
+    PARTITION_TABLES = {subsets : np.array(get_partitions(subsets), dtype=np.intp)
+                        for subsets in (1, 2, 3)}
+    LAYOUTS = {(mode.subsets, bits) : get_index_layout(mode.subsets, bits)
+               for mode in BC7_MODES for bits in (mode.index_bits, mode.index2_bits) if bits}
+
+BC6H_LAYOUTS = [(parse_bc6h_layout(mode.layout), 2 if 'd[' in mode.layout else 1) for mode in BC6H_MODES]
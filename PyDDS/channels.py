@@ -0,0 +1,158 @@
+#!/usr/bin/python
+"""channels.py
+    - Edit the channels of RGBA pixel data as whole-array operations:
+      remap (swizzle), fill, invert, premultiply/unpremultiply alpha and lookup tables.
+    - Every function works in place on an array whose last dimension is the 4 channels
+      (e.g. decompressed data reshaped to (-1, 4), or an image of shape (height, width, 4)).
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Names of the channels, in order
+CHANNELS = 'RGBA'
+# Constants remap() accepts in place of a channel name
+CONSTANTS = {'0' : 0.0, '1' : 1.0}
+
+
+def get_channel_indices(channels):
+    """Get the indices of some channels.
+
+    Args:
+        channels (string): Channel names (e.g. 'RGB'), case-insensitive.
+
+    Returns:
+        indices (list of ints): Index of each channel.
+
+    Raises:
+        ValueError: If a name isn't one of CHANNELS.
+    """
+
+    indices = []
+    for channel in channels.upper():
+        if channel not in CHANNELS:
+            raise ValueError, 'Unknown channel %r (expected some of %s).' % (channel, CHANNELS)
+        indices.append(CHANNELS.index(channel))
+    return indices
+
+
+def get_max_value(dtype):
+    """Value of a fully saturated component: the largest integer of integer types, 1.0 for floats."""
+
+    dtype = np.dtype(dtype)
+    if dtype.kind in 'iu':
+        return np.iinfo(dtype).max
+    return 1.0
+
+
+def remap(data, mapping):
+    """Rearrange the channels (e.g. 'BGRA' swaps red and blue, 'RRR1' makes an opaque gray image out of red).
+
+    Args:
+        data (numpy array): RGBA pixel data.
+        mapping (string): Source of each of the 4 channels of the result: a channel name
+            (see CHANNELS), 0 or 1 (i.e. fully saturated, see get_max_value()).
+
+    Returns:
+        data (numpy array): data, remapped in place.
+
+    Raises:
+        ValueError: If mapping isn't 4 channel names or constants.
+    """
+
+    if len(mapping) != len(CHANNELS):
+        raise ValueError, 'Mapping %r must have %d channels.' % (mapping, len(CHANNELS))
+
+    sources = [channel if channel in CONSTANTS else get_channel_indices(channel)[0] for channel in mapping]
+    copied = [source for source in sources if source not in CONSTANTS]
+    # Gather the source channels first, since they may be overwritten
+    source_data = data[..., copied]
+    max_value = get_max_value(data.dtype)
+
+    for index, source in enumerate(sources):
+        if source in CONSTANTS:
+            data[..., index] = CONSTANTS[source] * max_value
+        else:
+            data[..., index] = source_data[..., copied.index(source)]
+    return data
+
+
+def fill(data, channels, value):
+    """Set some channels to a constant value (in the units of data, e.g. 0-255 for bytes)."""
+
+    data[..., get_channel_indices(channels)] = value
+    return data
+
+
+def invert(data, channels='RGB'):
+    """Invert some channels (max - value, see get_max_value())."""
+
+    indices = get_channel_indices(channels)
+    data[..., indices] = get_max_value(data.dtype) - data[..., indices]
+    return data
+
+
+def premultiply(data):
+    """Multiply the color channels by alpha (rounded to the nearest integer, for integer data)."""
+
+    alpha = data[..., 3:4]
+    if data.dtype.kind not in 'iu':
+        data[..., :3] *= alpha
+        return data
+
+    # Widen, so the products don't overflow
+    max_value = get_max_value(data.dtype)
+    products = data[..., :3].astype(np.int64) * alpha
+    data[..., :3] = (products + max_value // 2) // max_value
+    return data
+
+
+def unpremultiply(data):
+    """Divide the color channels by alpha (rounded and clamped, for integer data).
+    Pixels of alpha 0 are left alone."""
+
+    alpha = data[..., 3:4]
+    if data.dtype.kind not in 'iu':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            data[..., :3] = np.where(alpha != 0, data[..., :3] / alpha, data[..., :3])
+        return data
+
+    max_value = get_max_value(data.dtype)
+    wide_alpha = np.maximum(alpha.astype(np.int64), 1)
+    quotients = (data[..., :3].astype(np.int64) * max_value + wide_alpha // 2) // wide_alpha
+    data[..., :3] = np.where(alpha != 0, np.minimum(quotients, max_value), data[..., :3])
+    return data
+
+
+def apply_lut(data, lut, channels='RGB'):
+    """Map the values of some channels through lookup tables.
+
+    Args:
+        data (numpy array): RGBA pixel data, of an unsigned integer type.
+        lut (numpy array or list): Table indexed by value (e.g. 256 entries for bytes), applied to
+            every channel, or one table (row) per channel of channels.
+        channels (string): Names of the channels to map.
+
+    Returns:
+        data (numpy array): data, mapped in place.
+
+    Raises:
+        ValueError: If data isn't of an unsigned integer type, or the tables don't cover every value.
+    """
+
+    if data.dtype.kind != 'u':
+        raise ValueError, 'Lookup tables only apply to unsigned integer data, not %s.' % data.dtype
+
+    indices = get_channel_indices(channels)
+    lut = np.asarray(lut)
+    if lut.ndim == 1:
+        lut = np.tile(lut, (len(indices), 1))
+    if lut.shape[0] != len(indices) or lut.shape[1] <= get_max_value(data.dtype):
+        raise ValueError, 'Need %d lookup tables of %d entries, but got %s.' % \
+            (len(indices), get_max_value(data.dtype) + 1, 'x'.join(str(size) for size in lut.shape))
+
+    for row, index in enumerate(indices):
+        data[..., index] = lut[row][data[..., index]]
+    return data
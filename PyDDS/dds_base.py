@@ -7,7 +7,7 @@
 import abc
 from collections import namedtuple
 import logging
-import math
+import struct
 
 
 class DDSBase(object):
@@ -22,6 +22,9 @@ class DDSBase(object):
     dds_field = namedtuple('dds_field', 'name byte_size')
     dds_flag = namedtuple('dds_flag', 'field_name name value')
 
+    # Precompiled struct.Struct for each layout of fields, shared by all instances
+    structs = {}
+
     ##############################################################
 
     def __init__(self, debug_level=None):
@@ -35,6 +38,28 @@ class DDSBase(object):
 
         self.logger = logging.getLogger(__name__)
 
+        # Fields whose flags are values of an enum (rather than bits), mapped to the mask covering that enum
+        self.enum_masks = {}
+
+    @classmethod
+    def get_struct(cls, fields):
+        """Get the (precompiled) little-endian struct.Struct laying out some fields.
+
+        Every field is made up of DWORDs, each of which is packed/unpacked as a separate value.
+
+        Args:
+            fields (list of field namedtuples): Fields, in the order they're laid out.
+
+        Returns:
+            packer (struct.Struct): Packs/unpacks all the fields in a single call.
+        """
+
+        key = tuple(fields)
+        if key not in cls.structs:
+            cls.structs[key] = struct.Struct('<' + ''.join(['%dI' % (field.byte_size // cls.DWORD) \
+                                                            for field in fields]))
+        return cls.structs[key]
+
     @staticmethod
     def convert_to_ascii(value, field_size_bits=None):
         """Given some binary string, convert it into an ASCII string.
@@ -92,26 +117,32 @@ class DDSBase(object):
         return swapped_string
 
     def get_flag_value(self, field_name, flag_name):
-        """Get the value of some flag in a field."""
+        """Get the value (1 if set, 0 otherwise) of some flag in a field."""
 
         try:
-            field_size = [_field.byte_size for _field in self.fields \
-                          if _field.name == field_name][0]
+            flag = [_flag for _flag in self.flags \
+                    if _flag.name == flag_name and _flag.field_name == field_name][0]
         except IndexError:
-            self.logger.error("Field '%s' does not appear to exist.", field_name)
+            self.logger.error("Flag '%s' does not appear to exist in field '%s'.", flag_name, field_name)
             raise
 
-        try:
-            [flag for flag in self.flags if flag.name == flag_name][0]
-        except IndexError:
-            self.logger.error("Flag '%s' does not appear to exist.", flag_name)
-            raise
+        return self.test_flag(flag, getattr(self, field_name))
+
+    def test_flag(self, flag, value):
+        """Test whether some flag is set in the value of its field.
+
+        Args:
+            flag (flag namedtuple): Flag to test.
+            value (int): Value of the field.
 
-        hex_value = getattr(self, field_name)
-        binary_value = bin(hex_value)[2:].zfill(field_size * 8)
-        index = int(round(math.log(flag.value, 2)))
+        Returns:
+            is_set (int): 1 if the flag is set, 0 otherwise. A flag of an enum field
+                is set if the enum has that value.
+        """
 
-        return binary_value[index]
+        if flag.field_name in self.enum_masks:
+            return int((value & self.enum_masks[flag.field_name]) == flag.value)
+        return int((value & flag.value) != 0)
 
     def print_fields(self):
         """Pretty print all the of a DDS file that the class is
@@ -137,23 +168,12 @@ class DDSBase(object):
                 # If the field does not exist, then just move on to the next one
                 continue
 
-            bin_val = bin(final_val)[2:]
-            padded_bin_val = bin_val.zfill(field_size_bits)
-            final_bin_val = padded_bin_val[::-1]
-
             print field.name, hex(final_val), '(%s)' % final_val, \
-                self.convert_to_ascii(padded_bin_val, field_size_bits)[::-1]
+                self.convert_to_ascii(bin(final_val)[2:].zfill(field_size_bits))[::-1]
 
             for flag in matching_flags:
-                index = int(round(math.log(flag.value, 2)))
-                # Flags are binary values, so just print whether value is non-zero.
-                try:
-                    print '\t%s: %d' % (flag.name, int(final_bin_val[index]) > 0)
-                except IndexError:
-                    self.logger.warning(flag)
-                    self.logger.warning(index)
-                    self.logger.warning(final_bin_val)
-                    raise
+                # Flags are binary values, so just print whether they're set.
+                print '\t%s: %d' % (flag.name, self.test_flag(flag, final_val))
 
     def set_fields(self, fields, data):
         """Given an array of data and field names, create corresponding attributes
@@ -161,7 +181,9 @@ class DDSBase(object):
 
         Args:
             fields (list of field namedtuples): Fields to set/attributes to create
-            data (list of data values to assign to the created fields/attributes
+            data (list of ints): DWORDs to assign to the created fields/attributes,
+                as unpacked by get_struct(). Fields spanning several DWORDs are
+                combined into a single (little-endian) int.
 
         Returns:
             None.
@@ -170,6 +192,46 @@ class DDSBase(object):
             None.
         """
 
-        for index, field in enumerate(fields):
-            # Convert the data from ASCII representation to int
-            self.__dict__[field.name] = int(self.swap_endian_hex_str(data[index].encode('hex')), 16)
+        index = 0
+        for field in fields:
+            count = field.byte_size // self.DWORD
+            if count == 1:
+                value = data[index]
+            else:
+                value = 0
+                for dword in reversed(data[index:index + count]):
+                    value = (value << 32) | dword
+            self.__dict__[field.name] = value
+            index += count
+
+    def get_fields(self, fields):
+        """Get the values of some fields as DWORDs, ready to be packed by get_struct().
+        This is the inverse of set_fields().
+
+        Args:
+            fields (list of field namedtuples): Fields to get.
+
+        Returns:
+            data (list of ints): DWORDs making up the fields.
+
+        Raises:
+            None.
+        """
+
+        data = []
+        for field in fields:
+            value = getattr(self, field.name, 0)
+            for _ in xrange(field.byte_size // self.DWORD):
+                data.append(value & 0xffffffff)
+                value >>= 32
+        return data
+
+    def unpack(self, buff):
+        """Set all the fields from their packed representation (as found in a .dds file)."""
+
+        self.set_fields(self.fields, self.get_struct(self.fields).unpack(buff))
+
+    def pack(self):
+        """Get the packed representation (as found in a .dds file) of all the fields."""
+
+        return self.get_struct(self.fields).pack(*self.get_fields(self.fields))
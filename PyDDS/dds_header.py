@@ -5,6 +5,7 @@
 """
 
 import logging
+import struct
 from . import dds_base
 from . import pixelformat
 from . import dx
@@ -20,6 +21,9 @@ class DDSHeader(dds_base.DDSBase):
     # Can't easily get around the fact we have to split everyting
     # up around pixelformat
 
+    # 'DDS ', read as a little-endian DWORD
+    MAGIC = struct.unpack('<I', 'DDS ')[0]
+
     def __init__(self):
         super(DDSHeader, self).__init__()
 
@@ -71,22 +75,47 @@ class DDSHeader(dds_base.DDSBase):
                       self.dds_flag('dwCaps2', 'DDSCAPS2_CUBEMAP_NEGATIVEZ', 0x8000),
                       self.dds_flag('dwCaps2', 'DDSCAPS2_CUBEMAP_VOLUME', 0x200000)]
 
-        # Describe how the header is packed in the dds file
-        self.before_pixelformat_packed_fmt = ''.join([str(field.byte_size) + 's' \
-                                                      for field in self.fields_before_pixelformat])
+        # Describe how the header (including pixelformat) is packed in the dds file
+        self.packed_fields = self.fields_before_pixelformat + self.pixelformat.fields + self.fields_after_pixelformat
+        self.struct = self.get_struct(self.packed_fields)
+
+    def unpack(self, buff):
+        """Set all the fields (including pixelformat's) from the first DDS_HEADER.size bytes of a .dds file."""
+
+        data = self.struct.unpack(buff)
+        before_count = self.before_pixelformat_size // self.DWORD
+        after_start = before_count + self.pixelformat.size // self.DWORD
 
-        self.after_pixelformat_packed_fmt = ''.join([str(field.byte_size) + 's' \
-                                                     for field in self.fields_after_pixelformat])
+        self.set_fields(self.fields_before_pixelformat, data[:before_count])
+        self.pixelformat.set_fields(self.pixelformat.fields, data[before_count:after_start])
+        self.set_fields(self.fields_after_pixelformat, data[after_start:])
 
-        self.packed_fmt = self.before_pixelformat_packed_fmt \
-                          + self.pixelformat.packed_fmt \
-                          + self.after_pixelformat_packed_fmt
+    def pack(self):
+        """Get the packed representation (as found in a .dds file) of all the fields, including pixelformat's."""
+
+        return self.struct.pack(*(self.get_fields(self.fields_before_pixelformat) +
+                                  self.pixelformat.get_fields(self.pixelformat.fields) +
+                                  self.get_fields(self.fields_after_pixelformat)))
 
     @property
     def format(self):
-        """Get the format described in the dds header."""
-        field_size_bits = [_field.byte_size for _field in self.pixelformat.fields \
-                           if _field.name == 'dwFourCC'][0] * 8
-
-        dds_format = self.convert_to_ascii(self.pixelformat.dwFourCC, field_size_bits)[::-1]
-        return dx.DDS_FMT2STR[dds_format]
+        """Get the format described in the dds header.
+
+        Returns:
+            format (string): Name of the format, or None if the pixel format is described by bit
+                masks (DDPF_FOURCC isn't set) or its FourCC is unknown. Besides four-character
+                codes, the FourCC may be the (numeric) value of a D3DFORMAT (e.g. 113 for
+                DXGI_FORMAT_R16G16B16A16_FLOAT).
+        """
+
+        if not self.pixelformat.get_flag_value('dwFlags', 'DDPF_FOURCC'):
+            return None
+
+        fourcc = self.pixelformat.dwFourCC
+        if fourcc in dx.DDS_FMT2STR:
+            return dx.DDS_FMT2STR[fourcc]
+
+        dds_format = dx.DDS_FMT2STR.get(struct.pack('<I', fourcc))
+        if dds_format is None:
+            self.logger.warning('Unknown FourCC: %#x (%r).', fourcc, struct.pack('<I', fourcc))
+        return dds_format
@@ -0,0 +1,160 @@
+#!/usr/bin/python
+"""disk_cache.py
+    - Keep decoded textures on disk (as .npy files), so unchanged
+      textures are memory-mapped rather than decoded again, from one run to the next.
+"""
+
+import os
+import hashlib
+import tempfile
+from . import block_compression
+from . import texture_cache
+
+
+class DiskCache(object):
+    """Responsible for caching decoded subresources in a directory, as .npy files.
+
+    Entries are named after a hash of the whole .dds file (headers and payload), the
+    decoder version (see block_compression.DECODER_VERSION) and the subresource, so a
+    renamed copy of a file is still a hit, and a changed file or decoder is a miss.
+    When the cache grows over its budget, the least recently used entries (by modification
+    time, which is updated on each hit) are deleted.
+    """
+
+    # Extension of the cached files
+    EXTENSION = '.npy'
+    # Size of the chunks files are hashed in, in bytes
+    HASH_CHUNK_SIZE = 2**20
+    # Default budget, in bytes
+    DEFAULT_MAX_BYTES = 2**30
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        """Open (creating it, if needed) a cache directory.
+
+        Args:
+            directory (string): Directory the decoded data is kept in.
+            max_bytes (int): Budget of the cache: the total size (in bytes) of the files
+                it holds. Least recently used files are deleted to stay within it.
+        """
+
+        block_compression.require_numpy('cache decoded textures')
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @classmethod
+    def get_content_hash(cls, fname):
+        """Hash the whole content of a file (SHA-1, as a hex string)."""
+
+        content_hash = hashlib.sha1()
+        with open(fname, 'rb') as fhandle:
+            for chunk in iter(lambda: fhandle.read(cls.HASH_CHUNK_SIZE), ''):
+                content_hash.update(chunk)
+        return content_hash.hexdigest()
+
+    def get_cache_name(self, content_hash, mip=0, face=0, array_index=0):
+        """Name of the file holding a decoded subresource."""
+
+        return os.path.join(self.directory, '%s_v%d_%d_%d_%d%s' % (content_hash, block_compression.DECODER_VERSION,
+                                                                   array_index, face, mip, self.EXTENSION))
+
+    def get(self, fname, mip=0, face=0, array_index=0):
+        """Get the decoded data of a subresource, decoding (and caching) it only if it isn't cached.
+
+        Args:
+            fname (string): Name of the .dds file.
+            mip (int): Mip level.
+            face (int): Cubemap face (0 if not a cubemap).
+            array_index (int): Array slice.
+
+        Returns:
+            decomp_data (numpy array): The decoded data (as returned by PyDDS.decompress_subresource()).
+                On a hit, a read-only memory map of the cached file.
+
+        Raises: See PyDDS.decompress_subresource().
+        """
+
+        np = block_compression.np
+        cache_name = self.get_cache_name(self.get_content_hash(fname), mip, face, array_index)
+
+        try:
+            decomp_data = np.load(cache_name, mmap_mode='r')
+        except (IOError, ValueError):
+            # Not cached (or left incomplete by a crash, in which case it's overwritten)
+            pass
+        else:
+            os.utime(cache_name, None)
+            self.hits += 1
+            return decomp_data
+
+        self.misses += 1
+        decomp_data = texture_cache.TextureCache.load(fname, mip, face, array_index)
+        self.put(cache_name, decomp_data)
+        return decomp_data
+
+    def put(self, cache_name, decomp_data):
+        """Write some decoded data to the cache, then evict files to get back within the budget.
+
+        The data is written to a temporary file that's renamed into place, so other
+        processes sharing the cache never see a partial file.
+        """
+
+        fd, temp_name = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as fhandle:
+                block_compression.np.save(fhandle, decomp_data)
+            os.rename(temp_name, cache_name)
+        finally:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+
+        self.evict(keep=cache_name)
+
+    def get_entries(self):
+        """List the cached files, as (modification time, size, file name), least recently used first."""
+
+        entries = []
+        for fname in os.listdir(self.directory):
+            if fname.endswith(self.EXTENSION):
+                fname = os.path.join(self.directory, fname)
+                try:
+                    stat = os.stat(fname)
+                except OSError:
+                    # Evicted by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, fname))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """Delete the least recently used files, until the cache is within its budget.
+
+        Args:
+            keep (string): If set, a file not to delete (e.g. the one just added).
+        """
+
+        entries = self.get_entries()
+        size = sum(entry[1] for entry in entries)
+        for _, file_size, fname in entries:
+            if size <= self.max_bytes:
+                break
+            if fname == keep:
+                continue
+            try:
+                os.remove(fname)
+            except OSError:
+                # Evicted by another process
+                pass
+            size -= file_size
+            self.evictions += 1
+
+    def get_stats(self):
+        """Get the counters of the cache, as a dict."""
+
+        entries = self.get_entries()
+        return {'hits' : self.hits, 'misses' : self.misses, 'evictions' : self.evictions,
+                'entries' : len(entries), 'size' : sum(entry[1] for entry in entries), 'max_bytes' : self.max_bytes}
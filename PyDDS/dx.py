@@ -2,6 +2,9 @@
     - Define a bunch of DirectX enums and mapping functions.
 """
 
+from collections import namedtuple
+import re
+
 # Described in DDS_PIXELFORMAT
 DXGI_FORMAT_BC1_UNORM = "DXT1"
 DXGI_FORMAT_BC2_UNORM = "DXT3"
@@ -29,8 +32,8 @@ D3DFMT_YUY2 = "YUY2"
 D3DFMT_CxV8U8 = 117
 # pylint: enable=invalid-name
 
-# Dummy value I'm adding to explicitly indicate format is in DXT10_HEADER
-DXT10 = "DXT10"
+# Indicates the format is actually described in DXT10_HEADER
+DXT10 = "DX10"
 
 DDS_FMT2STR = {DXGI_FORMAT_BC1_UNORM : 'DXGI_FORMAT_BC1_UNORM',
                DXGI_FORMAT_BC2_UNORM : 'DXGI_FORMAT_BC2_UNORM',
@@ -443,3 +446,73 @@ DXT10_STR2FMT = {'DXGI_FORMAT_UNKNOWN' : DXGI_FORMAT_UNKNOWN,
                  'DXGI_FORMAT_V208' : DXGI_FORMAT_V208,
                  'DXGI_FORMAT_V408' : DXGI_FORMAT_V408,
                  'DXGI_FORMAT_FORCE_UINT' : DXGI_FORMAT_FORCE_UINT}
+
+
+# Values of resourceDimension, in DXT10_HEADER
+DDS_DIMENSION_TEXTURE1D = 2
+DDS_DIMENSION_TEXTURE2D = 3
+DDS_DIMENSION_TEXTURE3D = 4
+
+# How a format lays out its pixels: each block of
+# block_width x block_height pixels takes up bytes_per_block bytes.
+FormatLayout = namedtuple('FormatLayout', 'block_width block_height bytes_per_block')
+
+# Formats whose layout can't be derived from the bit widths in their name
+FORMAT_LAYOUTS = {'BC1' : FormatLayout(4, 4, 8),
+                  'BC2' : FormatLayout(4, 4, 16),
+                  'BC3' : FormatLayout(4, 4, 16),
+                  'BC4' : FormatLayout(4, 4, 8),
+                  'BC5' : FormatLayout(4, 4, 16),
+                  'BC6H' : FormatLayout(4, 4, 16),
+                  'BC7' : FormatLayout(4, 4, 16),
+                  'D3DFMT_DXT2' : FormatLayout(4, 4, 16),
+                  'D3DFMT_DXT4' : FormatLayout(4, 4, 16),
+                  'DXGI_FORMAT_R8G8_B8G8_UNORM' : FormatLayout(2, 1, 4),
+                  'DXGI_FORMAT_G8R8_G8B8_UNORM' : FormatLayout(2, 1, 4),
+                  'DXGI_FORMAT_YUY2' : FormatLayout(2, 1, 4),
+                  'D3DFMT_YUY2' : FormatLayout(2, 1, 4),
+                  'D3DFMT_UYVY' : FormatLayout(2, 1, 4),
+                  'DXGI_FORMAT_Y210' : FormatLayout(2, 1, 8),
+                  'DXGI_FORMAT_Y216' : FormatLayout(2, 1, 8),
+                  'DXGI_FORMAT_AYUV' : FormatLayout(1, 1, 4),
+                  'DXGI_FORMAT_Y410' : FormatLayout(1, 1, 4),
+                  'DXGI_FORMAT_Y416' : FormatLayout(1, 1, 8),
+                  'DXGI_FORMAT_AI44' : FormatLayout(1, 1, 1),
+                  'DXGI_FORMAT_IA44' : FormatLayout(1, 1, 1),
+                  'DXGI_FORMAT_R1_UNORM' : FormatLayout(8, 1, 1),
+                  'D3DFMT_CxV8U8' : FormatLayout(1, 1, 2)}
+
+# Formats storing each plane separately, which a single FormatLayout can't describe
+PLANAR_FORMATS = set(['DXGI_FORMAT_NV12', 'DXGI_FORMAT_P010', 'DXGI_FORMAT_P016', 'DXGI_FORMAT_420_OPAQUE',
+                      'DXGI_FORMAT_NV11', 'DXGI_FORMAT_P208', 'DXGI_FORMAT_V208', 'DXGI_FORMAT_V408'])
+
+# Bit width of each component in a format's name (e.g. R8, G8, B8, A8 in R8G8B8A8_UNORM)
+COMPONENT_BITS = re.compile(r'(?<![A-Z])[RGBADSXEP](\d+)')
+
+
+def get_format_layout(format_name):
+    """Get the layout of some format.
+
+    Args:
+        format_name (string): Name of the format (e.g. 'DXGI_FORMAT_BC1_UNORM').
+
+    Returns:
+        layout (FormatLayout): The layout of the format, or None if it's unknown (or planar).
+    """
+
+    match = re.match(r'DXGI_FORMAT_(BC\d+H?)_', format_name)
+    if match:
+        return FORMAT_LAYOUTS[match.group(1)]
+
+    if format_name in FORMAT_LAYOUTS:
+        return FORMAT_LAYOUTS[format_name]
+
+    if format_name in PLANAR_FORMATS:
+        return None
+
+    if format_name.startswith('DXGI_FORMAT_'):
+        bits = sum([int(width) for width in COMPONENT_BITS.findall(format_name[len('DXGI_FORMAT_'):])])
+        if bits and bits % 8 == 0:
+            return FormatLayout(1, 1, bits // 8)
+
+    return None
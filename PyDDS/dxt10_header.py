@@ -34,8 +34,11 @@ class DXT10Header(dds_base.DDSBase):
                       self.dds_flag('miscFlags2', 'DDS_ALPHA_MODE_OPAQUE', 0x3),
                       self.dds_flag('miscFlags2', 'DDS_ALPHA_MODE_CUSTOM', 0x4)]
 
-        self.packed_fmt = ''.join([str(field.byte_size) + 's' \
-                                   for field in self.fields])
+        # The alpha mode is a 3-bit enum, rather than a set of bits
+        self.enum_masks = {'miscFlags2' : 0x7}
+
+        # Describe how the fields are packed in the dds file
+        self.struct = self.get_struct(self.fields)
 
         self.valid = False
 
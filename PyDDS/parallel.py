@@ -0,0 +1,125 @@
+#!/usr/bin/python
+"""parallel.py
+    - Decompress block-compressed data on several cores at once,
+      splitting it into bands of block rows.
+"""
+
+import multiprocessing
+import multiprocessing.pool
+import multiprocessing.sharedctypes
+from . import block_compression
+
+# Settings of BlockCompression that affect decompression, and must be passed on to worker processes
+SETTINGS = ('reconstruct_z', 'color_expansion', 'share_palettes')
+
+# State of each worker process, set up by init_worker()
+worker_state = {}
+
+
+def get_bands(num_blocks, blocks_per_band):
+    """Split some number of blocks into bands, as (start, end) block indices."""
+    return [(start, min(start + blocks_per_band, num_blocks)) for start in xrange(0, num_blocks, blocks_per_band)]
+
+
+def init_worker(surface_format, settings, comp_data, block_size, decomp_data, dtype, block_decomp_size):
+    """Set up a worker process: view the shared buffers, and look up the decompressor.
+
+    Args:
+        surface_format (string): Format of the data (a key of BlockCompression.decompressors).
+        settings (dict): Values of the BlockCompression SETTINGS.
+        comp_data (multiprocessing RawArray): Shared compressed data.
+        block_size (int): Size of each compressed block, in bytes.
+        decomp_data (multiprocessing RawArray): Shared buffer the decompressed data is written to.
+        dtype (string): Type of the decompressed data.
+        block_decomp_size (int): Number of elements each block decompresses to.
+    """
+
+    np = block_compression.np
+    compression = block_compression.BlockCompression()
+    for name, value in settings.iteritems():
+        setattr(compression, name, value)
+
+    worker_state['decompressor'] = compression.decompressors[surface_format]
+    worker_state['comp_blocks'] = np.frombuffer(comp_data, dtype=np.uint8).reshape(-1, block_size)
+    worker_state['decomp_data'] = np.frombuffer(decomp_data, dtype=dtype)
+    worker_state['block_decomp_size'] = block_decomp_size
+
+
+def decompress_band(band):
+    """Decompress a band of blocks (in a worker process), writing the result to the shared buffer."""
+
+    start, end = band
+    block_decomp_size = worker_state['block_decomp_size']
+    worker_state['decomp_data'][start * block_decomp_size:end * block_decomp_size] = \
+        worker_state['decompressor'](worker_state['comp_blocks'][start:end])
+
+
+def decompress(compression, surface_format, comp_data, block_size, blocks_per_row, workers=None,
+               use_processes=False, bands_per_worker=4):
+    """Decompress some block-compressed data in parallel, in bands of block rows.
+
+    Every block is decompressed independently, so the result is identical to
+    decompressing everything at once.
+
+    Args:
+        compression (BlockCompression): Decompresses the data.
+        surface_format (string): Format of the data (a key of compression.decompressors).
+        comp_data (list of ints, buffer or numpy array): Compressed data.
+        block_size (int): Size of each compressed block, in bytes.
+        blocks_per_row (int): Number of blocks in each row of blocks. Bands are made of whole rows.
+        workers (int): Number of threads/processes. Defaults to the number of CPUs.
+        use_processes (bool): If set, use a pool of processes, sharing the compressed and
+            decompressed data through shared memory. Otherwise, use a pool of threads
+            (numpy releases the GIL for much of the work).
+        bands_per_worker (int): Number of bands to split the work into, per worker.
+
+    Returns:
+        decomp_data (numpy array): Decompressed data, as returned by the decompressor of the format.
+    """
+
+    block_compression.require_numpy('decompress data in parallel')
+    np = block_compression.np
+    workers = workers or multiprocessing.cpu_count()
+    decompressor = compression.decompressors[surface_format]
+    comp_blocks = compression.to_block_array(comp_data, block_size)
+    num_blocks = comp_blocks.shape[0]
+
+    rows_per_band = max(1, -(-num_blocks // (blocks_per_row * workers * bands_per_worker)))
+    bands = get_bands(num_blocks, rows_per_band * blocks_per_row)
+
+    # Decompress the first band right away, to find out the type and size of the output
+    first_band = decompressor(comp_blocks[bands[0][0]:bands[0][1]])
+    block_decomp_size = first_band.size // (bands[0][1] - bands[0][0])
+
+    if use_processes and len(bands) > 1:
+        shared_comp_data = multiprocessing.sharedctypes.RawArray('B', comp_blocks.size)
+        np.frombuffer(shared_comp_data, dtype=np.uint8)[:] = comp_blocks.reshape(-1)
+        shared_decomp_data = multiprocessing.sharedctypes.RawArray('B', num_blocks * block_decomp_size *
+                                                                   first_band.dtype.itemsize)
+        decomp_data = np.frombuffer(shared_decomp_data, dtype=first_band.dtype)
+
+        settings = dict([(name, getattr(compression, name)) for name in SETTINGS])
+        pool = multiprocessing.Pool(workers, init_worker, (surface_format, settings, shared_comp_data, block_size,
+                                                           shared_decomp_data, first_band.dtype.str, block_decomp_size))
+        try:
+            pool.map(decompress_band, bands[1:])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        decomp_data = np.empty(num_blocks * block_decomp_size, dtype=first_band.dtype)
+
+        def decompress_thread_band(band):
+            """Decompress a band of blocks, writing the result to decomp_data."""
+            start, end = band
+            decomp_data[start * block_decomp_size:end * block_decomp_size] = decompressor(comp_blocks[start:end])
+
+        pool = multiprocessing.pool.ThreadPool(workers)
+        try:
+            pool.map(decompress_thread_band, bands[1:])
+        finally:
+            pool.close()
+            pool.join()
+
+    decomp_data[0:first_band.size] = first_band
+    return decomp_data
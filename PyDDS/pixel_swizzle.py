@@ -4,26 +4,43 @@
       into different configurations.
 """
 
+import logging
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
 class PixelSwizzle(object):
     """Responsible for handling swizzling of pixel data."""
 
-    # pylint: disable=too-few-public-methods
-    # WIP. More to be added later.
+    # Index permutations, cached per layout (see get_permutation())
+    permutations = {}
+    max_cached_permutations = 64
 
     @staticmethod
     def swizzle_decompressed_bc1_to_png(data, width):
         """Given decompressed BC1 texture data,
         re-arrange to a layout compatible with what is expected
-        in the .png file format."""
+        in the .png file format.
+
+        Args:
+            data (list of ints or numpy array): Decompressed data, ordered block by block.
+                Only whole rows of blocks are re-arranged.
+            width (int): Width of the image, in pixels. Partial blocks at the
+                right edge are cropped.
 
-        # TODO: Generalize this method?
+        Returns:
+            swizzled_data (list of ints): Rows of RGBA pixels, one after the other.
+        """
 
         # A decompressed block of BC1 data represents
         # a 4x4 region of screenspace.
-        # Each pixel has 3 components, where each component
+        # Each pixel has 4 components, where each component
         # is 1 byte. So each decompressed block is
-        # 16 pixels * 3 components/pixel * 1 byte/component =
-        # 48 bytes.
+        # 16 pixels * 4 components/pixel * 1 byte/component =
+        # 64 bytes.
         #
         # When we write the data to a png file, though,
         # it's expecting everything to be divided into
@@ -47,24 +64,254 @@ class PixelSwizzle(object):
         #
         # where bNrM = block N, row M (of that block)
 
-        # BOZO: Consider class defining/using class attributes
         bytes_per_block = 16 * 4 * 1
         rows_per_block = 4
-        blocks_per_row = width / 4
+        blocks_per_row = -(-width // 4)
         bytes_per_block_row = bytes_per_block / rows_per_block
-        swizzled_data = []
+        bytes_per_row = width * 4
+
+        if len(data) % (bytes_per_block * blocks_per_row):
+            logging.getLogger(__name__).warning('Dropping %d bytes that do not make up a whole row of blocks.',
+                                                len(data) % (bytes_per_block * blocks_per_row))
+
+        if np is not None:
+            return PixelSwizzle.untile(data, width).ravel().tolist()
+
         blocks = [data[i:i+bytes_per_block] for i in xrange(0, len(data), bytes_per_block)]
 
         # Each row contains data from 'blocks_per_row' blocks.
         # This is the granularity we will be re-arranging everything.
         # For each group of blocks, grab the first row of each block, then
         # the second row, etc.
-
+        swizzled_data = []
         for chunk_of_blocks in zip(*(iter(blocks),) * (blocks_per_row)):
             for row_index in xrange(0, rows_per_block):
                 row_start = row_index * bytes_per_block_row
-                swizzled_data = swizzled_data + [block[row_start:(row_start+bytes_per_block_row)] \
-                                                   for block in chunk_of_blocks]
+                row = []
+                for block in chunk_of_blocks:
+                    row.extend(block[row_start:(row_start+bytes_per_block_row)])
+                swizzled_data.extend(row[:bytes_per_row])
+
+        return swizzled_data
+
+    @staticmethod
+    def untile(data, width, height=None, block_width=4, block_height=4, pixel_size=4):
+        """Re-arrange data from block order into rows of pixels (i.e. linear order),
+        with a single array permutation.
+
+        Args:
+            data (numpy array or list): Data ordered block by block, and row by row
+                within each block (e.g. decompressed BCn data).
+            width (int): Width of the image, in pixels. Need not be a multiple of block_width:
+                partial blocks on the right edge are cropped.
+            height (int): Height of the image, in pixels. Need not be a multiple of block_height:
+                partial blocks on the bottom edge are cropped. If not provided, every whole row
+                of blocks in data is used.
+            block_width (int): Width of each block, in pixels.
+            block_height (int): Height of each block, in pixels.
+            pixel_size (int): Number of elements (e.g. bytes, or components) of each pixel.
+
+        Returns:
+            image (numpy array): Array of shape (height, width, pixel_size). This is a view
+                of data whenever possible.
+
+        Raises:
+            ValueError: If data is too short for the given height.
+        """
+
+        data = np.asarray(data).reshape(-1)
+        blocks_wide = -(-width // block_width)
+        block_row_size = blocks_wide * block_width * block_height * pixel_size
+
+        if height is None:
+            blocks_high = data.size // block_row_size
+            height = blocks_high * block_height
+        else:
+            blocks_high = -(-height // block_height)
+            if data.size < blocks_high * block_row_size:
+                raise ValueError, 'Need %d elements for a %dx%d image, but only got %d.' % \
+                    (blocks_high * block_row_size, width, height, data.size)
+
+        blocks = data[:blocks_high * block_row_size].reshape(blocks_high, blocks_wide,
+                                                             block_height, block_width, pixel_size)
+        image = blocks.transpose(0, 2, 1, 3, 4).reshape(blocks_high * block_height,
+                                                        blocks_wide * block_width, pixel_size)
+        return image[:height, :width]
+
+    @staticmethod
+    def tile(image, block_width=4, block_height=4):
+        """Re-arrange rows of pixels (i.e. linear order) into blocks, with a single array permutation.
+        This is the inverse of untile(), as needed by encoders.
+
+        Args:
+            image (numpy array): Array of shape (height, width, pixel_size), or (height, width).
+                Dimensions that aren't a multiple of the block dimensions are padded
+                by repeating the last row/column.
+            block_width (int): Width of each block, in pixels.
+            block_height (int): Height of each block, in pixels.
+
+        Returns:
+            blocks (numpy array): Array of shape (number of blocks, block_height * block_width, pixel_size).
+                Blocks are ordered row by row, and so are the pixels within each block.
+        """
+
+        image = np.asarray(image)
+        if image.ndim == 2:
+            image = image[..., np.newaxis]
+
+        height, width, pixel_size = image.shape
+        pad_height = -height % block_height
+        pad_width = -width % block_width
+        if pad_height or pad_width:
+            image = np.pad(image, ((0, pad_height), (0, pad_width), (0, 0)), 'edge')
+            height, width = image.shape[0:2]
+
+        blocks = image.reshape(height // block_height, block_height, width // block_width, block_width, pixel_size)
+        return blocks.transpose(0, 2, 1, 3, 4).reshape(-1, block_height * block_width, pixel_size)
+
+    @staticmethod
+    def get_morton_indices(x, y, width, height):
+        """Get the Morton (Z-order) index of some coordinates.
+
+        The bits of x and y are interleaved (starting with x) for as many bits as the
+        smallest dimension has. The remaining bits of the largest dimension go above.
+
+        Args:
+            x (numpy array): Column of each element.
+            y (numpy array): Row of each element.
+            width (int): Width of the grid. Must be a power of 2.
+            height (int): Height of the grid. Must be a power of 2.
+
+        Returns:
+            indices (numpy array): Morton index of each element.
+        """
+
+        shared_bits = min(width, height).bit_length() - 1
+        indices = np.zeros(np.shape(x), dtype=np.int64)
+        for bit in xrange(shared_bits):
+            indices |= ((x >> bit) & 1) << (2 * bit)
+            indices |= ((y >> bit) & 1) << (2 * bit + 1)
+
+        if width > height:
+            indices |= (x >> shared_bits) << (2 * shared_bits)
+        else:
+            indices |= (y >> shared_bits) << (2 * shared_bits)
+        return indices
+
+    @classmethod
+    def get_permutation(cls, mode, width, height, tile_width=8, tile_height=8, tile_order='linear'):
+        """Get where each element of a swizzled layout is stored.
+
+        Supported modes:
+            'linear': Row by row (i.e. no swizzling).
+            'morton': Morton (Z-order). The grid is padded to powers of 2.
+            'tiled': Macro-tiles of tile_width x tile_height elements, stored row by row.
+                Within each tile, elements are stored in tile_order ('linear' or 'morton').
+                The grid is padded to whole tiles.
+
+        Permutations are computed once per layout, then cached.
+
+        Args:
+            mode (string): Swizzle mode.
+            width (int): Width of the grid, in elements (e.g. pixels, or compressed blocks).
+            height (int): Height of the grid, in elements.
+            tile_width (int): Width of each macro-tile, in elements ('tiled' only).
+            tile_height (int): Height of each macro-tile, in elements ('tiled' only).
+            tile_order (string): Order of the elements within each macro-tile ('tiled' only).
+
+        Returns:
+            source (numpy array): int64 array of shape (height, width). For every element
+                (in linear order), its index in the swizzled layout.
+            stored_count (int): Number of elements in the swizzled layout, including padding.
+
+        Raises:
+            ValueError: If the mode (or tile_order) isn't supported.
+        """
+
+        key = (mode, width, height) + ((tile_width, tile_height, tile_order) if mode == 'tiled' else ())
+        if key in cls.permutations:
+            return cls.permutations[key]
+
+        y, x = np.mgrid[0:height, 0:width].astype(np.int64)
+        if mode == 'linear':
+            source = y * width + x
+            stored_count = width * height
+        elif mode == 'morton':
+            padded_width = 1 << (width - 1).bit_length()
+            padded_height = 1 << (height - 1).bit_length()
+            source = cls.get_morton_indices(x, y, padded_width, padded_height)
+            stored_count = padded_width * padded_height
+        elif mode == 'tiled':
+            tiles_wide = -(-width // tile_width)
+            tiles_high = -(-height // tile_height)
+            tile_index = (y // tile_height) * tiles_wide + x // tile_width
+            if tile_order == 'linear':
+                within_tile = (y % tile_height) * tile_width + x % tile_width
+            elif tile_order == 'morton':
+                if tile_width & (tile_width - 1) or tile_height & (tile_height - 1):
+                    raise ValueError, 'Morton-ordered tiles must be a power of 2 wide and high.'
+                within_tile = cls.get_morton_indices(x % tile_width, y % tile_height, tile_width, tile_height)
+            else:
+                raise ValueError, "Unknown tile order '%s' (expected 'linear' or 'morton')." % tile_order
+            source = tile_index * tile_width * tile_height + within_tile
+            stored_count = tiles_wide * tiles_high * tile_width * tile_height
+        else:
+            raise ValueError, "Unknown swizzle mode '%s' (expected 'linear', 'morton' or 'tiled')." % mode
+
+        if len(cls.permutations) >= cls.max_cached_permutations:
+            cls.permutations.clear()
+        cls.permutations[key] = (source, stored_count)
+        return source, stored_count
+
+    @classmethod
+    def deswizzle(cls, data, width, height, mode='morton', pixel_size=4, block_width=1, block_height=1, **tiling):
+        """Re-arrange swizzled (e.g. console) data into linear order, with a single gather.
+
+        Args:
+            data (numpy array or list): Swizzled data.
+            width (int): Width of the image, in pixels.
+            height (int): Height of the image, in pixels.
+            mode (string): Swizzle mode (see get_permutation()).
+            pixel_size (int): Number of elements (e.g. bytes) of each pixel, or of each
+                block if block_width/block_height are set.
+            block_width (int): Width of the unit that's swizzled, in pixels. 1 to swizzle
+                pixels, or e.g. 4 to swizzle compressed blocks.
+            block_height (int): Height of the unit that's swizzled, in pixels.
+            tiling: tile_width, tile_height and tile_order of the 'tiled' mode.
+
+        Returns:
+            linear_data (numpy array): Flat array of the units (pixels or blocks), row by row.
+
+        Raises:
+            ValueError: If the mode isn't supported, or data is too short.
+        """
+
+        source, stored_count = cls.get_permutation(mode, -(-width // block_width), -(-height // block_height),
+                                                   **tiling)
+        units = np.asarray(data).reshape(-1)
+        if units.size < stored_count * pixel_size:
+            raise ValueError, 'Need %d elements for a swizzled %dx%d image, but only got %d.' % \
+                (stored_count * pixel_size, width, height, units.size)
+
+        units = units[:stored_count * pixel_size].reshape(stored_count, pixel_size)
+        return units[source.ravel()].reshape(-1)
+
+    @classmethod
+    def swizzle(cls, data, width, height, mode='morton', pixel_size=4, block_width=1, block_height=1, **tiling):
+        """Re-arrange linear data into a swizzled layout. This is the inverse of deswizzle().
+
+        Args: See deswizzle(), with data in linear order.
+
+        Returns:
+            swizzled_data (numpy array): Flat array of the swizzled units. Padding is zeroed.
+
+        Raises:
+            ValueError: If the mode isn't supported.
+        """
 
-        # Return a flattened list
-        return [element for sublist in swizzled_data for element in sublist]
+        source, stored_count = cls.get_permutation(mode, -(-width // block_width), -(-height // block_height),
+                                                   **tiling)
+        units = np.asarray(data).reshape(-1, pixel_size)
+        swizzled_data = np.zeros((stored_count, pixel_size), dtype=units.dtype)
+        swizzled_data[source.ravel()] = units[:source.size]
+        return swizzled_data.reshape(-1)
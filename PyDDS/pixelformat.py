@@ -37,5 +37,5 @@ class Pixelformat(dds_base.DDSBase):
                       self.dds_flag('dwFlags', 'DDPF_YUV', 0x200),
                       self.dds_flag('dwFlags', 'DDPF_LUMINANCE', 0x20000)]
 
-        self.packed_fmt = ''.join([str(field.byte_size) + 's' \
-                                   for field in self.fields])
+        # Describe how the fields are packed in the dds file
+        self.struct = self.get_struct(self.fields)
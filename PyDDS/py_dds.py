@@ -10,36 +10,181 @@ import sys
 sys.dont_write_bytecode = True
 
 import os
+import ctypes
 import logging
-import struct
+import mmap
+import tempfile
 import png
 from . import dds_header
 from . import dxt10_header
 from . import dds_base
 from . import block_compression
+from . import uncompressed
+from . import channels
 from . import pixel_swizzle
+from . import subresource
+from . import tonemap
+from . import parallel
+from . import dx
+
+# File mode creation mask of the process. It can only be read by setting it, which affects
+# every thread, so it's read once, on import, rather than whenever a file is written.
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+# Flags of MoveFileEx() (Windows), see PyDDS.replace_file()
+MOVEFILE_REPLACE_EXISTING = 0x1
+MOVEFILE_WRITE_THROUGH = 0x8
 
 class PyDDS(dds_base.DDSBase, pixel_swizzle.PixelSwizzle):
     """Reponsible for managing all DirectDrawSurface (.dds) file data."""
 
     ##############################################################
 
-    def __init__(self, fname, debug_level=None):
+    def __init__(self, fname, debug_level=None, use_mmap=False, lazy=False):
+        """Read (and if necessary, decompress) a .dds file.
+
+        Args:
+            fname (string): Name of the file to read in.
+            debug_level (int): If set, logging level to configure.
+            use_mmap (bool): If set, memory-map the file rather than reading it.
+                data is then a read-only numpy view of the mapped payload, which the
+                decoders consume without a copy. The file stays mapped for as long as
+                any view of it is referenced (see close() and read()).
+            lazy (bool): If set, only parse the headers. The payload is read when data
+                is first accessed, and decompressed when decompressed_data is first accessed.
+        """
+
         super(PyDDS, self).__init__(debug_level)
         self.dds_header = dds_header.DDSHeader()
         self.dxt10_header = dxt10_header.DXT10Header()
         self.block_compression = block_compression.BlockCompression()
+        self.uncompressed = uncompressed.UncompressedDecoder()
         self.logger = logging.getLogger(__name__)
         # BOZO: Maybe have a single accessible 'data' attribute, return
         # 'data' vs 'decompressed_data' based on data_is_decompressed flag?
-        # TODO: Consider incorporating numpy?
-        self.data = []
-        self.decompressed_data = []
+        self._data = None
+        self._decompressed_data = None
         self.data_is_decompressed = False
+        self.fname = fname
+        self.use_mmap = use_mmap
+        self.data_offset = 0
+        self.mmap = None
+        self.subresources = None
+        # Number of threads/processes to decompress with (0 for one per CPU), see decompress()
+        self.workers = 1
+        self.use_processes = False
 
         # Read the file and (if necessary) decompress it
-        self.read(fname)
-        self.decompress()
+        self.read(fname, use_mmap, headers_only=lazy)
+        if not lazy:
+            self.decompress()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Let go of the memory-mapped file (if any). data is mapped again on next access.
+
+        The mapping isn't closed explicitly: views of it (e.g. from data or get_subresource_data())
+        may outlive this instance, and keep it alive. It's unmapped once the last one is
+        garbage-collected. Decompressed data that's a view of the mapping (e.g. of typed formats,
+        see UncompressedDecoder.decode_typed()) is dropped too, and decompressed again on next access.
+        """
+
+        if self.mmap is not None:
+            np = block_compression.np
+            if isinstance(self._decompressed_data, np.ndarray) and \
+                    np.may_share_memory(self._decompressed_data, self._data):
+                self._decompressed_data = None
+                self.data_is_decompressed = False
+            self._data = None
+            self.mmap = None
+
+    def release(self, include_data=False):
+        """Drop the decompressed data to free its memory. It's decompressed again on next access.
+
+        Args:
+            include_data (bool): If set, drop the payload too (letting go of the memory-mapped file, if any).
+                It's read back from the file on next access, so any changes made to it are lost.
+        """
+
+        self._decompressed_data = None
+        self.data_is_decompressed = False
+
+        if include_data:
+            self.close()
+            self._data = None
+
+    @property
+    def data(self):
+        """The raw (possibly compressed) payload. Read from the file on first access."""
+
+        if self._data is None:
+            self.read_data()
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = self.to_compact(data)
+
+    @property
+    def decompressed_data(self):
+        """The decompressed pixel data. Decompressed on first access, then cached until release()."""
+
+        if self._decompressed_data is None:
+            self.decompress()
+        return self._decompressed_data
+
+    @decompressed_data.setter
+    def decompressed_data(self, decompressed_data):
+        self._decompressed_data = self.to_compact(decompressed_data)
+
+    @property
+    def pixels(self):
+        """The decompressed image of mip 0, as an array of shape (height, width, 4) (see get_pixels()).
+
+        decompressed_data remains the only copy of the pixels that's kept: this is taken from it on each
+        access. Only for uncompressed formats is it a view of decompressed_data. For block-compressed
+        formats, each access untiles a new copy, so changes made to it (e.g. dds.pixels[..., 3] = 0) are
+        lost unless the image is assigned back (dds.pixels = image, see set_pixels()). Unlike
+        decompressed_data, it's in linear order, so it can be handed to PIL or numpy as is
+        (see __array_interface__).
+        """
+
+        return self.get_pixels()
+
+    @pixels.setter
+    def pixels(self, image):
+        self.set_pixels(image)
+
+    @property
+    def __array_interface__(self):
+        """Expose pixels through the numpy array interface, e.g. for numpy.asarray(dds) or
+        PIL.Image.fromarray(dds). The array handed over is pixels itself, so for block-compressed
+        formats it's a new copy of mip 0 (see pixels): edits to it must be assigned back."""
+
+        pixels = self.pixels
+        interface = dict(pixels.__array_interface__)
+        # Hand over the array itself as the buffer, so that it (rather than this instance)
+        # keeps the memory alive
+        interface['data'] = pixels if pixels.flags.c_contiguous else pixels.copy()
+        del interface['strides']
+        return interface
+
+    @staticmethod
+    def to_compact(values):
+        """Store a list of ints compactly: as a uint8 numpy array, or a bytearray without numpy.
+        Anything else (numpy arrays, buffers, None) is kept as is."""
+
+        if not isinstance(values, list):
+            return values
+        if block_compression.np is None:
+            return bytearray(values)
+        return block_compression.np.array(values, dtype=block_compression.np.uint8)
 
     @property
     def format(self):
@@ -53,25 +198,479 @@ class PyDDS(dds_base.DDSBase, pixel_swizzle.PixelSwizzle):
 
         return surface_format
 
-    def decompress(self):
+    def get_decompressor(self):
+        """Get the function that decodes the payload (or any whole number of blocks of it, e.g.
+        a subresource), given the format: a block decompressor (see BlockCompression.decompressors)
+        or an uncompressed decoder (see UncompressedDecoder.get_decoder()).
+
+        Returns:
+            decompressor (function): The decoder, or None if the format can't be decoded.
+        """
+
+        decompressor = self.block_compression.decompressors.get(self.format)
+        if decompressor is None:
+            decompressor = self.uncompressed.get_decoder(self.format, self.dds_header.pixelformat)
+        return decompressor
+
+    def decompress(self, workers=None, use_processes=None):
         """If the dds data is compressed (according to the format), go ahead and decompress it,
-        storing the results in decompressed_data."""
+        storing the results in decompressed_data.
 
-        if self.format == 'DXGI_FORMAT_BC1_UNORM':
-            self.decompressed_data = self.block_compression.decompress_bc1(self.data)
+        Args:
+            workers (int): If not 1, split the data into bands of block rows and decompress
+                them in parallel (see parallel.decompress()). 0 means one worker per CPU.
+                Defaults to the workers attribute. The result is identical either way.
+            use_processes (bool): If set, decompress in a pool of processes rather than threads.
+                Defaults to the use_processes attribute.
+        """
+
+        decompressor = self.get_decompressor()
+        workers = self.workers if workers is None else workers
+        use_processes = self.use_processes if use_processes is None else use_processes
+
+        if decompressor is None:
+            self.decompressed_data = []
+        elif workers != 1 and block_compression.np is not None and self.subresources is not None and \
+                self.format in self.block_compression.decompressors:
+            block_size = self.subresources.layout.bytes_per_block
+            blocks_per_row = self.subresources.get().row_pitch // block_size
+            self.decompressed_data = parallel.decompress(self.block_compression, self.format, self.data,
+                                                         block_size, blocks_per_row, workers, use_processes)
+            self.data_is_decompressed = True
+        else:
+            self.decompressed_data = decompressor(self.data)
             self.data_is_decompressed = True
 
-    def write_to_png(self, fname):
-        """Write out the pixel data to a .png file."""
+    def build_subresource_index(self):
+        """Locate every subresource (array slice, cubemap face, mip level) in the payload,
+        storing the resulting subresource.SubresourceIndex in subresources.
+
+        subresources is left as None if the layout of the format isn't known.
+        """
+
+        header = self.dds_header
+        pixelformat = header.pixelformat
+        self.subresources = None
+
+        if int(pixelformat.get_flag_value('dwFlags', 'DDPF_FOURCC')):
+            # Unknown FourCCs have no format
+            layout = dx.get_format_layout(self.format) if self.format is not None else None
+        elif pixelformat.dwRGBBitCount:
+            layout = dx.FormatLayout(1, 1, pixelformat.dwRGBBitCount // 8)
+        else:
+            layout = None
+
+        if layout is None:
+            self.logger.warning('Unknown layout, subresources are not indexed.')
+            return
+
+        array_size = 1
+        face_count = 1
+        depth = 1
+        if self.dxt10_header.valid:
+            array_size = self.dxt10_header.arraySize
+            if self.dxt10_header.get_flag_value('miscFlag', 'DDS_RESOURCE_MISC_TEXTURECUBE'):
+                face_count = 6
+            if self.dxt10_header.resourceDimension == dx.DDS_DIMENSION_TEXTURE3D:
+                depth = header.dwDepth
+        else:
+            if header.get_flag_value('dwCaps2', 'DDSCAPS2_CUBEMAP'):
+                # Only the faces that are present are stored
+                face_count = sum([header.get_flag_value('dwCaps2', 'DDSCAPS2_CUBEMAP_%s' % face) \
+                                  for face in ('POSITIVEX', 'NEGATIVEX', 'POSITIVEY',
+                                               'NEGATIVEY', 'POSITIVEZ', 'NEGATIVEZ')])
+            if header.get_flag_value('dwCaps2', 'DDSCAPS2_CUBEMAP_VOLUME'):
+                depth = header.dwDepth
+
+        self.subresources = subresource.SubresourceIndex(layout, header.dwWidth, header.dwHeight, depth,
+                                                         header.dwMipMapCount, array_size, face_count)
+
+    def get_subresource_data(self, mip=0, face=0, array_index=0):
+        """Slice a single subresource out of the (raw) payload.
+
+        Args:
+            mip (int): Mip level.
+            face (int): Cubemap face (0 if not a cubemap).
+            array_index (int): Array slice.
+
+        Returns:
+            data: The bytes of the subresource, of the same type as data
+                (a view, rather than a copy, if data is a numpy array).
+
+        Raises:
+            IndexError: If there is no such subresource.
+            ValueError: If subresources aren't indexed.
+        """
+
+        if self.subresources is None:
+            raise ValueError, 'The subresources of this file are not indexed (unknown layout).'
+
+        location = self.subresources.get(mip, face, array_index)
+        return self.data[location.offset:location.offset + location.size]
+
+    def decompress_subresource(self, mip=0, face=0, array_index=0):
+        """Decompress a single subresource, leaving the rest of the payload alone.
+
+        Args: See get_subresource_data().
+
+        Returns:
+            decomp_data: The decompressed data of the subresource (as returned by the
+                decompressor of the format). If the format isn't compressed, the raw data.
+
+        Raises: See get_subresource_data().
+        """
+
+        data = self.get_subresource_data(mip, face, array_index)
+        decompressor = self.get_decompressor()
+        if decompressor is None:
+            return data
+        return decompressor(data)
+
+    def get_decompressed_subresource(self, mip=0, face=0, array_index=0):
+        """Slice a single subresource out of decompressed_data.
+
+        Args: See get_subresource_data().
+
+        Returns:
+            decomp_data (numpy array): A (flat, block ordered) view of the subresource in decompressed_data.
+            location (Subresource): Where the subresource is in the payload.
+
+        Raises:
+            ValueError: If the format can't be decoded.
+            See also get_subresource_data().
+        """
+
+        block_compression.require_numpy('view decompressed data as images')
+        if self.subresources is None:
+            raise ValueError, 'The subresources of this file are not indexed (unknown layout).'
+
+        location = self.subresources.get(mip, face, array_index)
+        decomp_data = self.decompressed_data
+        if not self.data_is_decompressed:
+            raise ValueError, 'Format %s can not be decoded.' % self.format
+
+        layout = self.subresources.layout
+        block_size = layout.block_width * layout.block_height * 4
+        start = location.offset // layout.bytes_per_block * block_size
+        end = start + location.size // layout.bytes_per_block * block_size
+        return block_compression.np.asarray(decomp_data).reshape(-1)[start:end], location
+
+    def get_padded_image(self, decomp_data, location):
+        """View the decompressed data of a subresource as images of whole blocks,
+        of shape (depth, rows of blocks * block height, blocks per row * block width, 4)."""
+
+        layout = self.subresources.layout
+        padded_width = location.row_pitch // layout.bytes_per_block * layout.block_width
+        image = self.untile(decomp_data, padded_width, None, layout.block_width, layout.block_height)
+        return image.reshape(location.depth, -1, padded_width, 4)
+
+    def get_pixels(self, mip=0, face=0, array_index=0):
+        """Get the decompressed image of a subresource, in linear order.
+
+        Args: See get_subresource_data().
+
+        Returns:
+            image (numpy array): Array of shape (height, width, 4), or (depth, height, width, 4) for
+                volume textures, of the type of decompressed_data (e.g. uint8 RGBA). For formats of
+                single pixel "blocks" (i.e. uncompressed formats), this is a view of decompressed_data,
+                so changes to it are changes to decompressed_data. Otherwise, it's a copy (see set_pixels()).
+
+        Raises: See get_decompressed_subresource().
+        """
+
+        decomp_data, location = self.get_decompressed_subresource(mip, face, array_index)
+        image = self.get_padded_image(decomp_data, location)[:, :location.height, :location.width]
+        return image[0] if location.depth == 1 else image
+
+    def set_pixels(self, image, mip=0, face=0, array_index=0):
+        """Replace the decompressed image of a subresource (e.g. after editing the one from get_pixels()).
+
+        Args:
+            image (numpy array): Array of shape (height, width, 4), or (depth, height, width, 4) for
+                volume textures (or anything that broadcasts to it).
+            mip (int): Mip level.
+            face (int): Cubemap face (0 if not a cubemap).
+            array_index (int): Array slice.
+
+        Raises: See get_decompressed_subresource().
+        """
+
+        np = block_compression.np
+        decomp_data, location = self.get_decompressed_subresource(mip, face, array_index)
+        padded_image = self.get_padded_image(decomp_data, location)
+        padded_image[:, :location.height, :location.width] = image
+
+        if not np.may_share_memory(padded_image, decomp_data):
+            # Block ordered data: put the copy back in blocks
+            layout = self.subresources.layout
+            padded_image = padded_image.reshape(-1, padded_image.shape[2], 4)
+            decomp_data[:] = self.tile(padded_image, layout.block_width, layout.block_height).reshape(-1)
+
+    def apply_channel_op(self, operation, *args):
+        """Apply a channel operation (see channels.py) to every pixel of every subresource at once,
+        as a single array operation over decompressed_data.
+
+        Args:
+            operation (function): Operation, called with an array of shape (number of pixels, 4), then args.
+            args: Arguments of the operation.
+
+        Raises:
+            ValueError: If the format can't be decoded.
+            See also the operation.
+        """
+
+        block_compression.require_numpy('edit channels')
+        np = block_compression.np
+        decomp_data = self.decompressed_data
+        if not self.data_is_decompressed:
+            raise ValueError, 'Format %s can not be decoded.' % self.format
+
+        decomp_data = np.asarray(decomp_data)
+        if not decomp_data.flags.writeable:
+            # e.g. a typed view of a memory-mapped payload
+            self.decompressed_data = decomp_data = decomp_data.copy()
+
+        operation(decomp_data.reshape(-1, 4), *args)
+
+    def remap_channels(self, mapping):
+        """Rearrange the channels of every pixel, e.g. 'BGRA' or 'RRR1' (see channels.remap())."""
+        self.apply_channel_op(channels.remap, mapping)
+
+    def fill_channels(self, channel_names, value):
+        """Set some channels (e.g. 'A') of every pixel to a constant value (see channels.fill())."""
+        self.apply_channel_op(channels.fill, channel_names, value)
+
+    def invert_channels(self, channel_names='RGB'):
+        """Invert some channels of every pixel (see channels.invert())."""
+        self.apply_channel_op(channels.invert, channel_names)
+
+    def premultiply_alpha(self):
+        """Multiply the color channels of every pixel by its alpha (see channels.premultiply())."""
+        self.apply_channel_op(channels.premultiply)
+
+    def unpremultiply_alpha(self):
+        """Divide the color channels of every pixel by its alpha (see channels.unpremultiply())."""
+        self.apply_channel_op(channels.unpremultiply)
+
+    def apply_channel_lut(self, lut, channel_names='RGB'):
+        """Map some channels of every pixel through lookup tables (see channels.apply_lut())."""
+        self.apply_channel_op(channels.apply_lut, lut, channel_names)
+
+    def deswizzle_data(self, mode='morton', **tiling):
+        """Re-arrange a payload stored in a swizzled (e.g. console) layout into the usual linear layout.
+
+        Each subresource (in every depth slice) is deswizzled separately, with the format's
+        block (or pixel, if it isn't block-compressed) as the unit. Any decompressed data is released.
+
+        Args:
+            mode (string): Swizzle mode (see PixelSwizzle.get_permutation()).
+            tiling: tile_width, tile_height and tile_order of the 'tiled' mode.
+
+        Returns:
+            None.
+
+        Raises:
+            ValueError: If subresources aren't indexed, the mode isn't supported,
+                or a subresource is too short (e.g. padded to a power of 2 in the file).
+        """
+
+        block_compression.require_numpy('deswizzle data')
+        if self.subresources is None:
+            raise ValueError, 'The subresources of this file are not indexed (unknown layout).'
+
+        layout = self.subresources.layout
+        data = block_compression.np.asarray(self.data, dtype=block_compression.np.uint8)
+        slices = []
+        for location in self.subresources:
+            slice_size = location.size // location.depth
+            for depth_slice in xrange(location.depth):
+                start = location.offset + depth_slice * slice_size
+                slices.append(self.deswizzle(data[start:start + slice_size], location.width, location.height,
+                                             mode, layout.bytes_per_block, layout.block_width,
+                                             layout.block_height, **tiling))
+
+        # Keep anything trailing the subresources as is
+        slices.append(data[self.subresources.size:])
+        self.data = block_compression.np.concatenate(slices)
+        self.release()
+
+    def decompress_region(self, x, y, width, height, mip=0, face=0, array_index=0):
+        """Decode a rectangle of pixels out of a subresource, for any format that has a decoder
+        (see get_decompressor()) and an indexed layout (see subresources): block-compressed, but also
+        e.g. bit-mask or packed pair formats, whose "blocks" are single pixels or pairs of pixels.
+
+        Only the blocks intersecting the rectangle are read and decoded,
+        so the cost is proportional to the size of the rectangle, not of the texture.
+
+        Args:
+            x (int): Left edge of the rectangle, in pixels.
+            y (int): Top edge of the rectangle, in pixels.
+            width (int): Width of the rectangle, in pixels.
+            height (int): Height of the rectangle, in pixels.
+            mip (int): Mip level.
+            face (int): Cubemap face (0 if not a cubemap).
+            array_index (int): Array slice.
+
+        Returns:
+            image (numpy array): Array of shape (height, width, 4), of the type the
+                decoder of the format returns (e.g. uint8, float16 for BC6H, float32 for float formats).
+
+        Raises:
+            IndexError: If there is no such subresource.
+            ValueError: If the format can't be decoded, its layout isn't known, or the
+                rectangle doesn't fit in the subresource.
+        """
+
+        block_compression.require_numpy('decompress a region')
+        decompressor = self.get_decompressor()
+        if decompressor is None or self.subresources is None:
+            raise ValueError, "Can't decompress a region of %s data." % self.format
+
+        location = self.subresources.get(mip, face, array_index)
+        if width <= 0 or height <= 0 or x < 0 or y < 0 or \
+           x + width > location.width or y + height > location.height:
+            raise ValueError, 'Rectangle (%d, %d, %d, %d) does not fit in a %dx%d subresource.' % \
+                (x, y, width, height, location.width, location.height)
+
+        layout = self.subresources.layout
+        first_column = x // layout.block_width
+        last_column = (x + width - 1) // layout.block_width
+        first_row = y // layout.block_height
+        last_row = (y + height - 1) // layout.block_height
+
+        # Gather the intersecting blocks, one row of blocks at a time
+        data = self.data
+        rows = []
+        for row in xrange(first_row, last_row + 1):
+            start = location.offset + row * location.row_pitch + first_column * layout.bytes_per_block
+            end = location.offset + row * location.row_pitch + (last_column + 1) * layout.bytes_per_block
+            rows.append(block_compression.np.asarray(data[start:end], dtype=block_compression.np.uint8))
+
+        decomp_data = decompressor(block_compression.np.concatenate(rows))
+        image = self.untile(decomp_data, (last_column - first_column + 1) * layout.block_width, None,
+                            layout.block_width, layout.block_height)
+
+        left = x - first_column * layout.block_width
+        top = y - first_row * layout.block_height
+        return image[top:top + height, left:left + width]
+
+    def write_to_png(self, fname, tonemap_operator='reinhard', exposure=0.0, bit_depth=8, normalize=False):
+        """Write out the pixel data (of mip 0) to a .png file.
+
+        Rows are handed to the PNG writer as they're generated (see get_png_rows()),
+        so if the data hasn't been decompressed yet (see lazy), only a row of blocks
+        is decompressed at a time, and memory use stays bounded whatever the size of the image.
+
+        Args:
+            fname (string): Name of the file to write.
+            tonemap_operator (string): If the pixel data is HDR (e.g. BC6H, or a float format), name
+                of the operator used to tone-map it (see tonemap.OPERATORS).
+            exposure (float): If the pixel data is HDR (or normalized), exposure adjustment (in stops)
+                applied before tone-mapping.
+            bit_depth (int): Number of bits per component of the .png file (8 or 16).
+            normalize (bool): If set, rather than tone-mapping, linearly map the range of color
+                values of mip 0 to the whole range of the .png file (see tonemap.normalize()),
+                e.g. to preview data textures. The whole of mip 0 is decompressed to find that range.
+        """
+
+        self.logger.info('Creating PNG file: %s (width, height = %d,%d)', \
+                         fname, self.dds_header.dwWidth, self.dds_header.dwHeight)
+
+        # TODO: Check if alpha really does exist in original data. Currently assuming it always does.
+        writer = png.Writer(self.dds_header.dwWidth, self.dds_header.dwHeight, alpha=True, bitdepth=bit_depth)
+
+        with open(fname, 'wb') as fhandle:
+            if block_compression.np is None and bit_depth == 8 and not normalize:
+                writer.write(fhandle, self.get_png_rows_python())
+            else:
+                writer.write_packed(fhandle, self.get_png_rows(tonemap_operator, exposure, bit_depth, normalize))
+
+        self.logger.info('Done creating PNG file.')
+
+    def get_png_rows(self, tonemap_operator='reinhard', exposure=0.0, bit_depth=8, normalize=False):
+        """Generate the rows of pixels of mip 0, one row of blocks at a time.
+
+        If the data has already been decompressed (see decompressed_data), rows are
+        taken from it. Otherwise, each row of blocks is sliced out of the payload and
+        decompressed when it's needed, without caching the result.
+
+        Args: See write_to_png().
+
+        Yields:
+            row (str): A row of pixels, as width * 4 components (RGBA) of bit_depth bits
+                (big-endian, as stored in a .png file).
+        """
+
+        block_compression.require_numpy('write %d-bit or normalized .png files' % bit_depth)
+        np = block_compression.np
+        width = self.dds_header.dwWidth
+        height = self.dds_header.dwHeight
+        decompressor = self.get_decompressor()
+        stream = self._decompressed_data is None and decompressor is not None and self.subresources is not None
+
+        if stream:
+            location = self.subresources.get()
+            layout = self.subresources.layout
+            block_width, block_height = layout.block_width, layout.block_height
+        else:
+            # Figure out which data to write out.
+            # If the decompressed data is valid, use that.
+            data = self.decompressed_data
+            if not self.data_is_decompressed:
+                data = self.data
+
+            assert len(data) > 0, 'data must be something valid at this point.'
+            block_width, block_height = 4, 4
+            if self.subresources is not None:
+                block_width, block_height = self.subresources.layout.block_width, self.subresources.layout.block_height
+
+        def get_values(data):
+            """Get pixel data as an array. Integers other than 16-bit (UNORM) ones are bytes."""
+            data = np.asarray(data)
+            if data.dtype.kind in 'iu' and data.dtype != np.uint16:
+                data = data.astype(np.uint8)
+            return data
+
+        blocks_wide = -(-width // block_width)
+        blocks_high = -(-height // block_height)
+        value_range = None
+        if normalize:
+            if stream:
+                mip_data = self.decompress_subresource()
+            else:
+                mip_data = data[:blocks_wide * blocks_high * block_width * block_height * 4]
+            value_range = tonemap.get_value_range(get_values(mip_data))
+
+        for row in xrange(blocks_high):
+            if stream:
+                start = location.offset + row * location.row_pitch
+                block_row = decompressor(self.data[start:start + location.row_pitch])
+            else:
+                block_row_size = blocks_wide * block_width * block_height * 4
+                block_row = data[row * block_row_size:(row + 1) * block_row_size]
+
+            block_row = self.untile(get_values(block_row), width, None, block_width, block_height)
+            block_row = tonemap.quantize(block_row, bit_depth, tonemap_operator, exposure, value_range)
+            if bit_depth == 16:
+                block_row = block_row.astype('>u2')
+
+            for pixel_row in block_row[:height - row * block_height]:
+                yield pixel_row.tobytes()
+
+    def get_png_rows_python(self):
+        """Get the rows of pixels of mip 0, without numpy (see get_png_rows()).
+
+        Returns:
+            rows (list of tuples): Each row of pixels, as width * 4 ints (RGBA).
+        """
 
         # Figure out which data to write out.
         # If the decompressed data is valid, use that.
-        if self.data_is_decompressed:
-            data = self.decompressed_data
-        else:
+        data = self.decompressed_data
+        if not self.data_is_decompressed:
             data = self.data
 
-        assert data, 'data must be something valid at this point.'
+        assert len(data) > 0, 'data must be something valid at this point.'
 
         # Check to see if the data contains mipmaps
         # If it does, truncate out everything beyond mip0
@@ -82,25 +681,13 @@ class PyDDS(dds_base.DDSBase, pixel_swizzle.PixelSwizzle):
             mip0_size = self.dds_header.dwWidth * self.dds_header.dwHeight * 4
             data = data[:mip0_size]
 
-        self.logger.info('Creating PNG file: %s (width, height = %d,%d)', \
-                         fname, self.dds_header.dwWidth, self.dds_header.dwHeight)
-
-        fhandle = open(fname, 'wb')
         swizzled_data = self.swizzle_decompressed_bc1_to_png(data, self.dds_header.dwWidth)
 
-        # TODO: Check if alpha really does exist in original data. Currently assuming it always does.
-        writer = png.Writer(self.dds_header.dwWidth, self.dds_header.dwHeight, alpha=True)
-
         # PNG expects the data to be presented in "boxed row flat pixel" format:
         # list([R,G,B,A  R,G,B,A  R,G,B,A],
         #      [R,G,B,A  R,G,B,A  R,G,B,A])
         # Each row will be width * # components elements * # bytes/component
-        formatted_data = zip(*(iter(swizzled_data),) * (self.dds_header.dwWidth * 4 * 1))
-
-        writer.write(fhandle, formatted_data)
-        fhandle.close()
-
-        self.logger.info('Done creating PNG file.')
+        return zip(*(iter(swizzled_data),) * (self.dds_header.dwWidth * 4 * 1))
 
     def print_fields(self):
         self.dds_header.print_fields()
@@ -129,9 +716,9 @@ class PyDDS(dds_base.DDSBase, pixel_swizzle.PixelSwizzle):
             is_dds = False
 
         # Check the magic number
-        if self.dds_header.dwMagic != int(self.swap_endian_hex_str('DDS '.encode('hex')), 16):
+        if self.dds_header.dwMagic != self.dds_header.MAGIC:
             self.logger.warning("Magic number read: '%s', but must be %s", self.dds_header.dwMagic,
-                                int(self.swap_endian_hex_str('DDS '.encode('hex')), 16))
+                                self.dds_header.MAGIC)
             is_dds = False
 
         # Check the size of DDS_HEADER
@@ -146,18 +733,27 @@ class PyDDS(dds_base.DDSBase, pixel_swizzle.PixelSwizzle):
 
         # Check for a larger minimum filesize if DXT10 format is specified
         if int(self.dds_header.pixelformat.get_flag_value('dwFlags', 'DDPF_FOURCC')):
-            if self.dds_header.pixelformat.dwFourCC == self.swap_endian_hex_str('DXT10'):
+            if self.dds_header.format == 'DXT10':
                 if file_size_bytes < 148:
                     self.logger.warning("File size (bytes) with DXT10 header is: '%d'.", file_size_bytes)
                     is_dds = False
 
         return is_dds
 
-    def read(self, fname):
+    def read(self, fname, use_mmap=False, headers_only=False):
         """Read a DirectDraw Surface file (.dds)
 
         Args:
             fname (string): Name of the file to read in.
+            use_mmap (bool): If set, map the file into memory instead of reading it,
+                and store the payload (everything after the headers, starting at
+                data_offset) in data as a read-only numpy uint8 view of the mapping.
+                Opening a file then costs little more than its size in page cache.
+                The mapping lasts as long as any view of it does (see close()).
+                Otherwise, data is a writable numpy uint8 array (a bytearray without numpy)
+                holding a copy of the payload.
+            headers_only (bool): If set, stop after the headers. The payload is
+                read (see read_data()) the first time data is accessed.
 
         Returns:
             None.
@@ -174,42 +770,41 @@ class PyDDS(dds_base.DDSBase, pixel_swizzle.PixelSwizzle):
         self.logger.info('Reading file: %s', fname)
         fhandle = open(fname, 'rb')
 
-        # Unpack all the data...
-        dds_header_before_pixelformat = struct.unpack(self.dds_header.before_pixelformat_packed_fmt,
-                                                      fhandle.read(self.dds_header.before_pixelformat_size))
-
-        pixelformat = struct.unpack(self.dds_header.pixelformat.packed_fmt,
-                                    fhandle.read(self.dds_header.pixelformat.size))
-
-        dds_header_after_pixelformat = struct.unpack(self.dds_header.after_pixelformat_packed_fmt,
-                                                     fhandle.read(self.dds_header.after_pixelformat_size))
-
-        # ... and assign the data to its corresponding fields
-        self.dds_header.set_fields(self.dds_header.fields_before_pixelformat, dds_header_before_pixelformat)
-        self.dds_header.pixelformat.set_fields(self.dds_header.pixelformat.fields, pixelformat)
-        self.dds_header.set_fields(self.dds_header.fields_after_pixelformat, dds_header_after_pixelformat)
+        # Unpack the whole header (including pixelformat) in one go,
+        # assigning the data to its corresponding fields
+        self.dds_header.unpack(fhandle.read(self.dds_header.size))
 
         assert self.check_dds(fname), "File '%s' does not appear to be a dds file." % fname
 
         # If the DDS_PIXELFORMAT dwFlags is set to DDPF_FOURCC and dwFourCC
         # is set to "DX10" an additional DDS_HEADER_DXT10 structure will be present.
         if int(self.dds_header.pixelformat.get_flag_value('dwFlags', 'DDPF_FOURCC')):
-            if self.dds_header.pixelformat.dwFourCC == 'DXT10':
-                dxt10_header_data = struct.unpack(self.dxt10_header.packed_fmt,
-                                                  fhandle.read(self.dxt10_header.size))
+            if self.dds_header.format == 'DXT10':
+                self.dxt10_header.unpack(fhandle.read(self.dxt10_header.size))
+                self.dxt10_header.valid = True
+
+        # Everything from here on is pixel/color data
+        self.fname = fname
+        self.use_mmap = use_mmap
+        self.data_offset = fhandle.tell()
+        self.close()
+        self._data = None
+        self._decompressed_data = None
+        self.data_is_decompressed = False
+        self.build_subresource_index()
 
-                for index, field in enumerate(self.dxt10_header.fields):
-                    self.dxt10_header.__dict__[field.name] = dxt10_header_data[index]
+        if not headers_only:
+            self.read_data(fhandle)
 
-        # Now read the pixel/color data, converting to ints
-        self.data = [ord(c) for c in fhandle.read()]
+        fhandle.close()
         self.logger.info('Done reading file: %s', fname)
 
-    def write(self, fname):
-        """Create a DirectDraw Surface (.dds) file.
+    def read_data(self, fhandle=None):
+        """Read the payload of the file into data (see read()).
 
         Args:
-            fname (string): Name of the file to read in.
+            fhandle (file): Handle of the file, positioned at data_offset.
+                If not provided, the file is opened again.
 
         Returns:
             None.
@@ -218,52 +813,108 @@ class PyDDS(dds_base.DDSBase, pixel_swizzle.PixelSwizzle):
             None.
         """
 
-        self.logger.info('Creating file: %s', fname)
-
-        fhandle = open(fname, 'wb')
-
-        ########################################################################
-        # Write the header up to pixelformat
-        for field in self.dds_header.fields_before_pixelformat:
-            field_size_bits = [_field.byte_size for _field in self.dds_header.fields_before_pixelformat \
-                               if _field.name == field.name][0] * 8
+        if fhandle is None:
+            with open(self.fname, 'rb') as fhandle:
+                fhandle.seek(self.data_offset)
+                self.read_data(fhandle)
+            return
+
+        if self.use_mmap:
+            block_compression.require_numpy('memory-map a file')
+            self.mmap = mmap.mmap(fhandle.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data = block_compression.np.frombuffer(self.mmap, dtype=block_compression.np.uint8,
+                                                        offset=self.data_offset)
+        elif block_compression.np is None:
+            self.data = bytearray(fhandle.read())
+        else:
+            # A writable view of the bytes, one byte per element
+            self.data = block_compression.np.frombuffer(bytearray(fhandle.read()), dtype=block_compression.np.uint8)
+
+    @staticmethod
+    def is_same_file(fname, other_fname):
+        """Check whether two names refer to the same existing file."""
+
+        if not os.path.exists(fname) or not os.path.exists(other_fname):
+            return False
+        if hasattr(os.path, 'samefile'):
+            return os.path.samefile(fname, other_fname)
+        # No samefile() on Windows (before Python 3.2)
+        return os.path.normcase(os.path.abspath(fname)) == os.path.normcase(os.path.abspath(other_fname))
+
+    @staticmethod
+    def replace_file(fname, target_fname):
+        """Rename a file over another one (if any), replacing it in a single step."""
+
+        if os.name != 'nt':
+            os.rename(fname, target_fname)
+        # os.rename() can't replace an existing file on Windows
+        elif not ctypes.windll.kernel32.MoveFileExW(unicode(fname), unicode(target_fname),
+                                                    MOVEFILE_REPLACE_EXISTING | MOVEFILE_WRITE_THROUGH):
+            raise ctypes.WinError()
+
+    def write(self, fname, atomic=False):
+        """Create a DirectDraw Surface (.dds) file.
 
-            final_val = getattr(self.dds_header, field.name)
-            fhandle.write(self.convert_to_ascii(final_val, field_size_bits)[::-1])
+        The headers are packed and written in one go, followed by the whole payload.
 
-        # Then pixelformat
-        for field in self.dds_header.pixelformat.fields:
-            field_size_bits = [_field.byte_size for _field in self.dds_header.pixelformat.fields \
-                               if _field.name == field.name][0] * 8
+        Args:
+            fname (string): Name of the file to write.
+            atomic (bool): If set, write to a temporary file next to fname, then rename
+                it over fname in a single step (see replace_file()). Readers never see a
+                partially written file. On POSIX systems, it's also safe to overwrite the
+                file this instance was memory-mapped from. Always the case when fname is
+                that file, since truncating it would pull the payload out from under the
+                mapping it's written from.
 
-            final_val = getattr(self.dds_header.pixelformat, field.name)
-            fhandle.write(self.convert_to_ascii(final_val, field_size_bits)[::-1])
+        Returns:
+            None.
 
-        # Then after pixelformat
-        for field in self.dds_header.fields_after_pixelformat:
-            field_size_bits = [_field.byte_size for _field in self.dds_header.fields_after_pixelformat \
-                               if _field.name == field.name][0] * 8
+        Raises:
+            WindowsError: On Windows, if fname is memory-mapped (e.g. by this instance, or by views
+                of its data). Windows doesn't allow replacing a mapped file. fname is then left as is.
+        """
 
-            final_val = getattr(self.dds_header, field.name)
-            fhandle.write(self.convert_to_ascii(final_val, field_size_bits)[::-1])
+        self.logger.info('Creating file: %s', fname)
+        if self.mmap is not None and self.is_same_file(fname, self.fname):
+            atomic = True
 
         ########################################################################
-        # If data indicates there is a DXT10_Header was provided, write that out too
-        if int(self.dds_header.pixelformat.get_flag_value('dwFlags', 'DDPF_FOURCC')):
-            if self.dds_header.pixelformat.dwFourCC == 'DXT10':
-                for field in self.dxt10_header.fields:
-                    field_size_bits = [_field.byte_size for _field in self.dxt10_header.fields \
-                                       if _field.name == field.name][0] * 8
+        # Pack the header (including pixelformat)
+        header = self.dds_header.pack()
 
-                    final_val = getattr(dxt10_header, field.name)
-                    fhandle.write(self.convert_to_ascii(final_val, field_size_bits)[::-1])
+        # If data indicates there is a DXT10_Header was provided, pack that too
+        if int(self.dds_header.pixelformat.get_flag_value('dwFlags', 'DDPF_FOURCC')):
+            if self.dds_header.format == 'DXT10':
+                header += self.dxt10_header.pack()
 
         ########################################################################
-        # Finally, write out the raw pixel data
-        for byte in self.data:
-            # Data is internally stored as ints. Convert to ASCII string.
-            fhandle.write(self.convert_to_ascii(byte, 8))
-
-        fhandle.close()
+        # Then the raw pixel data. Anything exposing the buffer interface
+        # (str, bytearray, numpy array, memory-mapped payload) is written as is.
+        payload = self.data
+
+        if not atomic:
+            with open(fname, 'wb') as fhandle:
+                fhandle.write(header)
+                fhandle.write(payload)
+        else:
+            directory, basename = os.path.split(os.path.abspath(fname))
+            temp_fd, temp_fname = tempfile.mkstemp(prefix=basename + '.', suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(temp_fd, 'wb') as fhandle:
+                    fhandle.write(header)
+                    fhandle.write(payload)
+
+                # mkstemp() creates the file readable by its owner only. Keep the permissions of the
+                # file being replaced, or use the usual ones for a new file.
+                if os.path.exists(fname):
+                    os.chmod(temp_fname, os.stat(fname).st_mode & 0o7777)
+                else:
+                    os.chmod(temp_fname, 0o666 & ~UMASK)
+
+                self.replace_file(temp_fname, fname)
+            finally:
+                # Only left behind if something went wrong
+                if os.path.exists(temp_fname):
+                    os.remove(temp_fname)
 
         self.logger.info('Done creating file: %s', fname)
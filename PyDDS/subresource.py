@@ -0,0 +1,95 @@
+#!/usr/bin/python
+"""subresource.py
+    - Locate the subresources (array slices, cubemap faces
+      and mip levels) in the payload of a .dds file.
+"""
+
+from collections import namedtuple
+
+# Where a subresource lives in the payload, and how it's laid out.
+# offset and size are in bytes, relative to the start of the payload.
+# row_pitch is the size of a row of blocks (in bytes), and row_count the
+# number of rows of blocks in each depth slice.
+Subresource = namedtuple('Subresource',
+                         'array_index face mip offset size width height depth row_pitch row_count')
+
+
+class SubresourceIndex(object):
+    """Responsible for locating every subresource of a .dds file.
+
+    Subresources are stored one array slice after the other. Each slice holds
+    its cubemap faces (if any) one after the other, and each face holds its
+    whole mip chain, from the largest mip down.
+    """
+
+    def __init__(self, layout, width, height, depth=1, mip_count=1, array_size=1, face_count=1):
+        """Build the index.
+
+        Args:
+            layout (dx.FormatLayout): Layout of the format of the data.
+            width (int): Width of mip 0, in pixels.
+            height (int): Height of mip 0, in pixels.
+            depth (int): Depth of mip 0 (for volume textures), in pixels.
+            mip_count (int): Number of mip levels.
+            array_size (int): Number of array slices.
+            face_count (int): Number of cubemap faces in each array slice (1 if not a cubemap).
+        """
+
+        self.layout = layout
+        self.mip_count = max(1, mip_count)
+        self.array_size = max(1, array_size)
+        self.face_count = max(1, face_count)
+        self.subresources = []
+
+        offset = 0
+        for array_index in xrange(self.array_size):
+            for face in xrange(self.face_count):
+                for mip in xrange(self.mip_count):
+                    subresource = self.get_subresource_layout(array_index, face, mip, offset,
+                                                              width, height, max(1, depth))
+                    self.subresources.append(subresource)
+                    offset += subresource.size
+
+        # Total size of all the subresources, in bytes
+        self.size = offset
+
+    def get_subresource_layout(self, array_index, face, mip, offset, width, height, depth):
+        """Lay out a single subresource, given the dimensions of mip 0."""
+
+        mip_width = max(1, width >> mip)
+        mip_height = max(1, height >> mip)
+        mip_depth = max(1, depth >> mip)
+
+        # Partial blocks still take up a whole block
+        row_pitch = -(-mip_width // self.layout.block_width) * self.layout.bytes_per_block
+        row_count = -(-mip_height // self.layout.block_height)
+
+        return Subresource(array_index, face, mip, offset, row_pitch * row_count * mip_depth,
+                           mip_width, mip_height, mip_depth, row_pitch, row_count)
+
+    def get(self, mip=0, face=0, array_index=0):
+        """Look up a subresource.
+
+        Args:
+            mip (int): Mip level.
+            face (int): Cubemap face (0 if not a cubemap).
+            array_index (int): Array slice.
+
+        Returns:
+            subresource (Subresource): Where the subresource lives, and how it's laid out.
+
+        Raises:
+            IndexError: If there is no such subresource.
+        """
+
+        if not (0 <= mip < self.mip_count and 0 <= face < self.face_count and 0 <= array_index < self.array_size):
+            raise IndexError, 'No subresource for mip %d, face %d, array slice %d (%d mips, %d faces, %d slices).' % \
+                (mip, face, array_index, self.mip_count, self.face_count, self.array_size)
+
+        return self.subresources[(array_index * self.face_count + face) * self.mip_count + mip]
+
+    def __iter__(self):
+        return iter(self.subresources)
+
+    def __len__(self):
+        return len(self.subresources)
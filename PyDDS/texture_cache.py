@@ -0,0 +1,133 @@
+#!/usr/bin/python
+"""texture_cache.py
+    - Keep recently decoded textures in memory, so opening the same
+      texture again costs a dictionary lookup rather than a decode.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from . import block_compression
+from . import py_dds
+
+
+class TextureCache(object):
+    """Responsible for caching decoded subresources, least recently used first out.
+
+    Entries are keyed by (path, file size, modification time, subresource), so a file
+    that changes on disk is decoded again. Cached arrays are read-only, since they're
+    shared by everyone asking for the same subresource.
+    """
+
+    # Default budget, in bytes
+    DEFAULT_MAX_BYTES = 256 * 2**20
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """Create an empty cache.
+
+        Args:
+            max_bytes (int): Budget of the cache: the total size (in bytes) of the
+                decoded data it holds. Least recently used entries are evicted to stay within it.
+        """
+
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_key(fname, mip=0, face=0, array_index=0):
+        """Key of a subresource of a file, as it is on disk right now.
+
+        Raises:
+            OSError: If the file can't be found.
+        """
+
+        stat = os.stat(fname)
+        return os.path.abspath(fname), stat.st_size, stat.st_mtime, (mip, face, array_index)
+
+    def get(self, fname, mip=0, face=0, array_index=0):
+        """Get the decoded data of a subresource, decoding it only if it isn't cached.
+
+        Args:
+            fname (string): Name of the .dds file.
+            mip (int): Mip level.
+            face (int): Cubemap face (0 if not a cubemap).
+            array_index (int): Array slice.
+
+        Returns:
+            decomp_data (numpy array): The decoded data (as returned by PyDDS.decompress_subresource()),
+                read-only.
+
+        Raises:
+            OSError: If the file can't be found.
+            See also PyDDS.decompress_subresource().
+        """
+
+        key = self.get_key(fname, mip, face, array_index)
+        with self.lock:
+            decomp_data = self.entries.pop(key, None)
+            if decomp_data is not None:
+                # Re-insert it, as the most recently used
+                self.entries[key] = decomp_data
+                self.hits += 1
+                return decomp_data
+            self.misses += 1
+
+        # Decode outside of the lock, so other textures can be looked up meanwhile
+        decomp_data = self.load(fname, mip, face, array_index)
+        self.put(key, decomp_data)
+        return decomp_data
+
+    @staticmethod
+    def load(fname, mip=0, face=0, array_index=0):
+        """Decode a subresource of a file (without caching it)."""
+
+        block_compression.require_numpy('cache decoded textures')
+        with py_dds.PyDDS(fname, use_mmap=True, lazy=True) as dds:
+            decomp_data = block_compression.np.array(dds.decompress_subresource(mip, face, array_index))
+
+        decomp_data.setflags(write=False)
+        return decomp_data
+
+    def put(self, key, decomp_data):
+        """Add some decoded data to the cache, evicting the least recently used entries to make room for it.
+        Data larger than the whole budget isn't cached."""
+
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key).nbytes
+
+            if decomp_data.nbytes > self.max_bytes:
+                return
+
+            self.entries[key] = decomp_data
+            self.size += decomp_data.nbytes
+            while self.size > self.max_bytes:
+                _, evicted_data = self.entries.popitem(last=False)
+                self.size -= evicted_data.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        """Empty the cache (the counters are kept)."""
+
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def get_stats(self):
+        """Get the counters of the cache, as a dict."""
+
+        with self.lock:
+            return {'hits' : self.hits, 'misses' : self.misses, 'evictions' : self.evictions,
+                    'entries' : len(self.entries), 'size' : self.size, 'max_bytes' : self.max_bytes}
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# Cache shared by the whole process
+shared_cache = TextureCache()
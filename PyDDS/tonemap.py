@@ -0,0 +1,170 @@
+#!/usr/bin/python
+"""tonemap.py
+    - Map high dynamic range (HDR) pixel data down to 8 (or 16) bits per
+      component, so it can be previewed (e.g. written out to a .png file).
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def clamp(values):
+    """Simply clip everything above 1.0."""
+    return np.minimum(values, 1.0)
+
+
+def reinhard(values):
+    """Reinhard's operator: x / (1 + x)."""
+    return values / (1.0 + values)
+
+
+def aces(values):
+    """Narkowicz's fit of the ACES filmic curve."""
+    return (values * (2.51 * values + 0.03)) / (values * (2.43 * values + 0.59) + 0.14)
+
+
+OPERATORS = {'clamp' : clamp,
+             'reinhard' : reinhard,
+             'aces' : aces}
+
+
+def linear_to_srgb(values):
+    """Encode linear values in [0.0, 1.0] with the sRGB transfer function."""
+    return np.where(values <= 0.0031308,
+                    values * 12.92,
+                    1.055 * np.power(values, 1 / 2.4) - 0.055)
+
+
+def tonemap(data, operator='reinhard', exposure=0.0, bit_depth=8):
+    """Tone-map some HDR pixel data to 8 (or 16) bits per component.
+
+    The color components are scaled by the exposure, tone-mapped and sRGB encoded.
+    Alpha is simply clamped. Negative and NaN values map to 0.
+
+    Args:
+        data (numpy array): Float array of RGBA pixels (any shape, as long as the
+            last dimension, once flattened, is a multiple of 4 components).
+        operator (string): Name of the tone-map operator to use (see OPERATORS).
+        exposure (float): Exposure adjustment, in stops.
+        bit_depth (int): Number of bits per component of the result (8 or 16).
+
+    Returns:
+        tonemapped_data (numpy array): uint8 (or uint16) array of the same shape as data.
+
+    Raises:
+        ValueError: If operator isn't one of OPERATORS.
+    """
+
+    if operator not in OPERATORS:
+        raise ValueError, "Unknown tone-map operator '%s' (expected one of: %s)" % \
+            (operator, ', '.join(sorted(OPERATORS)))
+
+    pixels = np.nan_to_num(np.asarray(data, dtype=np.float32)).reshape(-1, 4)
+    pixels = np.maximum(pixels, 0.0)
+
+    colors = OPERATORS[operator](pixels[:, 0:3] * (2.0 ** exposure))
+    colors = linear_to_srgb(np.clip(colors, 0.0, 1.0))
+
+    max_value = 2 ** bit_depth - 1
+    tonemapped_data = np.empty(pixels.shape, dtype=get_dtype(bit_depth))
+    tonemapped_data[:, 0:3] = np.around(colors * max_value)
+    tonemapped_data[:, 3] = np.around(np.clip(pixels[:, 3], 0.0, 1.0) * max_value)
+
+    return tonemapped_data.reshape(np.shape(data))
+
+
+def get_dtype(bit_depth):
+    """Get the type of integer components of some bit depth (8 or 16).
+
+    Raises:
+        ValueError: If the bit depth isn't supported.
+    """
+
+    if bit_depth not in (8, 16):
+        raise ValueError, 'Unsupported bit depth: %d (expected 8 or 16).' % bit_depth
+    return np.uint8 if bit_depth == 8 else np.uint16
+
+
+def to_float(data):
+    """Convert pixel data to floats. Integer (UNORM) components are scaled to [0.0, 1.0]."""
+
+    data = np.asarray(data)
+    if data.dtype.kind == 'f':
+        return data.astype(np.float32)
+    return data.astype(np.float32) / np.iinfo(data.dtype).max
+
+
+def get_value_range(data):
+    """Get the range of the (finite) color values of some RGBA pixel data, as floats (see to_float()).
+
+    Returns:
+        value_range (tuple): (lowest, highest) value. (0.0, 1.0) if there are no finite values.
+    """
+
+    colors = to_float(data).reshape(-1, 4)[:, 0:3]
+    colors = colors[np.isfinite(colors)]
+    if not colors.size:
+        return 0.0, 1.0
+    return float(colors.min()), float(colors.max())
+
+
+def normalize(data, value_range, exposure=0.0, bit_depth=8):
+    """Linearly map the color components of some pixel data from value_range to the whole range
+    of bit_depth-bit integers, e.g. to preview data textures (normals, heights, lightmaps).
+
+    Colors are scaled by the exposure once normalized, and clamped. Unlike tonemap(), no sRGB
+    encoding is applied. Alpha is simply clamped. NaN values map to 0.
+
+    Args:
+        data (numpy array): Array of RGBA pixels, of any type (see to_float()).
+        value_range (tuple): (lowest, highest) color value, e.g. from get_value_range().
+        exposure (float): Exposure adjustment, in stops.
+        bit_depth (int): Number of bits per component of the result (8 or 16).
+
+    Returns:
+        normalized_data (numpy array): uint8 (or uint16) array of the same shape as data.
+    """
+
+    low, high = value_range
+    scale = (2.0 ** exposure) / (high - low) if high > low else 1.0
+    pixels = np.nan_to_num(to_float(data)).reshape(-1, 4)
+
+    max_value = 2 ** bit_depth - 1
+    normalized_data = np.empty(pixels.shape, dtype=get_dtype(bit_depth))
+    normalized_data[:, 0:3] = np.around(np.clip((pixels[:, 0:3] - low) * scale, 0.0, 1.0) * max_value)
+    normalized_data[:, 3] = np.around(np.clip(pixels[:, 3], 0.0, 1.0) * max_value)
+
+    return normalized_data.reshape(np.shape(data))
+
+
+def quantize(data, bit_depth=8, operator='reinhard', exposure=0.0, value_range=None):
+    """Convert pixel data of any type to bit_depth-bit integers, e.g. to write it to a .png file.
+
+    If value_range is set, the data is normalized (see normalize()). Otherwise, float data is
+    tone-mapped (see tonemap()), and integer (UNORM) data is rescaled, rounding to nearest.
+
+    Args:
+        data (numpy array): Array of RGBA pixels.
+        bit_depth (int): Number of bits per component of the result (8 or 16).
+        operator (string): Name of the tone-map operator to use (see OPERATORS).
+        exposure (float): Exposure adjustment, in stops.
+        value_range (tuple): If set, (lowest, highest) color value to normalize from.
+
+    Returns:
+        quantized_data (numpy array): uint8 (or uint16) array of the same shape as data.
+    """
+
+    data = np.asarray(data)
+    dtype = get_dtype(bit_depth)
+
+    if value_range is not None:
+        return normalize(data, value_range, exposure, bit_depth)
+    if data.dtype.kind == 'f':
+        return tonemap(data, operator, exposure, bit_depth)
+    if data.dtype == dtype:
+        return data
+
+    max_value = np.iinfo(data.dtype).max
+    return ((data.astype(np.uint64) * (2 ** bit_depth - 1) + max_value // 2) // max_value).astype(dtype)
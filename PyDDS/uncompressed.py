@@ -0,0 +1,394 @@
+#!/usr/bin/python
+"""uncompressed.py
+    - Define a class responsible for decoding uncompressed
+      texture data to RGBA.
+"""
+
+import re
+import functools
+import logging
+from . import block_compression
+
+# Formats whose components are all of the same type (e.g. DXGI_FORMAT_R16G16_FLOAT)
+TYPED_FORMAT = re.compile(r'^DXGI_FORMAT_((?:[RGBA](?:16|32))+)_(FLOAT|UNORM|SNORM)$')
+
+# Type (little-endian) of the components of typed formats, by (bits, kind)
+COMPONENT_TYPES = {('16', 'FLOAT') : '<f2',
+                   ('32', 'FLOAT') : '<f4',
+                   ('16', 'UNORM') : '<u2',
+                   ('16', 'SNORM') : '<i2'}
+
+# Formats storing pairs of pixels in 4-byte macro-pixels. Each maps to the byte offsets of
+# (the first pixel's luma/green, the second pixel's luma/green, the shared U/red, the shared V/blue).
+PACKED_PAIR_FORMATS = {'D3DFMT_YUY2' : (0, 2, 1, 3),
+                       'DXGI_FORMAT_YUY2' : (0, 2, 1, 3),
+                       'D3DFMT_UYVY' : (1, 3, 0, 2),
+                       'DXGI_FORMAT_R8G8_B8G8_UNORM' : (1, 3, 0, 2),
+                       'DXGI_FORMAT_G8R8_G8B8_UNORM' : (0, 2, 1, 3)}
+
+# Packed-pair formats holding YUV (rather than RGB) data
+YUV_FORMATS = set(['D3DFMT_YUY2', 'DXGI_FORMAT_YUY2', 'D3DFMT_UYVY'])
+
+# Luma coefficients (Kr, Kb) of the YUV to RGB conversion standards
+YUV_STANDARDS = {'bt601' : (0.299, 0.114),
+                 'bt709' : (0.2126, 0.0722)}
+
+
+class UncompressedDecoder(object):
+    """Responsible for decoding uncompressed texture data."""
+
+    # Plans of the bit-mask pixel formats seen so far, keyed by signature (see get_signature())
+    plans = {}
+
+    # Bit counts of the pixel formats that can be described by bit masks
+    BIT_COUNTS = (8, 16, 24, 32)
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+        # Standard (see YUV_STANDARDS) used to convert YUV data to RGB
+        self.yuv_standard = 'bt601'
+
+    @staticmethod
+    def get_signature(pixelformat):
+        """Get everything about a (DDS_PIXELFORMAT) pixel format that affects how it's decoded.
+
+        Returns:
+            signature (tuple): (bit count, red, green, blue and alpha masks, whether the
+                DDPF_LUMINANCE, DDPF_ALPHA and DDPF_ALPHAPIXELS flags are set).
+        """
+
+        return (pixelformat.dwRGBBitCount, pixelformat.dwRbitMask, pixelformat.dwGbitMask,
+                pixelformat.dwBBitMask, pixelformat.dwABitMask,
+                bool(pixelformat.get_flag_value('dwFlags', 'DDPF_LUMINANCE')),
+                bool(pixelformat.get_flag_value('dwFlags', 'DDPF_ALPHA')),
+                bool(pixelformat.get_flag_value('dwFlags', 'DDPF_ALPHAPIXELS')))
+
+    @staticmethod
+    def get_mask_shift_width(mask):
+        """Get the position and width (in bits) of a bit mask.
+
+        Raises:
+            ValueError: If the bits of the mask aren't contiguous.
+        """
+
+        shift = 0
+        while not (mask >> shift) & 1:
+            shift += 1
+        width = len(bin(mask >> shift)) - 2
+
+        if mask >> shift != (1 << width) - 1:
+            raise ValueError, 'Bit mask %#x is not contiguous.' % mask
+        return shift, width
+
+    @classmethod
+    def get_channel_plan(cls, mask):
+        """Plan how to extract a channel: its position in the pixel, and a look-up table
+        expanding its values to 8 bits (rounding to nearest).
+
+        Returns:
+            plan (tuple): (shift, width, look-up table). The table is None for channels wider
+                than 16 bits, which are expanded arithmetically instead.
+        """
+
+        np = block_compression.np
+        shift, width = cls.get_mask_shift_width(mask)
+        max_value = (1 << width) - 1
+        lut = None
+        if width <= 16:
+            lut = ((np.arange(max_value + 1, dtype=np.uint32) * 255 + max_value // 2) // max_value).astype(np.uint8)
+        return shift, width, lut
+
+    @classmethod
+    def get_plan(cls, signature):
+        """Plan how to decode a bit-mask pixel format, caching the plan.
+
+        Args:
+            signature (tuple): Signature of the pixel format (see get_signature()).
+
+        Returns:
+            plan (tuple): The plan of the red, green, blue and alpha channels. Each is either
+                a constant value, or a channel plan (see get_channel_plan()).
+
+        Raises:
+            ValueError: If the bit count isn't supported, or a mask isn't contiguous.
+        """
+
+        plan = cls.plans.get(signature)
+        if plan is not None:
+            return plan
+
+        bit_count, red_mask, green_mask, blue_mask, alpha_mask, luminance, alpha_only, alpha_pixels = signature
+        if bit_count not in cls.BIT_COUNTS:
+            raise ValueError, 'Unsupported bit count for a bit-mask pixel format: %d.' % bit_count
+
+        if luminance:
+            # Luminance (in the red mask) is copied to red, green and blue
+            masks = [red_mask] * 3
+        elif alpha_only:
+            masks = [0] * 3
+        else:
+            masks = [red_mask, green_mask, blue_mask]
+
+        # Alpha is only meaningful if a flag says so (e.g. X8R8G8B8 is opaque, whatever its alpha mask)
+        masks.append(alpha_mask if alpha_only or alpha_pixels else 0)
+
+        default_values = [0, 0, 0, 255]
+        plan = tuple(cls.get_channel_plan(mask) if mask else default_value
+                     for mask, default_value in zip(masks, default_values))
+        cls.plans[signature] = plan
+        return plan
+
+    @staticmethod
+    def load_pixels(data, bit_count):
+        """Load the pixels of some data as integers (little-endian), one per pixel.
+
+        Args:
+            data (list of ints, buffer or numpy array): Bytes of the pixels.
+            bit_count (int): Number of bits per pixel (8, 16, 24 or 32).
+
+        Returns:
+            pixels (numpy array): The value of each pixel. Any trailing partial pixel is dropped.
+        """
+
+        np = block_compression.np
+        pixel_size = bit_count // 8
+        data = np.asarray(data, dtype=np.uint8).reshape(-1)
+        data = np.ascontiguousarray(data[:len(data) - len(data) % pixel_size])
+
+        if pixel_size == 1:
+            return data
+        elif pixel_size == 2:
+            return data.view('<u2')
+        elif pixel_size == 3:
+            data = data.reshape(-1, 3).astype(np.uint32)
+            return data[:, 0] | (data[:, 1] << 8) | (data[:, 2] << 16)
+        return data.view('<u4')
+
+    def decode_bitmask(self, data, signature):
+        """Decode pixels described by bit masks (e.g. R5G6B5, A1R5G5B5, A4R4G4B4, L8, A8L8, A8, X8R8G8B8).
+
+        Args:
+            data (list of ints, buffer or numpy array): Bytes of the pixels.
+            signature (tuple): Signature of the pixel format (see get_signature()).
+
+        Returns:
+            decomp_data (numpy array): Decoded data, as flat uint8 RGBA, one pixel after the other.
+
+        Raises: See get_plan().
+        """
+
+        np = block_compression.np
+        plan = self.get_plan(signature)
+        pixels = self.load_pixels(data, signature[0])
+
+        decomp_data = np.empty((len(pixels), 4), dtype=np.uint8)
+        for channel, channel_plan in enumerate(plan):
+            if not isinstance(channel_plan, tuple):
+                decomp_data[:, channel] = channel_plan
+                continue
+
+            shift, width, lut = channel_plan
+            values = (pixels >> shift) & ((1 << width) - 1)
+            if lut is not None:
+                decomp_data[:, channel] = lut[values]
+            else:
+                max_value = (1 << width) - 1
+                decomp_data[:, channel] = (values.astype(np.uint64) * 255 + max_value // 2) // max_value
+
+        return decomp_data.reshape(-1)
+
+    @staticmethod
+    def get_typed_format(surface_format):
+        """Get the type and number of components of a typed format (see TYPED_FORMAT).
+
+        Returns:
+            typed_format (tuple): (numpy type string, number of components), or None if the
+                format isn't typed, or its components aren't all the same type.
+        """
+
+        match = TYPED_FORMAT.match(surface_format or '')
+        if match is None:
+            return None
+
+        components = re.findall(r'([RGBA])(\d+)', match.group(1))
+        widths = set(width for _, width in components)
+        if len(widths) != 1 or ''.join(name for name, _ in components) != 'RGBA'[:len(components)]:
+            return None
+
+        dtype = COMPONENT_TYPES.get((widths.pop(), match.group(2)))
+        if dtype is None:
+            return None
+        return dtype, len(components)
+
+    @classmethod
+    def get_typed_view(cls, data, surface_format):
+        """View some data of a typed format (e.g. DXGI_FORMAT_R16G16B16A16_FLOAT) as an array of
+        its components. If data is already a uint8 numpy array (e.g. when memory-mapped), or a
+        buffer, nothing is copied.
+
+        Args:
+            data (list of ints, buffer or numpy array): Bytes of the pixels.
+            surface_format (string): Name of the format.
+
+        Returns:
+            view (numpy array): Array of shape (number of pixels, number of components), typed
+                as the components (float16, float32, uint16 or int16). Any trailing partial
+                pixel is dropped.
+
+        Raises:
+            ValueError: If the format isn't typed.
+        """
+
+        np = block_compression.np
+        typed_format = cls.get_typed_format(surface_format)
+        if typed_format is None:
+            raise ValueError, 'Not a typed format: %s.' % surface_format
+
+        dtype, component_count = typed_format
+        pixel_size = np.dtype(dtype).itemsize * component_count
+
+        if isinstance(data, np.ndarray):
+            data = data.reshape(-1)
+        else:
+            data = np.frombuffer(data, dtype=np.uint8) if isinstance(data, (str, bytearray, buffer)) \
+                else np.asarray(data, dtype=np.uint8)
+        data = data[:len(data) - len(data) % pixel_size]
+        if not data.flags.c_contiguous:
+            data = np.ascontiguousarray(data)
+
+        return data.view(dtype).reshape(-1, component_count)
+
+    def decode_typed(self, data, surface_format):
+        """Decode data of a typed format to RGBA, keeping the type of its components where possible.
+
+        Missing components are 0, except alpha, which is opaque. Float and UNORM components keep
+        their type (so four-component data is returned as a view, without a copy). SNORM
+        components are converted to float32, in [-1.0, 1.0].
+
+        Args:
+            data (list of ints, buffer or numpy array): Bytes of the pixels.
+            surface_format (string): Name of the format.
+
+        Returns:
+            decomp_data (numpy array): Decoded data, as flat RGBA, one pixel after the other
+                (float16, float32 or uint16).
+
+        Raises: See get_typed_view().
+        """
+
+        np = block_compression.np
+        view = self.get_typed_view(data, surface_format)
+
+        if view.dtype.kind == 'i':
+            # Both -32768 and -32767 map to -1.0
+            view = np.maximum(view.astype(np.float32) / 32767, -1.0)
+        if view.shape[1] == 4:
+            return view.reshape(-1)
+
+        opaque = 1 if view.dtype.kind == 'f' else np.iinfo(view.dtype).max
+        decomp_data = np.zeros((view.shape[0], 4), dtype=view.dtype)
+        decomp_data[:, 0:view.shape[1]] = view
+        decomp_data[:, 3] = opaque
+        return decomp_data.reshape(-1)
+
+    @staticmethod
+    def get_yuv_matrix(standard='bt601'):
+        """Get the matrix converting (limited range, 8-bit) YUV to RGB.
+
+        Args:
+            standard (string): Conversion standard (see YUV_STANDARDS).
+
+        Returns:
+            matrix (numpy array): 3x3 matrix, applied to (Y - 16, U - 128, V - 128) column
+                vectors, and giving RGB in [0.0, 255.0].
+
+        Raises:
+            ValueError: If the standard isn't one of YUV_STANDARDS.
+        """
+
+        if standard not in YUV_STANDARDS:
+            raise ValueError, "Unknown YUV standard '%s' (expected one of: %s)" % \
+                (standard, ', '.join(sorted(YUV_STANDARDS)))
+
+        np = block_compression.np
+        red_coefficient, blue_coefficient = YUV_STANDARDS[standard]
+        green_coefficient = 1.0 - red_coefficient - blue_coefficient
+
+        # Luma spans 219 steps (16 to 235), and chroma 224 (16 to 240)
+        luma_scale = 255.0 / 219
+        chroma_scale = 255.0 / 224
+        return np.array([[luma_scale, 0.0, 2 * (1 - red_coefficient) * chroma_scale],
+                         [luma_scale,
+                          -2 * blue_coefficient * (1 - blue_coefficient) / green_coefficient * chroma_scale,
+                          -2 * red_coefficient * (1 - red_coefficient) / green_coefficient * chroma_scale],
+                         [luma_scale, 2 * (1 - blue_coefficient) * chroma_scale, 0.0]])
+
+    def decode_packed_pairs(self, data, surface_format, yuv_standard=None):
+        """Decode formats storing pairs of pixels in 4-byte macro-pixels, sharing their chroma
+        (YUY2, UYVY) or red and blue (R8G8_B8G8, G8R8_G8B8). YUV data is converted to RGB with
+        a single matrix multiply over the whole surface.
+
+        Args:
+            data (list of ints, buffer or numpy array): Bytes of the macro-pixels.
+            surface_format (string): Name of the format (see PACKED_PAIR_FORMATS).
+            yuv_standard (string): Standard used to convert YUV data (see YUV_STANDARDS).
+                Defaults to the yuv_standard attribute.
+
+        Returns:
+            decomp_data (numpy array): Decoded data, as flat uint8 RGBA, one pixel after the other.
+
+        Raises:
+            ValueError: If the YUV standard isn't known.
+        """
+
+        np = block_compression.np
+        first, second, chroma_u, chroma_v = PACKED_PAIR_FORMATS[surface_format]
+        macro_pixels = np.asarray(data, dtype=np.uint8).reshape(-1)
+        macro_pixels = macro_pixels[:len(macro_pixels) - len(macro_pixels) % 4].reshape(-1, 4)
+
+        # (macro-pixel, pixel, component), components being Y (or G), U (or R), V (or B)
+        pixels = np.empty((len(macro_pixels), 2, 3), dtype=np.uint8)
+        pixels[:, 0, 0] = macro_pixels[:, first]
+        pixels[:, 1, 0] = macro_pixels[:, second]
+        pixels[:, :, 1] = macro_pixels[:, chroma_u, np.newaxis]
+        pixels[:, :, 2] = macro_pixels[:, chroma_v, np.newaxis]
+
+        decomp_data = np.empty((len(macro_pixels), 2, 4), dtype=np.uint8)
+        if surface_format in YUV_FORMATS:
+            matrix = self.get_yuv_matrix(yuv_standard or self.yuv_standard)
+            yuv = pixels.reshape(-1, 3) - np.array([16.0, 128.0, 128.0], dtype=np.float32)
+            rgb = np.dot(yuv, matrix.T.astype(np.float32))
+            decomp_data[..., 0:3] = np.clip(np.around(rgb), 0, 255).reshape(-1, 2, 3)
+        else:
+            decomp_data[..., 0:3] = pixels[..., [1, 0, 2]]
+        decomp_data[..., 3] = 255
+
+        return decomp_data.reshape(-1)
+
+    def get_decoder(self, surface_format, pixelformat):
+        """Get the function that decodes some data, given its format.
+
+        Args:
+            surface_format (string): Name of the format, or None if it's described by bit masks.
+            pixelformat (Pixelformat): Pixel format of the file (for the bit masks and flags).
+
+        Returns:
+            decoder (function): Function that decodes data (to flat RGBA, one pixel after
+                the other, see decode_bitmask(), decode_typed() and decode_packed_pairs()), or None if the format
+                can't be decoded.
+        """
+
+        if surface_format is None and not pixelformat.get_flag_value('dwFlags', 'DDPF_FOURCC') and \
+                pixelformat.dwRGBBitCount in self.BIT_COUNTS:
+            block_compression.require_numpy('decode bit-mask pixel formats')
+            return functools.partial(self.decode_bitmask, signature=self.get_signature(pixelformat))
+
+        if surface_format in PACKED_PAIR_FORMATS:
+            block_compression.require_numpy('decode packed-pair formats')
+            return functools.partial(self.decode_packed_pairs, surface_format=surface_format)
+
+        if self.get_typed_format(surface_format) is not None:
+            block_compression.require_numpy('decode typed formats')
+            return functools.partial(self.decode_typed, surface_format=surface_format)
+        return None
@@ -5,8 +5,12 @@
 import sys
 sys.dont_write_bytecode = True
 
+import os
+import shutil
+import tempfile
 import unittest
 import logging
+import png
 import PyDDS
 
 
@@ -17,6 +21,26 @@ class TestSimple(unittest.TestCase):
         # Read some test file.
         self.test_dds = PyDDS.PyDDS('test/Test.dds', logging.INFO)
         self.fungus_dds = PyDDS.PyDDS('test/fungus.dds', logging.INFO)
+        self.bc7_dds = PyDDS.PyDDS('test/bc7.dds', logging.INFO)
+        self.bc6h_dds = PyDDS.PyDDS('test/bc6h.dds', logging.INFO)
+
+    def write_temp_dds(self, width, height, data):
+        """Write Test.dds, resized to a single mip of width x height and holding data, to a temporary
+        directory (removed after the test). The pixel format is left as the test set it.
+
+        Returns:
+            fname (string): Name of the file written.
+        """
+
+        header = self.test_dds.dds_header
+        header.dwWidth, header.dwHeight, header.dwMipMapCount = width, height, 1
+        self.test_dds.data = data
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        fname = os.path.join(temp_dir, 'temp.dds')
+        self.test_dds.write(fname)
+        return fname
 
     def test_enum_lookup(self):
         """Test for consistency in the enum look-up functions."""
@@ -36,6 +60,19 @@ class TestSimple(unittest.TestCase):
         """Simply print the header information of Test.dds"""
         self.test_dds.print_fields()
 
+    def test_header_codec(self):
+        """Re-pack the headers of bc7.dds, and test some flags."""
+        with open('test/bc7.dds', 'rb') as fhandle:
+            headers = fhandle.read(148)
+        self.assertEqual(self.bc7_dds.dds_header.pack() + self.bc7_dds.dxt10_header.pack(), headers)
+
+        self.assertEqual(self.bc7_dds.dds_header.get_flag_value('dwFlags', 'DDSD_PIXELFORMAT'), 1)
+        self.assertEqual(self.bc7_dds.dds_header.get_flag_value('dwFlags', 'DDSD_DEPTH'), 0)
+        self.assertEqual(self.bc7_dds.dxt10_header.get_flag_value('miscFlags2', 'DDS_ALPHA_MODE_UNKNOWN'), 1)
+        self.bc7_dds.dxt10_header.miscFlags2 = 0x3
+        self.assertEqual(self.bc7_dds.dxt10_header.get_flag_value('miscFlags2', 'DDS_ALPHA_MODE_OPAQUE'), 1)
+        self.assertEqual(self.bc7_dds.dxt10_header.get_flag_value('miscFlags2', 'DDS_ALPHA_MODE_STRAIGHT'), 0)
+
     def test_swizzle(self):
         """Swizzle some data to png format."""
         faux_data = [i for i in xrange(0, 192)]
@@ -51,11 +88,469 @@ class TestSimple(unittest.TestCase):
         swizzled_data = self.test_dds.swizzle_decompressed_bc1_to_png(faux_data, 8)
         self.assertEqual(swizzled_data, expected_data)
 
+    def test_tile_untile(self):
+        """Tile and untile images whose dimensions aren't multiples of the block dimensions."""
+        np = PyDDS.block_compression.np
+        image = np.arange(7 * 10 * 3).reshape(7, 10, 3)
+        for block_width, block_height in ((4, 4), (2, 1), (8, 2)):
+            blocks = PyDDS.PixelSwizzle.tile(image, block_width, block_height)
+            blocks_wide = -(-10 // block_width)
+            self.assertEqual(blocks.shape, (blocks_wide * -(-7 // block_height), block_width * block_height, 3))
+            self.assertEqual(list(blocks[1, 0]), list(image[0, block_width]))
+            self.assertTrue((PyDDS.PixelSwizzle.untile(blocks, 10, 7, block_width, block_height, 3) == image).all())
+
+        # Partial blocks are padded with the last row/column
+        self.assertEqual(list(PyDDS.PixelSwizzle.tile(image, 4, 4)[2, 15]), list(image[3, 9]))
+        self.assertRaises(ValueError, PyDDS.PixelSwizzle.untile, blocks, 10, 9, 8, 2, 3)
+
+    def test_morton_and_tiled(self):
+        """Deswizzle Morton-ordered and tiled data, and swizzle it back."""
+        np = PyDDS.block_compression.np
+        swizzle = PyDDS.PixelSwizzle
+
+        # A 4x2 grid: Morton order goes (0, 0), (1, 0), (0, 1), (1, 1), (2, 0), ...
+        self.assertEqual(list(swizzle.deswizzle(range(8), 4, 2, 'morton', pixel_size=1)), [0, 1, 4, 5, 2, 3, 6, 7])
+
+        # 2x2 macro-tiles, stored row by row
+        self.assertEqual(list(swizzle.deswizzle(range(8), 4, 2, 'tiled', 1, tile_width=2, tile_height=2)),
+                         [0, 1, 4, 5, 2, 3, 6, 7])
+
+        # Non-power-of-2 sizes are padded, and the permutations are cached
+        image = np.arange(5 * 3 * 2).reshape(-1)
+        for mode in ('morton', 'tiled'):
+            swizzled = swizzle.swizzle(image, 5, 3, mode, pixel_size=2)
+            self.assertEqual(list(swizzle.deswizzle(swizzled, 5, 3, mode, pixel_size=2)), list(image))
+        self.assertIn(('morton', 5, 3), swizzle.permutations)
+
+        # Deswizzling Morton-ordered BC1 blocks gives back fungus.dds
+        fungus_dds = PyDDS.PyDDS('test/fungus.dds', lazy=True)
+        fungus_dds.data = np.concatenate([swizzle.swizzle(fungus_dds.get_subresource_data(mip), max(1, 64 >> mip),
+                                                          max(1, 64 >> mip), 'morton', 8) for mip in xrange(9)])
+        fungus_dds.deswizzle_data('morton')
+        self.assertEqual(fungus_dds.data.tobytes(), self.fungus_dds.data.tobytes())
+
+    def test_bitmask_decoder(self):
+        """Decode pixels of some bit-mask pixel formats, and a whole (2x2) A1R5G5B5 file."""
+        pixelformat = self.test_dds.dds_header.pixelformat
+        decoder = PyDDS.uncompressed.UncompressedDecoder()
+
+        # (flags, bit count, red, green, blue and alpha masks), a pixel, and its expected RGBA
+        rgb, alpha_pixels, alpha, luminance = 0x40, 0x1, 0x2, 0x20000
+        cases = [((rgb, 16, 0xf800, 0x7e0, 0x1f, 0), [0x1f, 0xf8], [255, 0, 255, 255]),
+                 ((rgb | alpha_pixels, 16, 0xf00, 0xf0, 0xf, 0xf000), [0x8f, 0x1f], [255, 136, 255, 17]),
+                 ((rgb, 24, 0xff0000, 0xff00, 0xff, 0), [1, 2, 3], [3, 2, 1, 255]),
+                 ((rgb, 32, 0xff0000, 0xff00, 0xff, 0xff000000), [1, 2, 3, 4], [3, 2, 1, 255]),
+                 ((luminance | alpha_pixels, 16, 0xff, 0, 0, 0xff00), [7, 9], [7, 7, 7, 9]),
+                 ((luminance, 8, 0xff, 0, 0, 0), [7], [7, 7, 7, 255]),
+                 ((alpha, 8, 0, 0, 0, 0xff), [7], [0, 0, 0, 7])]
+        for fields, pixel, expected in cases:
+            (pixelformat.dwFlags, pixelformat.dwRGBBitCount, pixelformat.dwRbitMask, pixelformat.dwGbitMask,
+             pixelformat.dwBBitMask, pixelformat.dwABitMask) = fields
+            self.assertIsNone(self.test_dds.dds_header.format)
+            self.assertEqual(list(self.test_dds.get_decompressor()(pixel)), expected)
+        self.assertIn(decoder.get_signature(pixelformat), decoder.plans)
+
+        # A 2x2 A1R5G5B5 file, written out and read back in
+        pixelformat.dwFlags, pixelformat.dwRGBBitCount = rgb | alpha_pixels, 16
+        pixelformat.dwRbitMask, pixelformat.dwGbitMask, pixelformat.dwBBitMask, pixelformat.dwABitMask = \
+            0x7c00, 0x3e0, 0x1f, 0x8000
+        a1r5g5b5_dds = PyDDS.PyDDS(self.write_temp_dds(2, 2, [0x1f, 0x80, 0xe0, 0x03, 0x00, 0x7c, 0xff, 0xff]))
+        self.assertEqual(list(a1r5g5b5_dds.decompressed_data),
+                         [0, 0, 255, 255, 0, 255, 0, 0, 255, 0, 0, 0, 255, 255, 255, 255])
+        self.assertEqual(list(a1r5g5b5_dds.decompress_region(1, 0, 1, 2).reshape(-1)),
+                         [0, 255, 0, 0, 255, 255, 255, 255])
+
+        # FourCCs can also be D3DFORMAT values
+        pixelformat.dwFlags, pixelformat.dwFourCC = 0x4, 113
+        self.assertEqual(self.test_dds.dds_header.format, 'DXGI_FORMAT_R16G16B16A16_FLOAT')
+
+    def test_typed_formats(self):
+        """View and decode float and 16-bit UNORM/SNORM data, and write it to 16-bit .png files."""
+        np = PyDDS.block_compression.np
+        decoder = PyDDS.uncompressed.UncompressedDecoder()
+        values = np.array([0.5, -2.0, 1.0, 0.25], dtype='<f2')
+
+        view = decoder.get_typed_view(values.tobytes(), 'DXGI_FORMAT_R16G16_FLOAT')
+        self.assertEqual((view.shape, view.dtype), ((2, 2), np.float16))
+        self.assertEqual(list(decoder.decode_typed(values.view(np.uint8), 'DXGI_FORMAT_R16_FLOAT')[0:8]),
+                         [0.5, 0, 0, 1, -2.0, 0, 0, 1])
+        self.assertEqual(list(decoder.decode_typed([0x00, 0x80, 0xff, 0x7f], 'DXGI_FORMAT_R16G16_SNORM')),
+                         [-1.0, 1.0, 0.0, 1.0])
+        self.assertIsNone(decoder.get_typed_format('DXGI_FORMAT_R32G8X24_TYPELESS'))
+
+        # A 2x1 R16G16B16A16_UNORM file (numeric FourCC 36), memory-mapped and decoded without a copy
+        self.test_dds.dds_header.pixelformat.dwFourCC = 36
+        values = np.array([0, 1000, 65535, 65535, 300, 0, 0, 32768], dtype='<u2')
+        fname = self.write_temp_dds(2, 1, values.view(np.uint8))
+        png_fname = os.path.splitext(fname)[0] + '.png'
+        with PyDDS.PyDDS(fname, use_mmap=True) as unorm16_dds:
+            self.assertEqual(unorm16_dds.format, 'DXGI_FORMAT_R16G16B16A16_UNORM')
+            self.assertEqual(unorm16_dds.decompressed_data.dtype, np.uint16)
+            self.assertIs(unorm16_dds.decompressed_data.base.base, unorm16_dds.data.base)
+
+            unorm16_dds.write_to_png(png_fname, bit_depth=16)
+            _, _, rows, info = png.Reader(png_fname).read()
+            self.assertEqual(info['bitdepth'], 16)
+            self.assertEqual(list(rows)[0].tolist(), [0, 1000, 65535, 65535, 300, 0, 0, 32768])
+
+            # Normalized, the highest color value (65535) maps to 255, and the lowest (0) to 0
+            unorm16_dds.write_to_png(png_fname, normalize=True)
+            _, _, rows, _ = png.Reader(png_fname).read()
+            self.assertEqual(list(list(rows)[0]), [0, 4, 255, 255, 1, 0, 0, 128])
+
+        # The view of the mapping is dropped on close(), and decoded again (from a new mapping) when needed
+        self.assertIsNone(unorm16_dds._decompressed_data)
+        self.assertEqual(unorm16_dds.decompressed_data.tolist(), [0, 1000, 65535, 65535, 300, 0, 0, 32768])
+
+    def test_packed_pairs(self):
+        """Decode YUV (YUY2, UYVY) and RGB (R8G8_B8G8, G8R8_G8B8) pixel pairs, and a whole (4x1) YUY2 file."""
+        decoder = PyDDS.uncompressed.UncompressedDecoder()
+
+        # Black, white, then (BT.601 and BT.709) red
+        self.assertEqual(list(decoder.decode_packed_pairs([16, 128, 235, 128], 'D3DFMT_YUY2')),
+                         [0, 0, 0, 255, 255, 255, 255, 255])
+        self.assertEqual(list(decoder.decode_packed_pairs([81, 90, 81, 240], 'D3DFMT_YUY2')[0:4]), [254, 0, 0, 255])
+        self.assertEqual(list(decoder.decode_packed_pairs([102, 63, 240, 63], 'D3DFMT_UYVY', 'bt709')[0:4]),
+                         [255, 1, 0, 255])
+        self.assertRaises(ValueError, decoder.decode_packed_pairs, [0] * 4, 'D3DFMT_UYVY', 'bt2020')
+
+        self.assertEqual(list(decoder.decode_packed_pairs([1, 2, 3, 4], 'DXGI_FORMAT_R8G8_B8G8_UNORM')),
+                         [1, 2, 3, 255, 1, 4, 3, 255])
+        self.assertEqual(list(decoder.decode_packed_pairs([1, 2, 3, 4], 'DXGI_FORMAT_G8R8_G8B8_UNORM')),
+                         [2, 1, 4, 255, 2, 3, 4, 255])
+
+        self.test_dds.dds_header.pixelformat.dwFourCC = PyDDS.dds_header.struct.unpack('<I', 'YUY2')[0]
+        yuy2_dds = PyDDS.PyDDS(self.write_temp_dds(4, 1, [16, 128, 235, 128, 235, 128, 16, 128]))
+        self.assertEqual(list(yuy2_dds.decompressed_data[3::4]), [255] * 4)
+        self.assertEqual(list(yuy2_dds.decompressed_data[0::4]), [0, 255, 255, 0])
+        self.assertEqual(list(yuy2_dds.decompress_region(1, 0, 2, 1)[0, :, 0]), [255, 255])
+
+    def test_bc1_decoders_match(self):
+        """Check the array-based BC1 decoder against the pure-Python one."""
+        comp_data = self.fungus_dds.data
+        decomp_data = self.fungus_dds.block_compression.decompress_bc1(comp_data)
+        self.assertEqual(list(decomp_data),
+                         self.fungus_dds.block_compression.decompress_bc1_python(comp_data))
+
+    def test_color_expansion(self):
+        """Decode BC1 data with bit-replicating expansion and shared palettes, checking both decoders agree."""
+        block_compression = self.fungus_dds.block_compression
+        comp_data = self.fungus_dds.data
+        truncated_data = block_compression.decompress_bc1(comp_data)
+
+        rgb565, third, half = PyDDS.block_compression.get_color_tables('truncate')
+        self.assertEqual(list(rgb565[0xffff]), [248, 252, 248])
+        self.assertEqual((third[255, 0], half[255, 0]), (170, 127))
+        rgb565, third, half = PyDDS.block_compression.get_color_tables('replicate')
+        self.assertEqual(list(rgb565[0xffff]), [255, 255, 255])
+        self.assertEqual(list(rgb565[0x0821]), [8, 4, 8])
+        self.assertEqual((third[255, 0], half[255, 0]), (170, 128))
+        self.assertRaises(ValueError, PyDDS.block_compression.get_color_tables, 'bogus')
+
+        block_compression.color_expansion = 'replicate'
+        replicated_data = block_compression.decompress_bc1(comp_data)
+        self.assertEqual(list(replicated_data), block_compression.decompress_bc1_python(comp_data))
+        self.assertFalse((replicated_data == truncated_data).all())
+
+        block_compression.share_palettes = True
+        self.assertTrue((block_compression.decompress_bc1(comp_data) == replicated_data).all())
+        block_compression.color_expansion = 'truncate'
+        self.assertTrue((block_compression.decompress_bc1(comp_data) == truncated_data).all())
+
+    def test_bc2_bc3_alpha(self):
+        """Decode hand-made BC2 and BC3 blocks, checking the alpha of each pixel."""
+        # A white color block (color_0 == color_1 is still decoded in 4-color mode)
+        color_block = [0xff, 0xff, 0xff, 0xff, 0x00, 0x00, 0x00, 0x00]
+
+        # Explicit alpha: pixel N has an alpha of (N % 16) * 17
+        bc2_block = [0x10, 0x32, 0x54, 0x76, 0x98, 0xba, 0xdc, 0xfe] + color_block
+        decomp_data = self.test_dds.block_compression.decompress_bc2(bc2_block)
+        self.assertEqual(list(decomp_data[3::4]), [i * 17 for i in xrange(16)])
+        self.assertEqual(list(decomp_data[0:3]), [248, 252, 248])
+
+        # Interpolated alpha: 8-alpha mode for the first block, 6-alpha mode for the second.
+        # Pixel N uses alpha index (N % 8).
+        indices = [0x88, 0xc6, 0xfa, 0x88, 0xc6, 0xfa]
+        bc3_data = [255, 0] + indices + color_block + [0, 255] + indices + color_block
+        decomp_data = self.test_dds.block_compression.decompress_bc3(bc3_data)
+        self.assertEqual(list(decomp_data[3:64:4]),
+                         [255, 0, 218, 182, 145, 109, 72, 36] * 2)
+        self.assertEqual(list(decomp_data[67::4]),
+                         [0, 255, 51, 102, 153, 204, 0, 255] * 2)
+
+    def test_bc4_bc5(self):
+        """Decode hand-made BC4 and BC5 blocks, both UNORM and SNORM."""
+        block_compression = self.test_dds.block_compression
+
+        # 6-value mode, with every pixel using index 7 (the maximum value)
+        bc4_block = [10, 20] + [0xff] * 6
+        blocks = block_compression.to_block_array(bc4_block, 8)
+        self.assertEqual(list(block_compression.decompress_bc4_blocks(blocks)[0]), [255] * 16)
+        self.assertEqual(list(block_compression.decompress_bc4_blocks(blocks, signed=True)[0]), [127] * 16)
+        self.assertEqual(list(block_compression.decompress_bc4(bc4_block)), [255] * 64)
+
+        # 8-value mode, every pixel using index 1 (alpha_1), which is -1.0 when signed
+        bc4_block = [0, 0x80] + [0x49, 0x92, 0x24] * 2
+        blocks = block_compression.to_block_array(bc4_block, 8)
+        self.assertEqual(list(block_compression.decompress_bc4_blocks(blocks, signed=True)[0]), [-127] * 16)
+
+        # A flat normal map: X = Y = 0, so Z should be 1
+        bc5_block = [0, 0] + [0] * 6 + [0, 0] + [0] * 6
+        decomp_data = block_compression.decompress_bc5(bc5_block, signed=True, reconstruct_z=True)
+        self.assertEqual(list(decomp_data[0:4]), [128, 128, 255, 255])
+        decomp_data = block_compression.decompress_bc5(bc5_block, signed=True)
+        self.assertEqual(list(decomp_data[0:4]), [128, 128, 0, 255])
+
+    def test_bc7(self):
+        """Check bc7.dds (which has a DXT10 header) decodes as expected."""
+        self.assertEqual(self.bc7_dds.format, 'DXGI_FORMAT_BC7_UNORM')
+        self.assertTrue(self.bc7_dds.dxt10_header.valid)
+
+        # Pixel (30, 30) is pixel 10 of block 119
+        offset = (119 * 16 + 10) * 4
+        self.assertEqual(list(self.bc7_dds.decompressed_data[offset:offset + 4]), [92, 58, 7, 154])
+
+        # An invalid block (no mode bit set) decodes to transparent black
+        decomp_data = self.bc7_dds.block_compression.decompress_bc7([0] * 16)
+        self.assertEqual(list(decomp_data), [0] * 64)
+
+    def test_bc6h(self):
+        """Check bc6h.dds (an HDR gradient) decodes to the expected half floats."""
+        self.assertEqual(self.bc6h_dds.format, 'DXGI_FORMAT_BC6H_UF16')
+        self.assertEqual(self.bc6h_dds.decompressed_data.dtype.name, 'float16')
+
+        # Pixel (63, 63) is the last pixel
+        self.assertEqual(list(self.bc6h_dds.decompressed_data[-4:].view('uint16')),
+                         [0x4363, 0x3fb3, 0x3556, 0x3c00])
+
+        # A reserved mode (0x13) decodes to black
+        decomp_data = self.bc6h_dds.block_compression.decompress_bc6h([0x13] + [0xff] * 15)
+        self.assertEqual(list(decomp_data[0:4]), [0.0, 0.0, 0.0, 1.0])
+
+    def test_tonemap(self):
+        """Tone-map some HDR values with each operator."""
+        hdr_data = PyDDS.tonemap.np.array([0.0, 1.0, 100.0, 0.5, -1.0, 0.0, 0.0, 2.0])
+        self.assertEqual(list(PyDDS.tonemap.tonemap(hdr_data, 'clamp')), [0, 255, 255, 128, 0, 0, 0, 255])
+        self.assertEqual(list(PyDDS.tonemap.tonemap(hdr_data, 'reinhard')), [0, 188, 254, 128, 0, 0, 0, 255])
+        self.assertEqual(list(PyDDS.tonemap.tonemap(hdr_data, 'aces', -1.0)), [0, 206, 255, 128, 0, 0, 0, 255])
+        self.assertRaises(ValueError, PyDDS.tonemap.tonemap, hdr_data, 'bogus')
+
+    def test_mmap(self):
+        """Memory-map fungus.dds, and check it matches the file read the usual way."""
+        with PyDDS.PyDDS('test/fungus.dds', use_mmap=True) as fungus_dds:
+            self.assertEqual(fungus_dds.data_offset, 128)
+            self.assertFalse(fungus_dds.data.flags.writeable)
+            self.assertEqual(fungus_dds.data.tobytes(), self.fungus_dds.data.tobytes())
+            self.assertEqual(list(fungus_dds.decompressed_data), list(self.fungus_dds.decompressed_data))
+            fungus_dds.write('test/fungus_copy.dds')
+
+        self.assertIsNone(fungus_dds.mmap)
+        with open('test/fungus.dds', 'rb') as original, open('test/fungus_copy.dds', 'rb') as copy:
+            self.assertEqual(original.read(), copy.read())
+
+        # Views of the mapping outlive close()
+        with PyDDS.PyDDS('test/fungus.dds', use_mmap=True, lazy=True) as fungus_dds:
+            mip_data = fungus_dds.get_subresource_data(mip=1)
+        self.assertEqual(mip_data.sum(), self.fungus_dds.get_subresource_data(mip=1).sum())
+
+    def test_lazy(self):
+        """Open bc7.dds lazily, and check it's only read and decoded when needed."""
+        bc7_dds = PyDDS.PyDDS('test/bc7.dds', lazy=True)
+        self.assertEqual(bc7_dds.format, 'DXGI_FORMAT_BC7_UNORM')
+        self.assertIsNone(bc7_dds._data)
+        self.assertIsNone(bc7_dds._decompressed_data)
+
+        self.assertEqual(list(bc7_dds.decompressed_data), list(self.bc7_dds.decompressed_data))
+        self.assertTrue(bc7_dds.data_is_decompressed)
+        self.assertIs(bc7_dds.decompressed_data, bc7_dds.decompressed_data)
+
+        bc7_dds.release(include_data=True)
+        self.assertIsNone(bc7_dds._data)
+        self.assertIsNone(bc7_dds._decompressed_data)
+        self.assertEqual(bc7_dds.data.tobytes(), self.bc7_dds.data.tobytes())
+
+    def test_subresources(self):
+        """Check the mip chain of fungus.dds is indexed, and a single mip can be decoded."""
+        subresources = self.fungus_dds.subresources
+        self.assertEqual(len(subresources), 9)
+        self.assertEqual(subresources.size, len(self.fungus_dds.data))
+        self.assertEqual([subresource.size for subresource in subresources],
+                         [32768, 8192, 2048, 512, 128, 32, 8, 8, 8])
+
+        mip = subresources.get(mip=1)
+        self.assertEqual((mip.offset, mip.width, mip.height, mip.row_pitch, mip.row_count), (32768, 128, 128, 256, 32))
+        self.assertEqual(subresources.get(mip=8)[4:8], (8, 1, 1, 1))
+        self.assertRaises(IndexError, subresources.get, 9)
+
+        # Every BC1 block decodes to 16 RGBA pixels
+        decomp_data = self.fungus_dds.decompress_subresource(mip=1)
+        self.assertEqual(list(decomp_data), list(self.fungus_dds.decompressed_data[32768 * 8:(32768 + 8192) * 8]))
+
+    def test_decompress_region(self):
+        """Decompress some (unaligned) rectangles of fungus.dds, and check them against the whole image."""
+        image = self.fungus_dds.untile(self.fungus_dds.decompressed_data, 256, 256)
+        region = self.fungus_dds.decompress_region(5, 7, 30, 9)
+        self.assertEqual(region.shape, (9, 30, 4))
+        self.assertTrue((region == image[7:16, 5:35]).all())
+
+        image = self.fungus_dds.untile(self.fungus_dds.decompress_subresource(mip=1), 128)
+        region = self.fungus_dds.decompress_region(127, 120, 1, 8, mip=1)
+        self.assertTrue((region == image[120:128, 127:128]).all())
+
+        self.assertRaises(ValueError, self.fungus_dds.decompress_region, 0, 0, 129, 1, mip=1)
+
+    def test_pixels(self):
+        """View the pixels of fungus.dds as images, and edit a mip through them."""
+        np = PyDDS.block_compression.np
+        self.assertEqual(self.fungus_dds.data.dtype, np.uint8)
+        self.assertTrue(self.fungus_dds.data.flags.writeable)
+
+        pixels = self.fungus_dds.pixels
+        self.assertEqual(pixels.shape, (256, 256, 4))
+        self.assertTrue((pixels == self.fungus_dds.untile(self.fungus_dds.decompressed_data, 256, 256)).all())
+        exported = np.asarray(self.fungus_dds)
+        self.assertTrue((exported == pixels).all())
+
+        # Invert mip 1, and check the rest of the data is left alone
+        mip0_data = self.fungus_dds.decompressed_data[:262144].copy()
+        image = self.fungus_dds.get_pixels(mip=1)
+        self.fungus_dds.set_pixels(255 - image, mip=1)
+        self.assertTrue((self.fungus_dds.get_pixels(mip=1) == 255 - image).all())
+        self.assertTrue((self.fungus_dds.decompressed_data[:262144] == mip0_data).all())
+
+        # Edits made to pixels are assigned back, and in place edits of decompressed_data show everywhere
+        pixels[..., 3] = 7
+        self.fungus_dds.pixels = pixels
+        self.assertTrue((self.fungus_dds.decompressed_data[3:262144:4] == 7).all())
+        self.fungus_dds.decompressed_data[:] = 0
+        self.assertFalse(self.fungus_dds.pixels.any())
+        temp_dir = tempfile.mkdtemp()
+        try:
+            self.fungus_dds.write_to_png(os.path.join(temp_dir, 'fungus.png'))
+            _, _, rows, _ = png.Reader(os.path.join(temp_dir, 'fungus.png')).read()
+            self.assertFalse(any(any(row) for row in rows))
+        finally:
+            shutil.rmtree(temp_dir)
+
+        # Exported pixels outlive the data they were taken from
+        self.fungus_dds.release()
+        self.assertTrue((exported[..., :3] == pixels[..., :3]).all())
+
+        self.fungus_dds.decompressed_data = list(mip0_data)
+        self.assertEqual(self.fungus_dds.decompressed_data.dtype, np.uint8)
+
+    def test_channel_ops(self):
+        """Edit the channels of every mip of fungus.dds at once, and of some float and byte pixels."""
+        np = PyDDS.block_compression.np
+        original = self.fungus_dds.decompressed_data.copy()
+        pixels = self.fungus_dds.pixels
+
+        self.fungus_dds.remap_channels('bgra')
+        self.assertTrue((self.fungus_dds.decompressed_data[0::4] == original[2::4]).all())
+        self.assertTrue((self.fungus_dds.pixels[..., 0] == self.fungus_dds.get_pixels()[..., 0]).all())
+        self.fungus_dds.remap_channels('BGRA')
+        self.fungus_dds.invert_channels()
+        self.fungus_dds.apply_channel_lut(np.arange(255, -1, -1), 'RGB')
+        self.assertTrue((self.fungus_dds.decompressed_data == original).all())
+        self.assertTrue((pixels == self.fungus_dds.get_pixels()).all())
+
+        self.fungus_dds.remap_channels('RRR1')
+        self.fungus_dds.fill_channels('G', 7)
+        expected = np.repeat(original[0::4], 4).reshape(-1, 4)
+        expected[:, 1], expected[:, 3] = 7, 255
+        self.assertTrue((self.fungus_dds.decompressed_data.reshape(-1, 4) == expected).all())
+
+        data = np.array([[255, 128, 0, 128], [10, 20, 30, 0], [200, 100, 50, 255]], dtype=np.uint8)
+        premultiplied = PyDDS.channels.premultiply(data.copy())
+        self.assertEqual(premultiplied.tolist(), [[128, 64, 0, 128], [0, 0, 0, 0], [200, 100, 50, 255]])
+        self.assertEqual(PyDDS.channels.unpremultiply(premultiplied).tolist(),
+                         [[255, 128, 0, 128], [0, 0, 0, 0], [200, 100, 50, 255]])
+
+        data = np.array([[0.5, 0.25, 1.0, 0.5], [1.0, 1.0, 1.0, 0.0]], dtype=np.float32)
+        self.assertEqual(PyDDS.channels.premultiply(data).tolist(), [[0.25, 0.125, 0.5, 0.5], [0, 0, 0, 0]])
+        self.assertEqual(PyDDS.channels.remap(data, 'A001').tolist(), [[0.5, 0, 0, 1], [0, 0, 0, 1]])
+
+        self.assertRaises(ValueError, self.fungus_dds.remap_channels, 'RGB')
+        self.assertRaises(ValueError, self.fungus_dds.fill_channels, 'X', 0)
+        self.assertRaises(ValueError, self.fungus_dds.apply_channel_lut, range(16))
+
+    def test_parallel_decompress(self):
+        """Decompress in bands, with threads and with processes, and check against the serial result."""
+        for dds in (self.fungus_dds, self.bc7_dds):
+            serial_data = dds.decompressed_data
+            block_size = dds.subresources.layout.bytes_per_block
+            for use_processes in (False, True):
+                # Small bands (7 blocks), which don't line up with the mips
+                decomp_data = PyDDS.parallel.decompress(dds.block_compression, dds.format, dds.data, block_size,
+                                                        7, workers=2, use_processes=use_processes)
+                self.assertEqual(decomp_data.dtype, serial_data.dtype)
+                self.assertTrue((decomp_data == serial_data).all())
+
+        serial_data = self.fungus_dds.decompressed_data
+        self.fungus_dds.decompress(workers=3)
+        self.assertTrue((self.fungus_dds.decompressed_data == serial_data).all())
+
+    def test_bc1_bc3_encoders(self):
+        """Compress a gradient (with a transparent corner) at each quality, and decode it back."""
+        np = PyDDS.block_compression.np
+        block_encoder = PyDDS.BlockEncoder()
+        block_compression = self.test_dds.block_compression
+
+        image = np.zeros((16, 16, 4), dtype=np.uint8)
+        image[..., 0] = np.arange(16)[np.newaxis] * 16
+        image[..., 1] = np.arange(16)[:, np.newaxis] * 8 + 64
+        image[..., 2] = 200
+        image[..., 3] = 255
+        image[0:4, 0:4, 3] = 0
+        blocks = PyDDS.PixelSwizzle.tile(image).astype(int)
+
+        for quality in block_encoder.QUALITIES:
+            comp_data = block_encoder.compress_bc1(image, quality)
+            self.assertEqual(len(comp_data), 16 * 8)
+            decomp_blocks = block_compression.decompress_bc1(comp_data).reshape(-1, 16, 4)
+            self.assertEqual(list(decomp_blocks[0, :, 3]), [0] * 16)
+            self.assertTrue((decomp_blocks[1:, :, 3] == 255).all())
+            self.assertLess(np.abs(decomp_blocks[1:, :, 0:3] - blocks[1:, :, 0:3]).mean(), 8)
+
+            comp_data = block_encoder.compress_bc3(image, quality)
+            self.assertEqual(len(comp_data), 16 * 16)
+            decomp_blocks = block_compression.decompress_bc3(comp_data).reshape(-1, 16, 4)
+            self.assertEqual(list(decomp_blocks[..., 3].ravel()), list(blocks[..., 3].ravel()))
+            self.assertLess(np.abs(decomp_blocks[..., 0:3] - blocks[..., 0:3]).mean(), 8)
+
+        self.assertRaises(ValueError, block_encoder.compress_bc1, image, 'bogus')
+
     def test_write_dds(self):
         """Write the data out to another .dds file."""
         self.test_dds.write('test/Test_copy.dds')
         self.fungus_dds.write('test/fungus_copy.dds')
 
+    def test_write_dds_atomic(self):
+        """Atomically overwrite a copy of fungus.dds while it's memory-mapped."""
+        self.fungus_dds.write('test/fungus_copy.dds')
+        with PyDDS.PyDDS('test/fungus_copy.dds', use_mmap=True) as fungus_dds:
+            fungus_dds.write('test/fungus_copy.dds', atomic=True)
+
+        with open('test/fungus.dds', 'rb') as original, open('test/fungus_copy.dds', 'rb') as copy:
+            self.assertEqual(original.read(), copy.read())
+
+        # The permissions of the file being replaced are kept
+        temp_dir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(temp_dir, 'fungus.dds')
+            self.fungus_dds.write(fname)
+            os.chmod(fname, 0o640)
+            self.fungus_dds.write(fname, atomic=True)
+            self.assertEqual(os.stat(fname).st_mode & 0o7777, 0o640)
+
+            # Writing over the mapped file itself is always done atomically
+            with PyDDS.PyDDS(fname, use_mmap=True) as fungus_dds:
+                fungus_dds.write(fname)
+            with open('test/fungus.dds', 'rb') as original, open(fname, 'rb') as copy:
+                self.assertEqual(original.read(), copy.read())
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_write_test_dds_to_png(self):
         """Write the Test.dds data to a .png."""
         self.test_dds.write_to_png('test/Test.png')
@@ -63,15 +558,109 @@ class TestSimple(unittest.TestCase):
     def test_write_modified_dds_to_png(self):
         """Write a modified Test.dds to a .png."""
         # Swap the second and third component for funsies
-        for index in xrange(1, len(self.test_dds.decompressed_data), 4):
-            orig = self.test_dds.decompressed_data[index]
-            self.test_dds.decompressed_data[index] = self.test_dds.decompressed_data[index + 1]
-            self.test_dds.decompressed_data[index + 1] = orig
+        self.test_dds.remap_channels('RBGA')
         self.test_dds.write_to_png('test/Test_modified.png')
 
     def test_write_fungus_dds_to_png(self):
         """Write fungus.dds data (which contains mipmaps) to a .png."""
         self.fungus_dds.write_to_png('test/fungus.png')
 
+    def test_write_lazy_dds_to_png(self):
+        """Stream a lazily opened fungus.dds to a .png, and check it matches the eagerly decoded one."""
+        self.fungus_dds.write_to_png('test/fungus.png')
+        with open('test/fungus.png', 'rb') as fhandle:
+            expected_png = fhandle.read()
+
+        with PyDDS.PyDDS('test/fungus.dds', use_mmap=True, lazy=True) as fungus_dds:
+            fungus_dds.write_to_png('test/fungus.png')
+            self.assertIsNone(fungus_dds._decompressed_data)
+
+        with open('test/fungus.png', 'rb') as fhandle:
+            self.assertEqual(fhandle.read(), expected_png)
+
+    def test_write_bc6h_dds_to_png(self):
+        """Tone-map bc6h.dds data, and write it to a .png."""
+        self.bc6h_dds.write_to_png('test/bc6h.png', 'aces', exposure=-1.0)
+
+    def test_write_bc7_dds_to_png(self):
+        """Write bc7.dds data to a .png."""
+        self.bc7_dds.write_to_png('test/bc7.png')
+
+    def test_texture_cache(self):
+        """Look up subresources of fungus.dds in a small cache, evicting the least recently used."""
+        # Room for mips 0 and 1 (262144 + 65536 bytes), but not a third subresource as well
+        cache = PyDDS.TextureCache(262144 + 65536 + 4096)
+        decomp_data = cache.get('test/fungus.dds')
+        self.assertEqual(list(decomp_data), list(self.fungus_dds.decompressed_data[0:262144]))
+        self.assertIs(cache.get('test/fungus.dds'), decomp_data)
+        self.assertRaises(ValueError, decomp_data.fill, 0)
+
+        cache.get('test/fungus.dds', mip=1)
+        cache.get('test/fungus.dds')
+        cache.get('test/fungus.dds', mip=2)
+        self.assertEqual(cache.get_stats(), {'hits' : 2, 'misses' : 3, 'evictions' : 1, 'entries' : 2,
+                                             'size' : 262144 + 16384, 'max_bytes' : cache.max_bytes})
+
+        # Mip 1 was the least recently used, so it's gone
+        cache.get('test/fungus.dds', mip=1)
+        self.assertEqual(cache.misses, 4)
+
+    def test_disk_cache(self):
+        """Cache subresources of fungus.dds on disk, and map them back in, evicting the least recently used."""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            # Room for mip 0 (262144 bytes, plus the .npy header), and a little more
+            cache = PyDDS.DiskCache(temp_dir, 262144 + 16384)
+            decomp_data = cache.get('test/fungus.dds')
+            self.assertEqual(list(decomp_data), list(self.fungus_dds.decompressed_data[0:262144]))
+
+            # A copy of the file is a hit, and comes back as a memory map
+            cached_data = cache.get('test/fungus_copy.dds')
+            self.assertIsInstance(cached_data, PyDDS.block_compression.np.memmap)
+            self.assertTrue((cached_data == decomp_data).all())
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            del cached_data
+
+            # Make mip 0 the least recently used, then add two more mips: mip 0 has to go
+            for entry in cache.get_entries():
+                os.utime(entry[2], (0, 0))
+            cache.get('test/fungus.dds', mip=1)
+            cache.get('test/fungus.dds', mip=2)
+            stats = cache.get_stats()
+            self.assertEqual((stats['misses'], stats['evictions'], stats['entries']), (3, 1, 2))
+            self.assertLessEqual(stats['size'], cache.max_bytes)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_batch_convert(self):
+        """Convert a directory (including a bad file) to .png, then skip the up-to-date outputs."""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(temp_dir, 'textures'))
+            shutil.copy('test/fungus.dds', os.path.join(temp_dir, 'textures'))
+            with open(os.path.join(temp_dir, 'bad.dds'), 'wb') as fhandle:
+                fhandle.write('DDS ')
+
+            output_dir = os.path.join(temp_dir, 'output')
+            self.assertEqual(PyDDS.batch.main([temp_dir, '-o', output_dir, '--headers', '-j', '2', '-q']), 1)
+            self.fungus_dds.write_to_png('test/fungus.png')
+            with open('test/fungus.png', 'rb') as expected, \
+                    open(os.path.join(output_dir, 'textures', 'fungus.png'), 'rb') as converted:
+                self.assertEqual(converted.read(), expected.read())
+            self.assertTrue(os.path.isfile(os.path.join(output_dir, 'textures', 'fungus.txt')))
+
+            # With the bad file gone, every output is up to date
+            os.remove(os.path.join(temp_dir, 'bad.dds'))
+            self.assertEqual(PyDDS.batch.main([temp_dir, '-o', output_dir, '-u', '-q']), 0)
+
+            # Files given by name are output by their base name: only the first of two namesakes is converted
+            os.mkdir(os.path.join(temp_dir, 'other'))
+            shutil.copy('test/fungus.dds', os.path.join(temp_dir, 'other'))
+            fnames = [os.path.join(temp_dir, 'textures', 'fungus.dds'), os.path.join(temp_dir, 'other', 'fungus.dds')]
+            self.assertEqual(PyDDS.batch.main(fnames + ['-o', os.path.join(temp_dir, 'flat'), '-q']), 1)
+            self.assertEqual(os.listdir(os.path.join(temp_dir, 'flat')), ['fungus.png'])
+        finally:
+            shutil.rmtree(temp_dir)
+
 if __name__ == '__main__':
     unittest.main()